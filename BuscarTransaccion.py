@@ -1,49 +1,253 @@
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from cache_transacciones import cache_transacciones
+from ConciliacionSV import marcar_conciliadas
+from dialectos import obtener_dialecto
+
+# Tamaño de los bloques de referencias en las consultas IN (...)
+TAMANO_BLOQUE_MATCH = int(os.getenv("SERFINSA_MATCH_TAMANO_BLOQUE", "1000"))
+
+
+# Columnas que el emparejamiento agrega a LiquidacionesSV si no existen
+COLUMNAS_EMPAREJAMIENTO = [
+    ("qpay_transac_id", "VARCHAR(255)"),
+    ("business_id", "VARCHAR(100) NULL"),
+    ("match_metodo", "VARCHAR(20) NULL"),
+    ("match_confianza", "VARCHAR(10) NULL"),
+]
+
+# Orden de los niveles de confianza de un emparejamiento
+NIVELES_CONFIANZA = {"baja": 1, "media": 2, "alta": 3}
+
+
+def asegurar_columnas_transaccion(cursor):
+    """
+    Agrega a LiquidacionesSV las columnas del emparejamiento (qpay_transac_id,
+    business_id, match_metodo, match_confianza) si no existen
+    """
+    dialecto = obtener_dialecto(cursor)
+    existentes = set(dialecto.columnas_tabla(cursor, "LiquidacionesSV"))
+    
+    for columna, definicion in COLUMNAS_EMPAREJAMIENTO:
+        # Solo agregar la columna si no existe
+        if columna not in existentes:
+            dialecto.agregar_columna(cursor, "LiquidacionesSV", columna, definicion)
+            print(f"✅ Columna {columna} agregada a la tabla LiquidacionesSV")
+
+
+def _bloques(valores, tamano):
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio:inicio + tamano]
+
+
+def _en_ventana(trx, fecha_desde, fecha_hasta):
+    if fecha_desde is None or fecha_hasta is None:
+        return True
+    creada = trx.get("created_at")
+    return creada is not None and fecha_desde <= creada < fecha_hasta
+
+
+def _ventana_cubierta(entrada, fecha_desde, fecha_hasta):
+    """
+    Una entrada de caché sirve si se consultó sin ventana o con una ventana que
+    contiene la pedida
+    """
+    if entrada["desde"] is None or entrada["hasta"] is None:
+        return True
+    if fecha_desde is None or fecha_hasta is None:
+        return False
+    return entrada["desde"] <= fecha_desde and entrada["hasta"] >= fecha_hasta
+
+
+def buscar_transacciones_por_campo(cursor, campo, valores, fecha_desde=None, fecha_hasta=None):
+    """
+    Trae en bloque las transacciones cuyo campo (referencs o autorizationCode) está en
+    la lista y construye un índice hash valor -> [transacciones]. Si se indica ventana
+    de fechas, se filtra además por created_at para que la consulta use el rango del
+    índice. Las respuestas (incluidas las vacías) pasan por la caché de transacciones.
+    """
+    if campo not in ("referencs", "autorizationCode"):
+        raise ValueError(f"Campo de búsqueda no soportado: {campo}")
+
+    indice = defaultdict(list)
+    pendientes = []
+    for valor in dict.fromkeys(str(v).strip() for v in valores):
+        encontrado, entrada = cache_transacciones.obtener(
+            (campo, valor), valida=lambda e: _ventana_cubierta(e, fecha_desde, fecha_hasta)
+        )
+        if encontrado:
+            filas = [trx for trx in entrada["filas"] if _en_ventana(trx, fecha_desde, fecha_hasta)]
+            if filas:
+                indice[valor] = filas
+        else:
+            pendientes.append(valor)
+
+    for bloque in _bloques(pendientes, TAMANO_BLOQUE_MATCH):
+        placeholders = ", ".join(["%s"] * len(bloque))
+        query = f"""
+            SELECT transaction_id, orderNumber, referencs, amount, autorizationCode,
+                   status, business_id, created_at
+            FROM transactions
+            WHERE {campo} IN ({placeholders})
+        """
+        params = list(bloque)
+        if fecha_desde is not None and fecha_hasta is not None:
+            query += " AND created_at >= %s AND created_at < %s"
+            params.extend([fecha_desde, fecha_hasta])
+
+        cursor.execute(query, tuple(params))
+        for row in cursor.fetchall():
+            indice[str(row[campo]).strip()].append(row)
+
+    for valor in pendientes:
+        filas = indice.get(valor, [])
+        cache_transacciones.guardar(
+            (campo, valor),
+            {"filas": list(filas), "desde": fecha_desde, "hasta": fecha_hasta},
+            negativo=not filas,
+        )
+
+    return indice
+
+
+def cargar_transacciones_candidatas(cursor, referencias, fecha_desde=None, fecha_hasta=None):
+    """
+    Índice hash referencs -> [transacciones] para las referencias indicadas
+    """
+    return buscar_transacciones_por_campo(cursor, "referencs", referencias, fecha_desde, fecha_hasta)
+
+
+def referencias_repetidas(cursor, referencias):
+    """
+    Referencias (de las indicadas) con más de una transacción en toda la tabla, sin
+    ventana de fechas. Solo cuenta (GROUP BY ... HAVING): no trae las filas.
+    """
+    repetidas = set()
+    for bloque in _bloques(list(dict.fromkeys(str(r).strip() for r in referencias)), TAMANO_BLOQUE_MATCH):
+        placeholders = ", ".join(["%s"] * len(bloque))
+        cursor.execute(f"""
+            SELECT referencs, COUNT(*) AS total
+            FROM transactions
+            WHERE referencs IN ({placeholders})
+            GROUP BY referencs
+            HAVING COUNT(*) > 1
+        """, tuple(bloque))
+        repetidas.update(str(row["referencs"]).strip() for row in cursor.fetchall())
+    return repetidas
+
+
+def limpiar_cache_transacciones():
+    """
+    Vacía la caché de consultas a transactions (por ejemplo, tras una sincronización)
+    """
+    cache_transacciones.limpiar()
+
+
+def estadisticas_cache_transacciones():
+    return cache_transacciones.estadisticas()
+
+
+def emparejar_transacciones(cursor, conn, seq_nums, fecha_desde=None, fecha_hasta=None, margen_dias=None,
+                            cursor_lectura=None):
+    """
+    Empareja en memoria los SEQ_NUM del archivo con transactions.referencs.
+
+    1. Una consulta en bloque acotada a la ventana de fechas del archivo (± margen).
+    2. Los SEQ_NUM que quedaron sin candidato se buscan de nuevo sin ventana, para no
+       perder transacciones con fecha fuera del rango esperado.
+    3. Los SEQ_NUM con un único candidato dentro de la ventana se confirman con un
+       conteo sin ventana: si la referencia tiene otras transacciones fuera de la
+       ventana también es ambigua.
+
+    Las referencias con más de una transacción se reportan como ambiguas y no se
+    asignan (antes el LIMIT 1 elegía una al azar). Los emparejamientos únicos se
+    escriben con un solo executemany.
+
+    Las lecturas de transactions usan cursor_lectura (réplica) si se indica; las
+    escrituras siempre van por cursor (primario).
+
+    Retorna dict con 'encontrados' {seq_num: transacción}, 'ambiguos'
+    {seq_num: [transacciones]} y 'sin_match' [seq_num].
+    """
+    cursor_lectura = cursor_lectura or cursor
+    seq_nums = list(dict.fromkeys(str(seq) for seq in seq_nums if seq is not None))
+    resultado = {"encontrados": {}, "ambiguos": {}, "sin_match": []}
+    if not seq_nums:
+        return resultado
+
+    if margen_dias is None:
+        margen_dias = int(os.getenv("SERFINSA_MATCH_MARGEN_DIAS", "3"))
+
+    usar_ventana = fecha_desde is not None and fecha_hasta is not None
+    if usar_ventana:
+        indice = cargar_transacciones_candidatas(
+            cursor_lectura, seq_nums,
+            fecha_desde - timedelta(days=margen_dias),
+            fecha_hasta + timedelta(days=margen_dias + 1),
+        )
+        pendientes = [seq for seq in seq_nums if seq not in indice]
+        unicos = [seq for seq in seq_nums if len(indice.get(seq, [])) == 1]
+        if pendientes:
+            indice.update(cargar_transacciones_candidatas(cursor_lectura, pendientes))
+        # Un único candidato en la ventana no basta: la referencia puede repetirse fuera
+        repetidas = referencias_repetidas(cursor_lectura, unicos) if unicos else set()
+        if repetidas:
+            indice.update(cargar_transacciones_candidatas(cursor_lectura, list(repetidas)))
+    else:
+        indice = cargar_transacciones_candidatas(cursor_lectura, seq_nums)
+
+    for seq in seq_nums:
+        candidatos = indice.get(seq, [])
+        if len(candidatos) == 1:
+            resultado["encontrados"][seq] = candidatos[0]
+        elif len(candidatos) > 1:
+            resultado["ambiguos"][seq] = candidatos
+        else:
+            resultado["sin_match"].append(seq)
+
+    if resultado["encontrados"]:
+        asegurar_columnas_transaccion(cursor)
+        actualizar_transacciones_en_bloque(cursor, [
+            (seq, trx["transaction_id"], trx.get("business_id"), "referencia", "alta")
+            for seq, trx in resultado["encontrados"].items()
+        ])
+        conn.commit()
+
+    return resultado
+
+
+def actualizar_transacciones_en_bloque(cursor, asignaciones):
+    """
+    Asigna qpay_transac_id, business_id y el método/confianza del emparejamiento a
+    varios SEQ_NUM con un UPDATE en bloque (UPDATE ... JOIN en MySQL; una sola ida y
+    vuelta por bloque en lugar de una por fila).
+    asignaciones: lista de (seq_num, transaction_id, business_id, metodo, confianza)
+    """
+    dialecto = obtener_dialecto(cursor)
+    actualizados = 0
+    for bloque in _bloques(list(asignaciones), TAMANO_BLOQUE_MATCH):
+        actualizados += dialecto.actualizar_desde_filas(
+            cursor, "LiquidacionesSV", ("SEQ_NUM", "seq_num"),
+            ["seq_num", "transaction_id", "business_id", "metodo", "confianza"], bloque,
+            {
+                "qpay_transac_id": "transaction_id", "business_id": "business_id",
+                "match_metodo": "metodo", "match_confianza": "confianza",
+            },
+        )
+        # Mantener al día la tabla de conciliación materializada
+        marcar_conciliadas(cursor, [asignacion[1] for asignacion in bloque])
+    return actualizados
+
+
 def buscar_transaction_id(cursor, conn, seq_num):
 
     try:
-        cursor.execute("""
-            SELECT transaction_id, autorizationCode, business_id
-            FROM transactions
-            WHERE referencs = %s
-            LIMIT 1
-        """, (seq_num,))
-        result = cursor.fetchone()
+        candidatos = buscar_transacciones_por_campo(cursor, "referencs", [seq_num]).get(str(seq_num).strip())
+        result = candidatos[0] if candidatos else None
         if result:
-            # Verificar si la columna qpay_transac_id ya existe
-            cursor.execute("""
-                SELECT COLUMN_NAME 
-                FROM INFORMATION_SCHEMA.COLUMNS 
-                WHERE TABLE_NAME = 'LiquidacionesSV' 
-                AND COLUMN_NAME = 'qpay_transac_id'
-                AND TABLE_SCHEMA = DATABASE()
-            """)
-            
-            column_exists = cursor.fetchone()
-            
-            # Solo agregar la columna si no existe
-            if not column_exists:
-                cursor.execute("""
-                    ALTER TABLE LiquidacionesSV ADD COLUMN qpay_transac_id VARCHAR(255)
-                """)
-                print("✅ Columna qpay_transac_id agregada a la tabla LiquidacionesSV")
-            
-            # Verificar si la columna business_id ya existe
-            cursor.execute("""
-                SELECT COLUMN_NAME 
-                FROM INFORMATION_SCHEMA.COLUMNS 
-                WHERE TABLE_NAME = 'LiquidacionesSV' 
-                AND COLUMN_NAME = 'business_id'
-                AND TABLE_SCHEMA = DATABASE()
-            """)
-            
-            business_id_exists = cursor.fetchone()
-            
-            # Solo agregar la columna si no existe
-            if not business_id_exists:
-                cursor.execute("""
-                    ALTER TABLE LiquidacionesSV ADD COLUMN business_id VARCHAR(100) NULL
-                """)
-                print("✅ Columna business_id agregada a la tabla LiquidacionesSV")
+            asegurar_columnas_transaccion(cursor)
             
             # Actualizar tanto qpay_transac_id como business_id
             cursor.execute("""
@@ -51,6 +255,7 @@ def buscar_transaction_id(cursor, conn, seq_num):
                 SET qpay_transac_id = %s, business_id = %s 
                 WHERE SEQ_NUM = %s
             """, (result["transaction_id"], result.get("business_id"), seq_num))
+            marcar_conciliadas(cursor, [result["transaction_id"]])
             conn.commit()
 
             business_id_info = f", Business ID: {result.get('business_id')}" if result.get("business_id") else ""
@@ -67,13 +272,8 @@ def buscar_por_authorization_code(cursor, conn, auth_code):
     Busca una transacción por su authorization code
     """
     try:
-        cursor.execute("""
-            SELECT transaction_id, orderNumber, referencs, amount, autorizationCode, status
-            FROM transactions
-            WHERE autorizationCode = %s
-            LIMIT 1
-        """, (auth_code,))
-        result = cursor.fetchone()
+        candidatos = buscar_transacciones_por_campo(cursor, "autorizationCode", [auth_code]).get(str(auth_code).strip())
+        result = candidatos[0] if candidatos else None
         if result:
             print(f"Transacción encontrada por Auth Code {auth_code}: {result['transaction_id']} (Order: {result['orderNumber']})")
             return result
@@ -83,3 +283,177 @@ def buscar_por_authorization_code(cursor, conn, auth_code):
     except Exception as e:
         print(f"⚠️ Error buscando por authorization code {auth_code}: {e}")
         return None
+
+
+def _a_decimal(valor):
+    if valor is None:
+        return None
+    try:
+        return Decimal(str(valor))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _a_fecha(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return None
+
+
+def clasificar_candidatos(fila, candidatos, tolerancia_monto, tolerancia_dias):
+    """
+    Elige la transacción de una fila entre las que comparten su código de autorización.
+    Retorna (transacción, confianza) o (None, motivo):
+    - alta: única candidata con monto y fecha dentro de tolerancia
+    - media: única candidata con monto dentro de tolerancia
+    - baja: única candidata con ese código, aunque el monto no coincida
+    """
+    monto = _a_decimal(fila.get("monto"))
+    fecha = _a_fecha(fila.get("fecha"))
+
+    def monto_ok(trx):
+        importe = _a_decimal(trx.get("amount"))
+        return monto is not None and importe is not None and abs(importe - monto) <= tolerancia_monto
+
+    def fecha_ok(trx):
+        creada = _a_fecha(trx.get("created_at"))
+        return fecha is not None and creada is not None and abs((creada - fecha).days) <= tolerancia_dias
+
+    con_monto = [trx for trx in candidatos if monto_ok(trx)]
+    con_monto_y_fecha = [trx for trx in con_monto if fecha_ok(trx)]
+
+    if len(con_monto_y_fecha) == 1:
+        return con_monto_y_fecha[0], "alta"
+    if len(con_monto_y_fecha) > 1:
+        return None, "ambiguo"
+    if len(con_monto) == 1:
+        return con_monto[0], "media"
+    if len(con_monto) > 1:
+        return None, "ambiguo"
+    if len(candidatos) == 1:
+        return candidatos[0], "baja"
+    return None, "ambiguo" if candidatos else "sin_match"
+
+
+def _cargar_por_codigo(cursor, filas, tolerancia_dias):
+    """
+    Índices autorizationCode -> [transacciones] de los códigos de las filas: (con_ventana,
+    sin_ventana). El de las filas con fecha se acota a su ventana (± tolerancia_dias);
+    el de las filas sin fecha no tiene ventana.
+    """
+    con_fecha, sin_fecha = {}, {}
+    for fila in filas:
+        if fila.get("aprobac") in (None, ""):
+            continue
+        fecha = _a_fecha(fila.get("fecha"))
+        codigo = str(fila["aprobac"]).strip()
+        if fecha is None:
+            sin_fecha[codigo] = None
+        else:
+            con_fecha.setdefault(codigo, []).append(fecha)
+
+    con_ventana, sin_ventana = {}, {}
+    if con_fecha:
+        fechas = [fecha for lista in con_fecha.values() for fecha in lista]
+        desde = datetime.combine(min(fechas) - timedelta(days=tolerancia_dias), datetime.min.time())
+        hasta = datetime.combine(max(fechas) + timedelta(days=tolerancia_dias + 1), datetime.min.time())
+        con_ventana = buscar_transacciones_por_campo(cursor, "autorizationCode", list(con_fecha), desde, hasta)
+    if sin_fecha:
+        sin_ventana = buscar_transacciones_por_campo(cursor, "autorizationCode", list(sin_fecha))
+    return con_ventana, sin_ventana
+
+
+def emparejar_por_codigo_autorizacion(cursor, conn, filas, confianza_minima=None,
+                                      tolerancia_monto=None, tolerancia_dias=None, cursor_lectura=None):
+    """
+    Segundo paso de emparejamiento para las filas sin match por SEQ_NUM -> referencs.
+
+    filas: lista de dicts con seq_num, aprobac (APROBAC), monto (MONTO_TRAN) y fecha (FECHA_TRAN).
+
+    Todas las filas se resuelven con pocas consultas de conjunto: una carga en bloque
+    de transactions por autorizationCode, acotada por created_at a las fechas de las
+    filas ± tolerancia_dias (los códigos de autorización se repiten en el histórico), y
+    una consulta para descartar transacciones ya asignadas a otra liquidación. Los
+    códigos de filas sin fecha se buscan sin ventana. La desambiguación por monto y fecha se hace en
+    memoria y cada asignación guarda su nivel de confianza. Solo se escriben las
+    asignaciones con confianza >= confianza_minima. La carga de transactions usa
+    cursor_lectura (réplica) si se indica; la verificación de asignaciones en
+    LiquidacionesSV va por el primario para ver las escrituras de esta misma ejecución.
+
+    Retorna dict con 'encontrados' {seq_num: (transacción, confianza)},
+    'descartados' {seq_num: motivo} y 'sin_match' [seq_num].
+    """
+    if confianza_minima is None:
+        confianza_minima = os.getenv("SERFINSA_MATCH_CONFIANZA_MINIMA", "media")
+    if tolerancia_monto is None:
+        tolerancia_monto = Decimal(os.getenv("SERFINSA_MATCH_TOLERANCIA_MONTO", "0.01"))
+    if tolerancia_dias is None:
+        tolerancia_dias = int(os.getenv("SERFINSA_MATCH_TOLERANCIA_DIAS", "1"))
+
+    resultado = {"encontrados": {}, "descartados": {}, "sin_match": []}
+    filas = [fila for fila in filas if fila.get("seq_num") is not None]
+    codigos = list(dict.fromkeys(
+        str(fila["aprobac"]).strip() for fila in filas if fila.get("aprobac") not in (None, "")
+    ))
+    if not codigos:
+        resultado["sin_match"] = [fila["seq_num"] for fila in filas]
+        return resultado
+
+    asegurar_columnas_transaccion(cursor)
+
+    con_ventana, sin_ventana = _cargar_por_codigo(cursor_lectura or cursor, filas, tolerancia_dias)
+
+    # Descartar transacciones que ya están asignadas a otra liquidación
+    ids_candidatos = list({
+        str(trx["transaction_id"])
+        for indice in (con_ventana, sin_ventana) for lista in indice.values() for trx in lista
+    })
+    asignados = set()
+    for bloque in _bloques(ids_candidatos, TAMANO_BLOQUE_MATCH):
+        placeholders = ", ".join(["%s"] * len(bloque))
+        cursor.execute(f"""
+            SELECT qpay_transac_id FROM LiquidacionesSV
+            WHERE qpay_transac_id IN ({placeholders})
+        """, tuple(bloque))
+        asignados.update(str(row["qpay_transac_id"]) for row in cursor.fetchall())
+
+    elegidos = {}
+    for fila in filas:
+        por_codigo = sin_ventana if _a_fecha(fila.get("fecha")) is None else con_ventana
+        candidatos = [
+            trx for trx in por_codigo.get(str(fila.get("aprobac")).strip(), [])
+            if str(trx["transaction_id"]) not in asignados
+        ]
+        trx, confianza = clasificar_candidatos(fila, candidatos, tolerancia_monto, tolerancia_dias)
+        if trx is None:
+            if confianza == "sin_match":
+                resultado["sin_match"].append(fila["seq_num"])
+            else:
+                resultado["descartados"][fila["seq_num"]] = confianza
+        elif NIVELES_CONFIANZA[confianza] < NIVELES_CONFIANZA.get(confianza_minima, 2):
+            resultado["descartados"][fila["seq_num"]] = f"confianza {confianza}"
+        else:
+            elegidos[fila["seq_num"]] = (trx, confianza)
+
+    # Una misma transacción no puede quedar asignada a dos filas del lote
+    conteo = defaultdict(int)
+    for trx, _ in elegidos.values():
+        conteo[str(trx["transaction_id"])] += 1
+    for seq_num, (trx, confianza) in elegidos.items():
+        if conteo[str(trx["transaction_id"])] > 1:
+            resultado["descartados"][seq_num] = "transacción repetida"
+        else:
+            resultado["encontrados"][seq_num] = (trx, confianza)
+
+    if resultado["encontrados"]:
+        actualizar_transacciones_en_bloque(cursor, [
+            (seq, trx["transaction_id"], trx.get("business_id"), "autorizacion", confianza)
+            for seq, (trx, confianza) in resultado["encontrados"].items()
+        ])
+        conn.commit()
+
+    return resultado
@@ -6,19 +6,55 @@ Busca transacciones donde payment_method_id = 10 que no están en LiquidacionesS
 
 import os
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from conector import create_connection
+from conector import create_connection, create_read_connection, crear_pool_lectura
+from ConciliacionSV import actualizar_conciliacion, obtener_faltantes
 from email_sender import EmailSender
-from logger_config import setup_logger, log_separator
+from digest_notificaciones import digest_activo, encolar, enviar_digest
+from logger_config import setup_logger, log_separator, obtener_run_id
+from perfilado import crear_perfilador, etapa_perfilada
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Consulta base de transacciones faltantes; {filtro_rango} permite acotarla por created_at
+QUERY_FALTANTES = """
+    SELECT 
+        t.transaction_id,
+        t.orderNumber,
+        t.referencs,
+        t.amount,
+        t.autorizationCode,
+        t.currency,
+        t.status,
+        t.created_at,
+        t.updated_at,
+        pg.payment_method_id,
+        pm.name as payment_method_name,
+        t.email,
+        t.bill_to_name
+    FROM transactions t
+    INNER JOIN payment_gateway pg ON t.payment_gateway_id = pg.payment_gateway_id
+    INNER JOIN payment_method pm ON pg.payment_method_id = pm.payment_method_id
+    WHERE pg.payment_method_id = 10
+    AND t.transaction_id NOT IN (
+        SELECT qpay_transac_id 
+        FROM LiquidacionesSV
+        WHERE qpay_transac_id IS NOT NULL
+    )
+    AND t.status = 1
+    {filtro_rango}
+    ORDER BY t.created_at DESC, t.transaction_id DESC
+"""
+
+
 def buscar_transacciones_faltantes():
     """
-    Busca transacciones donde payment_method_id = 10 que no están en LiquidacionesSV
+    Busca transacciones donde payment_method_id = 10 que no están en LiquidacionesSV.
+    Es una consulta de solo lectura: se ejecuta en la réplica si está disponible.
     """
-    conn = create_connection()
+    conn = create_read_connection()
     if not conn:
         print("❌ No se pudo conectar a la base de datos.")
         return None, None
@@ -26,36 +62,7 @@ def buscar_transacciones_faltantes():
     cursor = conn.cursor(dictionary=True)
     
     try:
-        # Consulta SQL para buscar transacciones faltantes
-        query = """
-        SELECT 
-            t.transaction_id,
-            t.orderNumber,
-            t.referencs,
-            t.amount,
-            t.autorizationCode,
-            t.currency,
-            t.status,
-            t.created_at,
-            t.updated_at,
-            pg.payment_method_id,
-            pm.name as payment_method_name,
-            t.email,
-            t.bill_to_name
-        FROM transactions t
-        INNER JOIN payment_gateway pg ON t.payment_gateway_id = pg.payment_gateway_id
-        INNER JOIN payment_method pm ON pg.payment_method_id = pm.payment_method_id
-        WHERE pg.payment_method_id = 10
-        AND t.transaction_id NOT IN (
-            SELECT qpay_transac_id 
-            FROM LiquidacionesSV
-            WHERE qpay_transac_id IS NOT NULL
-        )
-        AND t.status = 1
-        ORDER BY t.created_at DESC
-        """
-        
-        cursor.execute(query)
+        cursor.execute(QUERY_FALTANTES.format(filtro_rango=""))
         transacciones_faltantes = cursor.fetchall()
         
         print(f"🔍 Consulta ejecutada exitosamente")
@@ -68,6 +75,140 @@ def buscar_transacciones_faltantes():
         conn.close()
         return None, None
 
+def calcular_rangos_fecha(cursor, filas_por_rango):
+    """
+    Divide el historial en rangos contiguos [desde, hasta) de created_at con
+    aproximadamente filas_por_rango candidatas cada uno, según la densidad diaria de
+    transacciones. El rango más antiguo no tiene límite inferior y el más reciente no
+    tiene límite superior (None), así no se pierde ninguna fila. Se devuelven del más
+    reciente al más antiguo como (desde, hasta, solo_nulos); el último elemento cubre
+    las transacciones sin created_at.
+    """
+    cursor.execute("""
+        SELECT DATE(t.created_at) as dia, COUNT(*) as total
+        FROM transactions t
+        INNER JOIN payment_gateway pg ON t.payment_gateway_id = pg.payment_gateway_id
+        WHERE pg.payment_method_id = 10
+        AND t.status = 1
+        AND t.created_at IS NOT NULL
+        GROUP BY DATE(t.created_at)
+        ORDER BY dia
+    """)
+    dias = cursor.fetchall()
+
+    # Días en los que empieza un nuevo rango (el primero no se usa como límite)
+    cortes = []
+    acumulado = 0
+    for fila in dias:
+        dia = fila['dia']
+        if isinstance(dia, str):
+            dia = datetime.strptime(dia, '%Y-%m-%d').date()
+        if acumulado >= filas_por_rango:
+            cortes.append(dia)
+            acumulado = 0
+        acumulado += int(fila['total'])
+
+    limites = [None] + cortes + [None]
+    rangos = [(limites[i], limites[i + 1], False) for i in range(len(limites) - 1)]
+
+    rangos.reverse()
+    rangos.append((None, None, True))
+    return rangos
+
+def _consultar_rango(pool, desde, hasta, solo_nulos):
+    conn = pool.get_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        condiciones = []
+        params = []
+        if solo_nulos:
+            condiciones.append("AND t.created_at IS NULL")
+        else:
+            condiciones.append("AND t.created_at IS NOT NULL")
+            if desde is not None:
+                condiciones.append("AND t.created_at >= %s")
+                params.append(desde)
+            if hasta is not None:
+                condiciones.append("AND t.created_at < %s")
+                params.append(hasta)
+        cursor.execute(QUERY_FALTANTES.format(filtro_rango=" ".join(condiciones)), tuple(params))
+        filas = cursor.fetchall()
+        cursor.close()
+        return filas
+    finally:
+        # Devuelve la conexión al pool
+        conn.close()
+
+def buscar_transacciones_faltantes_paralelo(workers, filas_por_rango=None):
+    """
+    Igual que buscar_transacciones_faltantes, pero divide la búsqueda en rangos de
+    created_at que se consultan a la vez en conexiones separadas de un pool.
+    Los rangos son disjuntos y se consultan ya ordenados, así que concatenarlos del más
+    reciente al más antiguo da exactamente el mismo orden que la consulta única.
+    Retorna (transacciones_faltantes, None)
+    """
+    if filas_por_rango is None:
+        filas_por_rango = int(os.getenv("SERFINSA_CONCILIACION_FILAS_POR_RANGO", "50000"))
+
+    pool = crear_pool_lectura(workers, nombre="serfinsa_conciliacion")
+    if not pool:
+        print("❌ No se pudo crear el pool de conexiones; se usa la consulta única.")
+        return buscar_transacciones_faltantes()
+
+    try:
+        conn = pool.get_connection()
+        try:
+            rangos = calcular_rangos_fecha(conn.cursor(dictionary=True), filas_por_rango)
+        finally:
+            conn.close()
+
+        print(f"🔀 Búsqueda dividida en {len(rangos)} rangos de fecha con {workers} conexiones")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futuros = [executor.submit(_consultar_rango, pool, *rango) for rango in rangos]
+            resultados = [futuro.result() for futuro in futuros]
+
+        transacciones_faltantes = [fila for filas in resultados for fila in filas]
+
+        print(f"🔍 Consulta ejecutada exitosamente")
+        print(f"📊 Se encontraron {len(transacciones_faltantes)} transacciones faltantes")
+        return transacciones_faltantes, None
+
+    except Exception as e:
+        print(f"❌ Error ejecutando consulta en paralelo: {e}")
+        return None, None
+
+def buscar_transacciones_faltantes_materializada(logger, dias_minimos=None):
+    """
+    Actualiza de forma incremental la tabla Conciliacion_sv y lee de ella las
+    transacciones faltantes (lectura indexada en lugar de recalcular el anti-join).
+    Retorna (transacciones_faltantes, conn)
+    """
+    if dias_minimos is None:
+        dias_minimos = int(os.getenv("SERFINSA_CONCILIACION_DIAS_MINIMOS", "0"))
+
+    # La actualización escribe, así que usa el primario
+    conn = create_connection()
+    if not conn:
+        print("❌ No se pudo conectar a la base de datos.")
+        return None, None
+
+    cursor = conn.cursor(dictionary=True)
+    nuevas, _ = actualizar_conciliacion(cursor, conn, logger)
+    if nuevas is None:
+        conn.close()
+        return None, None
+
+    try:
+        transacciones_faltantes = obtener_faltantes(cursor, dias_minimos)
+        filtro = f" con más de {dias_minimos} días" if dias_minimos else ""
+        print(f"📊 Se encontraron {len(transacciones_faltantes)} transacciones faltantes{filtro}")
+        return transacciones_faltantes, conn
+    except Exception as e:
+        print(f"❌ Error leyendo la tabla de conciliación: {e}")
+        conn.close()
+        return None, None
+
 def generar_reporte_excel(transacciones_faltantes, archivo_salida):
     """
     Genera un reporte Excel con las transacciones faltantes
@@ -135,6 +276,20 @@ def enviar_reporte_email(transacciones_faltantes, archivo_excel, logger):
         logger.warning("⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
         return False
     
+    if digest_activo():
+        # Se envía junto con los resúmenes de los archivos (ver digest_notificaciones)
+        try:
+            encolar(
+                "conciliacion", "transacciones_faltantes", {"faltantes": len(transacciones_faltantes)},
+                [archivo_excel], run_id=obtener_run_id(logger),
+            )
+            logger.info("📥 Reporte agregado a la cola de notificaciones agrupadas")
+            enviar_digest(logger)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error agregando el reporte a la cola de notificaciones: {e}")
+            return False
+    
     try:
         email_sender = EmailSender()
         
@@ -206,10 +361,13 @@ def enviar_reporte_email(transacciones_faltantes, archivo_excel, logger):
         logger.error(f"❌ Error preparando email de reporte: {e}")
         return False
 
-def main():
+def main(materializada=None, dias_minimos=None):
     """
-    Función principal para buscar transacciones faltantes
+    Función principal para buscar transacciones faltantes.
+    materializada: usar la tabla Conciliacion_sv (por defecto SERFINSA_CONCILIACION_MATERIALIZADA)
     """
+    if materializada is None:
+        materializada = os.getenv("SERFINSA_CONCILIACION_MATERIALIZADA", "0") == "1"
     start_time = datetime.now()
     print(f"🚀 Iniciando búsqueda de transacciones faltantes - {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
     
@@ -221,9 +379,19 @@ def main():
     logger.info(f"📝 Archivo de log: {log_file_path}")
     log_separator(logger)
     
+    # Con SERFINSA_PROFILE=1 cada etapa se perfila (archivos junto al log)
+    perfilador = crear_perfilador(log_file_path, obtener_run_id(logger))
+    
     # Buscar transacciones faltantes
     logger.info("🔍 Buscando transacciones con payment_method_id = 10...")
-    transacciones_faltantes, conn = buscar_transacciones_faltantes()
+    workers = int(os.getenv("SERFINSA_CONCILIACION_WORKERS", "1"))
+    with etapa_perfilada(perfilador, "busqueda"):
+        if materializada:
+            transacciones_faltantes, conn = buscar_transacciones_faltantes_materializada(logger, dias_minimos)
+        elif workers > 1:
+            transacciones_faltantes, conn = buscar_transacciones_faltantes_paralelo(workers)
+        else:
+            transacciones_faltantes, conn = buscar_transacciones_faltantes()
     
     if conn:
         conn.close()
@@ -231,6 +399,8 @@ def main():
     
     if transacciones_faltantes is None:
         logger.error("❌ Error en la búsqueda de transacciones")
+        if perfilador:
+            perfilador.finalizar()
         return
     
     # Generar reporte Excel
@@ -238,12 +408,14 @@ def main():
     archivo_reporte = f"logs/transacciones_faltantes_{timestamp}.xlsx"
     
     logger.info(f"📊 Generando reporte Excel...")
-    archivo_generado = generar_reporte_excel(transacciones_faltantes, archivo_reporte)
+    with etapa_perfilada(perfilador, "reporte"):
+        archivo_generado = generar_reporte_excel(transacciones_faltantes, archivo_reporte)
     
     # Enviar email con reporte
     if len(transacciones_faltantes) > 0:
         logger.info("📧 Enviando reporte por email...")
-        enviar_reporte_email(transacciones_faltantes, archivo_generado, logger)
+        with etapa_perfilada(perfilador, "notificacion"):
+            enviar_reporte_email(transacciones_faltantes, archivo_generado, logger)
     else:
         logger.info("✅ No se encontraron transacciones faltantes")
     
@@ -256,6 +428,8 @@ def main():
     logger.info(f"✅ Transacciones encontradas: {len(transacciones_faltantes)}")
     logger.info(f"⏱️ Tiempo de procesamiento: {processing_time:.2f} segundos")
     logger.info(f"📄 Archivo de reporte: {archivo_generado if archivo_generado else 'No generado'}")
+    if perfilador:
+        logger.info(f"🔬 Perfil de la ejecución: {perfilador.finalizar()}")
     log_separator(logger, "=" * 60)
     
     print(f"🏁 Procesamiento completado - {len(transacciones_faltantes)} transacciones encontradas")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Tabla de conciliación materializada (Conciliacion_sv).
+
+Guarda el estado de cada transacción candidata (payment_method_id = 10, status = 1):
+'faltante' mientras no exista en LiquidacionesSV y 'conciliado' cuando se le asigna un
+qpay_transac_id. Se mantiene de forma incremental:
+- actualizar_conciliacion agrega las transacciones creadas o modificadas desde la
+  ejecución anterior (marca guardada en Conciliacion_sv_control, con un solape
+  configurable), las que no tienen fechas, y concilia las faltantes que ya aparecen
+  en LiquidacionesSV. Cada SERFINSA_CONCILIACION_COMPLETA_HORAS (24 por defecto)
+  recorre todas las candidatas, por si alguna quedó fuera de la marca.
+- marcar_conciliadas se llama desde el emparejamiento al asignar qpay_transac_id.
+
+Así el reporte de faltantes es una lectura indexada por (estado, created_at) y la
+antigüedad se obtiene sin recalcular nada.
+"""
+
+import os
+from datetime import timedelta
+
+from dotenv import load_dotenv
+
+from dialectos import obtener_dialecto
+
+load_dotenv()
+
+TAMANO_BLOQUE = 1000
+
+# Evita consultar INFORMATION_SCHEMA en cada asignación; se vuelve a verificar si una
+# consulta sobre la tabla falla
+_tabla_verificada = {"existe": None}
+
+# Claves de Conciliacion_sv_control
+MARCA_INCREMENTAL = "incremental"
+MARCA_COMPLETA = "completa"
+
+
+def asegurar_tabla_conciliacion(cursor, conn, logger=None):
+    """
+    Crea Conciliacion_sv y el índice de LiquidacionesSV.qpay_transac_id si no existen
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `Conciliacion_sv` (
+            `transaction_id` VARCHAR(255) NOT NULL,
+            `created_at` DATETIME NULL,
+            `estado` ENUM('faltante','conciliado') NOT NULL DEFAULT 'faltante',
+            `detectado_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+            `conciliado_at` DATETIME NULL,
+            `updated_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`transaction_id`),
+            INDEX `idx_conciliacion_estado_created` (`estado`, `created_at`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+    # Inicio de la última actualización incremental y de la última completa
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `Conciliacion_sv_control` (
+            `clave` VARCHAR(50) NOT NULL,
+            `valor` DATETIME NULL,
+            PRIMARY KEY (`clave`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+    # El anti-join contra LiquidacionesSV necesita índice en qpay_transac_id
+    cursor.execute("""
+        SELECT INDEX_NAME
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'LiquidacionesSV'
+        AND COLUMN_NAME = 'qpay_transac_id'
+        LIMIT 1
+    """)
+    if not cursor.fetchone():
+        cursor.execute("""
+            ALTER TABLE LiquidacionesSV ADD INDEX idx_liquidaciones_qpay_transac_id (qpay_transac_id)
+        """)
+        if logger:
+            logger.info("✅ Índice idx_liquidaciones_qpay_transac_id agregado a LiquidacionesSV")
+
+    conn.commit()
+    _tabla_verificada["existe"] = True
+
+
+def _tabla_conciliacion_existe(cursor):
+    if _tabla_verificada["existe"] is None:
+        _tabla_verificada["existe"] = obtener_dialecto(cursor).existe_tabla(cursor, "Conciliacion_sv")
+    return _tabla_verificada["existe"]
+
+
+def marcar_conciliadas(cursor, transaction_ids):
+    """
+    Marca como conciliadas las transacciones a las que se asignó qpay_transac_id.
+    No hace nada si la tabla de conciliación aún no existe (o ya no existe: si el
+    UPDATE falla se vuelve a verificar la tabla en lugar de confiar en la caché).
+    """
+    transaction_ids = [str(t) for t in dict.fromkeys(transaction_ids) if t is not None]
+    if not transaction_ids or not _tabla_conciliacion_existe(cursor):
+        return 0
+
+    actualizadas = 0
+    for inicio in range(0, len(transaction_ids), TAMANO_BLOQUE):
+        bloque = transaction_ids[inicio:inicio + TAMANO_BLOQUE]
+        placeholders = ", ".join(["%s"] * len(bloque))
+        try:
+            cursor.execute(f"""
+                UPDATE Conciliacion_sv
+                SET estado = 'conciliado', conciliado_at = NOW()
+                WHERE transaction_id IN ({placeholders})
+                AND estado = 'faltante'
+            """, tuple(bloque))
+        except Exception:
+            _tabla_verificada["existe"] = None
+            if not _tabla_conciliacion_existe(cursor):
+                return actualizadas
+            raise
+        actualizadas += cursor.rowcount
+    return actualizadas
+
+
+def _leer_marcas(cursor):
+    cursor.execute("SELECT clave, valor FROM Conciliacion_sv_control")
+    return {fila["clave"]: fila["valor"] for fila in cursor.fetchall()}
+
+
+def _guardar_marca(cursor, clave, valor):
+    cursor.execute("""
+        INSERT INTO Conciliacion_sv_control (clave, valor) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE valor = VALUES(valor)
+    """, (clave, valor))
+
+
+def actualizar_conciliacion(cursor, conn, logger, reconstruir=False):
+    """
+    Actualiza la tabla de conciliación de forma incremental: transacciones con
+    created_at o updated_at posterior a la ejecución anterior (menos el solape) o sin
+    ninguna de las dos fechas. Si la última pasada completa es más antigua que
+    SERFINSA_CONCILIACION_COMPLETA_HORAS, o reconstruir=True, recorre todas.
+    Retorna (nuevas, conciliadas) o (None, None) si hubo un error.
+    """
+    solape_horas = int(os.getenv("SERFINSA_CONCILIACION_SOLAPE_HORAS", "48"))
+    completa_horas = int(os.getenv("SERFINSA_CONCILIACION_COMPLETA_HORAS", "24"))
+
+    try:
+        asegurar_tabla_conciliacion(cursor, conn, logger)
+
+        if reconstruir:
+            cursor.execute("DELETE FROM Conciliacion_sv")
+            logger.info("🧹 Tabla Conciliacion_sv vaciada para reconstrucción completa")
+
+        cursor.execute("SELECT NOW() as ahora")
+        ahora = cursor.fetchone()["ahora"]
+        marcas = _leer_marcas(cursor)
+        ultima = marcas.get(MARCA_INCREMENTAL)
+        ultima_completa = marcas.get(MARCA_COMPLETA)
+        completa = (
+            reconstruir
+            or ultima is None
+            or ultima_completa is None
+            or ahora - ultima_completa >= timedelta(hours=completa_horas)
+        )
+
+        # Transacciones creadas o modificadas desde la ejecución anterior (el solape
+        # cubre transacciones confirmadas tarde); las que pasan a status = 1 después
+        # de creadas entran por updated_at y las que no tienen fechas, siempre
+        filtro = ""
+        params = ()
+        if not completa:
+            filtro = """AND (
+                t.created_at >= %s - INTERVAL %s HOUR
+                OR t.updated_at >= %s - INTERVAL %s HOUR
+                OR (t.created_at IS NULL AND t.updated_at IS NULL)
+            )"""
+            params = (ultima, solape_horas, ultima, solape_horas)
+
+        cursor.execute(f"""
+            INSERT IGNORE INTO Conciliacion_sv (transaction_id, created_at, estado, conciliado_at)
+            SELECT
+                t.transaction_id,
+                t.created_at,
+                IF(l.qpay_transac_id IS NULL, 'faltante', 'conciliado'),
+                IF(l.qpay_transac_id IS NULL, NULL, NOW())
+            FROM transactions t
+            INNER JOIN payment_gateway pg ON t.payment_gateway_id = pg.payment_gateway_id
+            LEFT JOIN (
+                SELECT DISTINCT qpay_transac_id FROM LiquidacionesSV WHERE qpay_transac_id IS NOT NULL
+            ) l ON l.qpay_transac_id = t.transaction_id
+            WHERE pg.payment_method_id = 10
+            AND t.status = 1
+            {filtro}
+        """, params)
+        nuevas = cursor.rowcount
+
+        # Faltantes que ya fueron conciliadas por otra vía (reintentos, carga manual, ...)
+        cursor.execute("""
+            UPDATE Conciliacion_sv c
+            INNER JOIN LiquidacionesSV l ON l.qpay_transac_id = c.transaction_id
+            SET c.estado = 'conciliado', c.conciliado_at = NOW()
+            WHERE c.estado = 'faltante'
+        """)
+        conciliadas = cursor.rowcount
+
+        _guardar_marca(cursor, MARCA_INCREMENTAL, ahora)
+        if completa:
+            _guardar_marca(cursor, MARCA_COMPLETA, ahora)
+
+        conn.commit()
+        tipo = "completa" if completa else "incremental"
+        logger.info(f"📒 Conciliación {tipo} actualizada: {nuevas} transacciones nuevas, {conciliadas} conciliadas")
+        return nuevas, conciliadas
+
+    except Exception as e:
+        conn.rollback()
+        _tabla_verificada["existe"] = None
+        logger.error(f"❌ Error actualizando la tabla de conciliación: {e}")
+        return None, None
+
+
+def obtener_faltantes(cursor, dias_minimos=None):
+    """
+    Transacciones en estado 'faltante' (opcionalmente con más de dias_minimos días de
+    antigüedad), con las mismas columnas que la consulta directa más dias_faltante.
+    """
+    filtro = ""
+    params = ()
+    if dias_minimos:
+        filtro = "AND c.created_at < NOW() - INTERVAL %s DAY"
+        params = (int(dias_minimos),)
+
+    cursor.execute(f"""
+        SELECT
+            t.transaction_id,
+            t.orderNumber,
+            t.referencs,
+            t.amount,
+            t.autorizationCode,
+            t.currency,
+            t.status,
+            t.created_at,
+            t.updated_at,
+            pg.payment_method_id,
+            pm.name as payment_method_name,
+            t.email,
+            t.bill_to_name,
+            DATEDIFF(NOW(), c.created_at) as dias_faltante
+        FROM Conciliacion_sv c
+        INNER JOIN transactions t ON t.transaction_id = c.transaction_id
+        INNER JOIN payment_gateway pg ON t.payment_gateway_id = pg.payment_gateway_id
+        INNER JOIN payment_method pm ON pg.payment_method_id = pm.payment_method_id
+        WHERE c.estado = 'faltante'
+        AND pg.payment_method_id = 10
+        AND t.status = 1
+        {filtro}
+        ORDER BY c.created_at DESC, c.transaction_id DESC
+    """, params)
+    return cursor.fetchall()
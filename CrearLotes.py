@@ -3,8 +3,91 @@
 Módulo para crear lotes en Lote_sv_business agrupados por business_id
 """
 
-from datetime import datetime
-from decimal import Decimal
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from dialectos import obtener_dialecto
+from fecha_hora_transaccion import COLUMNA_FECHA_HORA, interpretar_fechas, rellenar_fecha_hora
+from unidad_trabajo import como_unidad_de_trabajo
+
+
+# Columna de LiquidacionesSV -> columna de totales en Lote_sv_business
+COLUMNAS_TOTALES_LOTE = [
+    ("MONTO_TRAN", "total_monto_tran"),
+    ("MONTO_AJUS", "total_monto_ajus"),
+    ("MONTO_TEXE", "total_monto_texe"),
+    ("SUBTOTAL", "total_subtotal"),
+    ("MONTO_IVA", "total_monto_iva"),
+    ("COMISIONAB", "total_comisionab"),
+    ("COM_MONTO", "total_com_monto"),
+    ("COM_MTOIVA", "total_com_mtoiva"),
+    ("RETENCION2", "total_retencion2"),
+    ("RETENIDO", "total_retenido"),
+    ("MONTO_DEBI", "total_monto_debi"),
+    ("DEPOSITO", "total_deposito"),
+]
+
+# Los montos se agregan como enteros en centavos para que la suma sea exacta
+CENTAVOS = 100
+# Mayor monto (en valor absoluto) que cabe en DECIMAL(20,2) al convertir a centavos
+LIMITE_MONTO_CENTAVOS = 10 ** 17
+TAMANO_BLOQUE_LOTES = 500
+
+# Segundos de espera por el bloqueo de un grupo (fecha_lote, business_id) tomado por otra ejecución
+TIMEOUT_BLOQUEO_LOTE = int(os.getenv("SERFINSA_LOTES_TIMEOUT_BLOQUEO", "30"))
+
+
+def _nombre_bloqueo_lote(fecha_lote, business_id):
+    # GET_LOCK admite nombres de hasta 64 caracteres; business_id puede medir 100
+    clave = hashlib.sha1(f"{fecha_lote}|{business_id}".encode("utf-8")).hexdigest()
+    return f"serfinsa_lote_{clave}"
+
+
+def ordenar_por_bloqueo(grupos):
+    """
+    Grupos en el orden canónico de sus bloqueos (nombre del bloqueo). Toda sesión que
+    tome varios bloqueos de lote los toma en este orden, uno tras otro o todos juntos:
+    así ninguna espera un bloqueo menor que uno que ya tiene y dos ejecuciones (en serie,
+    en paralelo o en memoria) no pueden esperarse mutuamente.
+    """
+    return sorted(grupos, key=lambda g: _nombre_bloqueo_lote(g['fecha_lote'], g['business_id']))
+
+
+def adquirir_bloqueos_lote(cursor, claves, timeout=None):
+    """
+    Toma un bloqueo con nombre (GET_LOCK) por cada (fecha_lote, business_id) para que dos
+    ejecuciones no creen ni asignen el mismo lote a la vez. Se adquieren en el orden
+    canónico (ver ordenar_por_bloqueo); quien llame varias veces en la misma sesión debe
+    recorrer sus grupos en ese mismo orden.
+    Retorna la lista de nombres adquiridos; lanza RuntimeError si se agota la espera
+    (los ya adquiridos se liberan).
+    """
+    timeout = TIMEOUT_BLOQUEO_LOTE if timeout is None else timeout
+    nombres = sorted({_nombre_bloqueo_lote(fecha_lote, business_id) for fecha_lote, business_id in claves})
+    dialecto = obtener_dialecto(cursor)
+    adquiridos = []
+    for nombre in nombres:
+        if not dialecto.adquirir_bloqueo(cursor, nombre, timeout):
+            liberar_bloqueos_lote(cursor, adquiridos)
+            raise RuntimeError(f"No se obtuvo el bloqueo {nombre} en {timeout}s (otra ejecución está creando el lote)")
+        adquiridos.append(nombre)
+    return adquiridos
+
+
+def liberar_bloqueos_lote(cursor, nombres):
+    """
+    Libera los bloqueos tomados con adquirir_bloqueos_lote. Debe llamarse después del
+    commit para que la otra ejecución vea los lotes y lote_id ya confirmados.
+    """
+    for nombre in reversed(nombres):
+        try:
+            obtener_dialecto(cursor).liberar_bloqueo(cursor, nombre)
+        except Exception:
+            # La sesión cerrada libera igualmente sus bloqueos
+            pass
+    del nombres[:]
 
 
 def verificar_y_agregar_columna_lote_id(cursor, conn, logger):
@@ -12,22 +95,14 @@ def verificar_y_agregar_columna_lote_id(cursor, conn, logger):
     Verifica si la columna lote_id existe en LiquidacionesSV y la agrega si no existe
     """
     try:
-        cursor.execute("""
-            SELECT COLUMN_NAME 
-            FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_NAME = 'LiquidacionesSV' 
-            AND COLUMN_NAME = 'lote_id'
-            AND TABLE_SCHEMA = DATABASE()
-        """)
-        
-        column_exists = cursor.fetchone()
+        dialecto = obtener_dialecto(cursor)
+        column_exists = "lote_id" in dialecto.columnas_tabla(cursor, "LiquidacionesSV")
         
         if not column_exists:
-            cursor.execute("""
-                ALTER TABLE LiquidacionesSV 
-                ADD COLUMN lote_id BIGINT NULL AFTER business_id,
-                ADD INDEX idx_liquidaciones_lote_id (lote_id)
-            """)
+            dialecto.agregar_columna(
+                cursor, "LiquidacionesSV", "lote_id", "BIGINT NULL",
+                despues="business_id", indice="idx_liquidaciones_lote_id"
+            )
             conn.commit()
             logger.info("✅ Columna lote_id agregada a la tabla LiquidacionesSV")
             return True
@@ -40,22 +115,15 @@ def verificar_y_agregar_columna_lote_id(cursor, conn, logger):
         return False
 
 
-def obtener_o_crear_lote_sv_padre(cursor, conn, fecha_lote, business_id, logger):
+def asegurar_tabla_lote_sv(cursor, conn, logger):
     """
-    Obtiene o crea un registro en Lote_sv (tabla padre) para la fecha y business_id especificados.
-    Retorna el id del lote padre. Si la tabla tiene columna business_id (NOT NULL), se envía
-    para cumplir con el esquema y evitar error 1364.
+    Crea la tabla Lote_sv si no existe e indica si tiene columna business_id
+    (esquema de producción). Retorna True/False, o None si hubo un error.
     """
     try:
+        dialecto = obtener_dialecto(cursor)
         # Primero verificar si existe la tabla Lote_sv
-        cursor.execute("""
-            SELECT TABLE_NAME 
-            FROM INFORMATION_SCHEMA.TABLES 
-            WHERE TABLE_SCHEMA = DATABASE() 
-            AND TABLE_NAME = 'Lote_sv'
-        """)
-        
-        table_exists = cursor.fetchone()
+        table_exists = dialecto.existe_tabla(cursor, "Lote_sv")
         
         if not table_exists:
             logger.warning("⚠️ La tabla Lote_sv no existe. Se creará automáticamente.")
@@ -81,30 +149,45 @@ def obtener_o_crear_lote_sv_padre(cursor, conn, fecha_lote, business_id, logger)
             logger.info("✅ Tabla Lote_sv creada")
         
         # Verificar si la tabla tiene columna business_id (esquema de producción)
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Lote_sv' AND COLUMN_NAME = 'business_id'
-        """)
-        tiene_business_id = cursor.fetchone() is not None
+        return "business_id" in dialecto.columnas_tabla(cursor, "Lote_sv")
+
+    except Exception as e:
+        logger.error(f"❌ Error verificando la tabla Lote_sv: {e}")
+        return None
+
+
+def obtener_o_crear_lote_sv_padre(cursor, conn, fecha_lote, business_id, logger, tiene_business_id=None):
+    """
+    Obtiene o crea un registro en Lote_sv (tabla padre) para la fecha y business_id especificados.
+    Retorna el id del lote padre. Si la tabla tiene columna business_id (NOT NULL), se envía
+    para cumplir con el esquema y evitar error 1364.
+    tiene_business_id puede venir ya calculado con asegurar_tabla_lote_sv para no repetir
+    la consulta a INFORMATION_SCHEMA en cada grupo.
+    """
+    try:
+        if tiene_business_id is None:
+            tiene_business_id = asegurar_tabla_lote_sv(cursor, conn, logger)
+            if tiene_business_id is None:
+                return None
 
+        dialecto = obtener_dialecto(cursor)
         if tiene_business_id:
-            # Esquema con business_id: un lote padre por (fecha, business_id)
-            cursor.execute("""
-                SELECT id FROM Lote_sv WHERE fecha_lote = %s AND business_id = %s LIMIT 1
-            """, (fecha_lote, business_id))
-            lote_existente = cursor.fetchone()
-            if lote_existente:
-                logger.info(f"ℹ️ Lote_sv padre ya existe para fecha {fecha_lote} y business_id {business_id} (ID: {lote_existente['id']})")
-                return lote_existente['id']
-            cursor.execute("""
-                INSERT INTO Lote_sv (fecha_lote, business_id, estado)
-                VALUES (%s, %s, 'pendiente')
-            """, (fecha_lote, business_id))
+            # Esquema con business_id: un lote padre por (fecha, business_id).
+            # Upsert atómico sobre unique_fecha_lote_business
+            lote_id, creado = dialecto.insertar_u_obtener_id(
+                cursor, "Lote_sv",
+                {"fecha_lote": fecha_lote, "business_id": business_id, "estado": "pendiente"},
+                ("fecha_lote", "business_id"),
+            )
+            if not creado:
+                logger.info(f"ℹ️ Lote_sv padre ya existe para fecha {fecha_lote} y business_id {business_id} (ID: {lote_id})")
+                return lote_id
         else:
-            # Esquema antiguo sin business_id: un lote padre por fecha (comportamiento legacy)
+            # Esquema antiguo sin business_id: un lote padre por fecha (comportamiento legacy).
+            # Sin clave única por fecha: FOR UPDATE bloquea la fecha hasta el commit
             cursor.execute("""
                 SELECT id FROM Lote_sv WHERE fecha_lote = %s LIMIT 1
-            """, (fecha_lote,))
+            """ + dialecto.para_actualizar, (fecha_lote,))
             lote_existente = cursor.fetchone()
             if lote_existente:
                 logger.info(f"ℹ️ Lote_sv padre ya existe para fecha {fecha_lote} (ID: {lote_existente['id']})")
@@ -113,9 +196,9 @@ def obtener_o_crear_lote_sv_padre(cursor, conn, fecha_lote, business_id, logger)
                 INSERT INTO Lote_sv (fecha_lote, estado)
                 VALUES (%s, 'pendiente')
             """, (fecha_lote,))
+            lote_id = cursor.lastrowid
 
         conn.commit()
-        lote_id = cursor.lastrowid
         logger.info(f"✅ Lote_sv padre creado para fecha {fecha_lote}" + (f" y business_id {business_id}" if tiene_business_id else "") + f" (ID: {lote_id})")
         return lote_id
 
@@ -124,35 +207,231 @@ def obtener_o_crear_lote_sv_padre(cursor, conn, fecha_lote, business_id, logger)
         return None
 
 
-def crear_lotes_por_business_id(cursor, conn, logger):
+def procesar_grupo_lote(cursor, conn, grupo, tiene_business_id, logger, clave_unica=False):
+    """
+    Crea (si no existe) el Lote_sv_business de un grupo (business_id, fecha_lote) y
+    asigna su lote_id a las liquidaciones del grupo.
+    Con clave_unica (ver asegurar_clave_unica_lote_business) el lote se crea con un upsert
+    atómico. Si el lote ya existía o se asignaron otras filas que las agregadas, sus
+    totales se recalculan a partir de las liquidaciones que lo referencian.
+    Retorna (lote_business_id, creado). Lanza excepción si el grupo no se pudo procesar.
+    """
+    business_id = grupo['business_id']
+    fecha_lote = grupo['fecha_lote']
+    
+    # Asegurar que fecha_lote sea un objeto date
+    fecha_lote = _a_fecha_lote(fecha_lote)
+    
+    # Obtener o crear lote padre (con business_id para cumplir NOT NULL en Lote_sv)
+    lote_sv_id = obtener_o_crear_lote_sv_padre(cursor, conn, fecha_lote, business_id, logger, tiene_business_id)
+    
+    if not lote_sv_id:
+        raise RuntimeError(f"No se pudo obtener/crear Lote_sv padre para fecha {fecha_lote} y business_id {business_id}")
+    
+    creado = False
+    dialecto = obtener_dialecto(cursor)
+    
+    if clave_unica:
+        lote_existente = None
+    else:
+        # Verificar si ya existe un lote para este business_id y fecha
+        cursor.execute("""
+            SELECT id FROM Lote_sv_business 
+            WHERE business_id = %s AND fecha_lote = %s AND lote_sv_id = %s
+            LIMIT 1
+        """ + dialecto.para_actualizar, (business_id, fecha_lote, lote_sv_id))
+        
+        lote_existente = cursor.fetchone()
+    
+    if lote_existente:
+        logger.info(f"ℹ️ Lote ya existe para business_id {business_id} y fecha {fecha_lote} (ID: {lote_existente['id']})")
+        lote_business_id = lote_existente['id']
+    else:
+        # Crear nuevo registro en Lote_sv_business
+        valores = {
+            "business_id": business_id,
+            "lote_sv_id": lote_sv_id,
+            "fecha_lote": fecha_lote,
+            "total_transacciones": int(grupo['total_transacciones']),
+        }
+        for _, total in COLUMNAS_TOTALES_LOTE:
+            valores[total] = Decimal(str(grupo[total] or 0))
+        valores["iva_porc"] = Decimal(str(grupo['iva_porc'])) if grupo['iva_porc'] is not None else None
+        valores["estado"] = "pendiente"
+        if clave_unica:
+            lote_business_id, creado = dialecto.insertar_u_obtener_id(
+                cursor, "Lote_sv_business", valores, ("lote_sv_id", "business_id", "fecha_lote")
+            )
+        else:
+            cursor.execute(f"""
+                INSERT INTO Lote_sv_business ({', '.join(valores)})
+                VALUES ({', '.join(['%s'] * len(valores))})
+            """, tuple(valores.values()))
+            lote_business_id, creado = cursor.lastrowid, True
+        conn.commit()
+        if creado:
+            logger.info(f"✅ Lote creado para business_id {business_id} y fecha {fecha_lote} (ID: {lote_business_id})")
+        else:
+            logger.info(f"ℹ️ Lote ya existe para business_id {business_id} y fecha {fecha_lote} (ID: {lote_business_id})")
+    
+    # Actualizar LiquidacionesSV con el lote_id (rango sobre FECHA_HORA_TRAN: usa su índice)
+    desde = datetime.combine(fecha_lote, time.min)
+    cursor.execute("""
+        UPDATE LiquidacionesSV
+        SET lote_id = %s
+        WHERE business_id = %s
+        AND FECHA_HORA_TRAN >= %s
+        AND FECHA_HORA_TRAN < %s
+        AND lote_id IS NULL
+    """, (lote_business_id, business_id, desde, desde + timedelta(days=1)))
+    
+    registros_actualizados = cursor.rowcount
+    
+    # Lote previo o filas distintas de las agregadas (otra ejecución las asignó o llegaron
+    # nuevas): los totales se rehacen desde las liquidaciones del lote
+    if not creado or registros_actualizados != int(grupo['total_transacciones']):
+        recalcular_totales_lote_business(cursor, [lote_business_id])
+    conn.commit()
+    
+    if registros_actualizados > 0:
+        logger.info(f"✅ Actualizados {registros_actualizados} registros en LiquidacionesSV con lote_id {lote_business_id}")
+    
+    return lote_business_id, creado
+
+
+def recalcular_totales_lote_business(cursor, lote_business_ids):
+    """
+    Recalcula los totales de los Lote_sv_business indicados a partir de las liquidaciones
+    que tienen su lote_id. La lectura es con bloqueo (LOCK IN SHARE MODE) para ver lo
+    último confirmado aunque la transacción haya empezado antes.
+    """
+    lote_business_ids = list(dict.fromkeys(lote_business_ids))
+    if not lote_business_ids:
+        return 0
+
+    columnas = ["total_transacciones"] + [total for _, total in COLUMNAS_TOTALES_LOTE] + ["iva_porc"]
+    bloqueo_compartido = obtener_dialecto(cursor).bloqueo_compartido
+    sumas = ",\n".join(
+        f"COALESCE(SUM({columna}), 0) as {total}" for columna, total in COLUMNAS_TOTALES_LOTE
+    )
+    campos = ", ".join(f"{columna} = %s" for columna in columnas)
+    actualizados = 0
+    for inicio in range(0, len(lote_business_ids), 1000):
+        bloque = lote_business_ids[inicio:inicio + 1000]
+        placeholders = ", ".join(["%s"] * len(bloque))
+        cursor.execute(f"""
+            SELECT
+                lote_id,
+                COUNT(*) as total_transacciones,
+                {sumas},
+                AVG(IVA_PORC) as iva_porc
+            FROM LiquidacionesSV
+            WHERE lote_id IN ({placeholders})
+            GROUP BY lote_id{bloqueo_compartido}
+        """, tuple(bloque))
+        for fila in cursor.fetchall():
+            cursor.execute(f"""
+                UPDATE Lote_sv_business
+                SET {campos}
+                WHERE id = %s
+            """, tuple(fila[columna] for columna in columnas) + (fila["lote_id"],))
+            actualizados += 1
+    return actualizados
+
+
+def _procesar_grupos_business(pool, grupos, tiene_business_id, clave_unica, logger):
+    """
+    Tarea de un worker: procesa los grupos de un business_id en su propia conexión del
+    pool (bloqueo y savepoint por grupo, un commit al final).
+    Retorna [(fecha_lote, business_id, lote_business_id, creado)] de los grupos procesados.
+    """
+    conn = como_unidad_de_trabajo(pool.get_connection(), logger)
+    cursor = conn.cursor(dictionary=True)
+    bloqueos = []
+    resultados = []
+    try:
+        for grupo in grupos:
+            try:
+                bloqueos.extend(adquirir_bloqueos_lote(cursor, [(grupo['fecha_lote'], grupo['business_id'])]))
+                with conn.savepoint():
+                    lote_business_id, creado = procesar_grupo_lote(cursor, conn, grupo, tiene_business_id, logger, clave_unica)
+                resultados.append((grupo['fecha_lote'], grupo['business_id'], lote_business_id, creado))
+            except Exception as e:
+                logger.error(f"❌ Error procesando el grupo business_id {grupo['business_id']} y fecha {grupo['fecha_lote']}: {e}")
+        conn.confirmar()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        liberar_bloqueos_lote(cursor, bloqueos)
+        cursor.close()
+        # Devuelve la conexión al pool
+        conn.close()
+    return resultados
+
+
+def procesar_grupos_en_paralelo(pool, grupos, tiene_business_id, clave_unica, logger, workers):
+    """
+    Reparte los grupos por business_id entre workers hilos, cada uno con su conexión del
+    pool. Los grupos de un mismo business_id van al mismo worker y en el orden canónico
+    de sus bloqueos (ordenar_por_bloqueo), así que el resultado no depende de qué worker
+    termine antes.
+    Retorna la lista de (fecha_lote, business_id, lote_business_id, creado) ordenada por
+    business_id y, dentro de cada uno, en el orden de los bloqueos.
+    """
+    # Cada worker toma una conexión del pool: nunca más workers que conexiones
+    workers = min(workers, getattr(pool, "pool_size", workers))
+    por_business = {}
+    for grupo in ordenar_por_bloqueo(grupos):
+        por_business.setdefault(str(grupo['business_id']), []).append(grupo)
+
+    logger.info(f"🔀 {len(grupos)} grupos de {len(por_business)} business_id repartidos en {workers} workers")
+    resultados = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = [
+            (business_id, executor.submit(_procesar_grupos_business, pool, grupos_business, tiene_business_id, clave_unica, logger))
+            for business_id, grupos_business in sorted(por_business.items())
+        ]
+        for business_id, futuro in futuros:
+            try:
+                resultados.extend(futuro.result())
+            except Exception as e:
+                logger.error(f"❌ Error procesando los lotes del business_id {business_id}: {e}")
+    return resultados
+
+
+def crear_lotes_por_business_id(cursor, conn, logger, workers=None):
     """
     Agrupa registros de LiquidacionesSV por business_id y fecha_lote,
-    crea registros en Lote_sv_business y actualiza LiquidacionesSV con lote_id
+    crea registros en Lote_sv_business y actualiza LiquidacionesSV con lote_id.
+    Con workers > 1 (por defecto SERFINSA_LOTES_WORKERS) los business_id se procesan
+    en paralelo, cada worker con su conexión de un pool, y los totales de los Lote_sv
+    padre se calculan una sola vez al terminar todos.
     """
+    if workers is None:
+        workers = int(os.getenv("SERFINSA_LOTES_WORKERS", "1"))
+    conn = como_unidad_de_trabajo(conn, logger)
+    bloqueos = []
     try:
         # Verificar que exista la columna lote_id
         if not verificar_y_agregar_columna_lote_id(cursor, conn, logger):
             return False, 0
         
         # Verificar que exista la tabla Lote_sv_business
-        cursor.execute("""
-            SELECT TABLE_NAME 
-            FROM INFORMATION_SCHEMA.TABLES 
-            WHERE TABLE_SCHEMA = DATABASE() 
-            AND TABLE_NAME = 'Lote_sv_business'
-        """)
-        
-        table_exists = cursor.fetchone()
+        table_exists = obtener_dialecto(cursor).existe_tabla(cursor, "Lote_sv_business")
         
         if not table_exists:
             logger.error("❌ La tabla Lote_sv_business no existe. Por favor créala primero.")
             return False, 0
         
+        # Filas pendientes de lote insertadas antes de existir FECHA_HORA_TRAN
+        rellenar_fecha_hora(cursor, conn, logger, solo_pendientes_lote=True)
+        
         # Obtener registros de LiquidacionesSV que tienen business_id pero no tienen lote_id asignado
         cursor.execute("""
             SELECT 
                 business_id,
-                DATE(FECHA_TRAN) as fecha_lote,
+                DATE(FECHA_HORA_TRAN) as fecha_lote,
                 COUNT(*) as total_transacciones,
                 COALESCE(SUM(MONTO_TRAN), 0) as total_monto_tran,
                 COALESCE(SUM(MONTO_AJUS), 0) as total_monto_ajus,
@@ -170,7 +449,8 @@ def crear_lotes_por_business_id(cursor, conn, logger):
             FROM LiquidacionesSV
             WHERE business_id IS NOT NULL
             AND lote_id IS NULL
-            GROUP BY business_id, DATE(FECHA_TRAN)
+            AND FECHA_HORA_TRAN IS NOT NULL
+            GROUP BY business_id, DATE(FECHA_HORA_TRAN)
         """)
         
         grupos = cursor.fetchall()
@@ -181,86 +461,54 @@ def crear_lotes_por_business_id(cursor, conn, logger):
         
         logger.info(f"📊 Se encontraron {len(grupos)} grupos de business_id para crear lotes")
         
+        tiene_business_id = asegurar_tabla_lote_sv(cursor, conn, logger)
+        if tiene_business_id is None:
+            return False, 0
+        clave_unica = asegurar_clave_unica_lote_business(cursor, logger)
+        
         lotes_creados = 0
         
-        for grupo in grupos:
-            business_id = grupo['business_id']
-            fecha_lote = grupo['fecha_lote']
-            
-            # Asegurar que fecha_lote sea un objeto date
-            if isinstance(fecha_lote, str):
-                fecha_lote = datetime.strptime(fecha_lote, '%Y-%m-%d').date()
-            elif isinstance(fecha_lote, datetime):
-                fecha_lote = fecha_lote.date()
-            
-            # Obtener o crear lote padre (con business_id para cumplir NOT NULL en Lote_sv)
-            lote_sv_id = obtener_o_crear_lote_sv_padre(cursor, conn, fecha_lote, business_id, logger)
-            
-            if not lote_sv_id:
-                logger.error(f"❌ No se pudo obtener/crear Lote_sv padre para fecha {fecha_lote} y business_id {business_id}")
-                continue
-            
-            # Verificar si ya existe un lote para este business_id y fecha
-            cursor.execute("""
-                SELECT id FROM Lote_sv_business 
-                WHERE business_id = %s AND fecha_lote = %s AND lote_sv_id = %s
-                LIMIT 1
-            """, (business_id, fecha_lote, lote_sv_id))
-            
-            lote_existente = cursor.fetchone()
-            
-            if lote_existente:
-                logger.info(f"ℹ️ Lote ya existe para business_id {business_id} y fecha {fecha_lote} (ID: {lote_existente['id']})")
-                lote_business_id = lote_existente['id']
-            else:
-                # Crear nuevo registro en Lote_sv_business
-                cursor.execute("""
-                    INSERT INTO Lote_sv_business (
-                        business_id, lote_sv_id, fecha_lote,
-                        total_transacciones, total_monto_tran, total_monto_ajus,
-                        total_monto_texe, total_subtotal, total_monto_iva,
-                        total_comisionab, total_com_monto, total_com_mtoiva,
-                        total_retencion2, total_retenido, total_monto_debi,
-                        total_deposito, iva_porc, estado
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pendiente'
-                    )
-                """, (
-                    business_id, lote_sv_id, fecha_lote,
-                    int(grupo['total_transacciones']),
-                    Decimal(str(grupo['total_monto_tran'] or 0)),
-                    Decimal(str(grupo['total_monto_ajus'] or 0)),
-                    Decimal(str(grupo['total_monto_texe'] or 0)),
-                    Decimal(str(grupo['total_subtotal'] or 0)),
-                    Decimal(str(grupo['total_monto_iva'] or 0)),
-                    Decimal(str(grupo['total_comisionab'] or 0)),
-                    Decimal(str(grupo['total_com_monto'] or 0)),
-                    Decimal(str(grupo['total_com_mtoiva'] or 0)),
-                    Decimal(str(grupo['total_retencion2'] or 0)),
-                    Decimal(str(grupo['total_retenido'] or 0)),
-                    Decimal(str(grupo['total_monto_debi'] or 0)),
-                    Decimal(str(grupo['total_deposito'] or 0)),
-                    Decimal(str(grupo['iva_porc'])) if grupo['iva_porc'] is not None else None
-                ))
-                conn.commit()
-                lote_business_id = cursor.lastrowid
-                logger.info(f"✅ Lote creado para business_id {business_id} y fecha {fecha_lote} (ID: {lote_business_id})")
-                lotes_creados += 1
-            
-            # Actualizar LiquidacionesSV con el lote_id
-            cursor.execute("""
-                UPDATE LiquidacionesSV
-                SET lote_id = %s
-                WHERE business_id = %s
-                AND DATE(FECHA_TRAN) = %s
-                AND lote_id IS NULL
-            """, (lote_business_id, business_id, fecha_lote))
-            
-            registros_actualizados = cursor.rowcount
-            conn.commit()
+        # Orden canónico de los bloqueos: cada sesión (serie o worker) toma los suyos
+        # en este orden, igual que crear_lotes_desde_dataframe
+        grupos = ordenar_por_bloqueo(grupos)
+        
+        pool = None
+        if workers > 1 and len({str(g['business_id']) for g in grupos}) > 1:
+            from conector import TAMANO_MAXIMO_POOL, crear_pool_escritura
+            # Un worker por conexión: el pool no puede pasar de TAMANO_MAXIMO_POOL
+            if workers > TAMANO_MAXIMO_POOL:
+                logger.warning(f"⚠️ SERFINSA_LOTES_WORKERS={workers} excede el máximo del pool; se usan {TAMANO_MAXIMO_POOL} workers")
+                workers = TAMANO_MAXIMO_POOL
+            pool = crear_pool_escritura(workers, nombre="serfinsa_lotes")
+            if pool is None:
+                logger.warning("⚠️ No se pudo crear el pool de conexiones; los lotes se crean en serie")
+        
+        if pool is not None:
+            # Los workers deben ver la columna lote_id y la clave única ya confirmadas
+            conn.confirmar()
+            resultados = procesar_grupos_en_paralelo(pool, grupos, tiene_business_id, clave_unica, logger, workers)
+            lotes_creados = sum(1 for _, _, _, creado in resultados if creado)
+            logger.info(f"📊 Total de lotes creados/actualizados: {lotes_creados} ({len(resultados)} de {len(grupos)} grupos procesados)")
             
-            if registros_actualizados > 0:
-                logger.info(f"✅ Actualizados {registros_actualizados} registros en LiquidacionesSV con lote_id {lote_business_id}")
+            # Totales de los Lote_sv padre una sola vez, cuando terminaron todos los workers
+            logger.info("🔄 Actualizando totales del Lote_sv padre con sumas de todos los hijos...")
+            actualizar_totales_lote_sv_padre(
+                cursor, conn, logger, _lotes_padre_de(cursor, [lote_id for _, _, lote_id, _ in resultados])
+            )
+            conn.confirmar()
+            return True, lotes_creados
+        
+        for grupo in grupos:
+            # Bloqueo del grupo hasta el commit final; cada grupo en su propio savepoint:
+            # si falla se deshace solo ese grupo
+            try:
+                bloqueos.extend(adquirir_bloqueos_lote(cursor, [(grupo['fecha_lote'], grupo['business_id'])]))
+                with conn.savepoint():
+                    _, creado = procesar_grupo_lote(cursor, conn, grupo, tiene_business_id, logger, clave_unica)
+                if creado:
+                    lotes_creados += 1
+            except Exception as e:
+                logger.error(f"❌ Error procesando el grupo business_id {grupo['business_id']} y fecha {grupo['fecha_lote']}: {e}")
         
         logger.info(f"📊 Total de lotes creados/actualizados: {lotes_creados}")
         
@@ -268,28 +516,49 @@ def crear_lotes_por_business_id(cursor, conn, logger):
         logger.info("🔄 Actualizando totales del Lote_sv padre con sumas de todos los hijos...")
         actualizar_totales_lote_sv_padre(cursor, conn, logger)
         
+        conn.confirmar()
         return True, lotes_creados
         
     except Exception as e:
+        conn.rollback()
         logger.error(f"❌ Error creando lotes por business_id: {e}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         return False, 0
+    finally:
+        liberar_bloqueos_lote(cursor, bloqueos)
+
+
+def _lotes_padre_de(cursor, lote_business_ids):
+    """
+    lote_sv_id (ordenados) de los Lote_sv_business indicados
+    """
+    lote_sv_ids = set()
+    lote_business_ids = list(dict.fromkeys(lote_business_ids))
+    for inicio in range(0, len(lote_business_ids), 1000):
+        bloque = lote_business_ids[inicio:inicio + 1000]
+        placeholders = ", ".join(["%s"] * len(bloque))
+        cursor.execute(f"SELECT DISTINCT lote_sv_id FROM Lote_sv_business WHERE id IN ({placeholders})", tuple(bloque))
+        lote_sv_ids.update(fila["lote_sv_id"] for fila in cursor.fetchall())
+    return sorted(lote_sv_ids)
 
 
-def actualizar_totales_lote_sv_padre(cursor, conn, logger):
+def actualizar_totales_lote_sv_padre(cursor, conn, logger, lote_sv_ids=None):
     """
     Actualiza los totales del Lote_sv padre sumando todos los registros de Lote_sv_business
-    que pertenecen a cada lote padre
+    que pertenecen a cada lote padre. Con lote_sv_ids se actualizan solo esos lotes padre.
     """
     try:
-        # Obtener todos los lotes padre que necesitan actualización
-        cursor.execute("""
-            SELECT DISTINCT lote_sv_id 
-            FROM Lote_sv_business
-        """)
-        
-        lote_sv_ids = cursor.fetchall()
+        if lote_sv_ids is not None:
+            lote_sv_ids = [{'lote_sv_id': lote_sv_id} for lote_sv_id in lote_sv_ids]
+        else:
+            # Obtener todos los lotes padre que necesitan actualización
+            cursor.execute("""
+                SELECT DISTINCT lote_sv_id 
+                FROM Lote_sv_business
+            """)
+            
+            lote_sv_ids = cursor.fetchall()
         
         if not lote_sv_ids:
             logger.info("ℹ️ No hay lotes padre para actualizar")
@@ -297,6 +566,9 @@ def actualizar_totales_lote_sv_padre(cursor, conn, logger):
         
         logger.info(f"📊 Actualizando {len(lote_sv_ids)} lotes padre...")
         
+        # Verificar una sola vez qué columnas tiene la tabla Lote_sv
+        columnas_lote_sv = obtener_dialecto(cursor).columnas_tabla(cursor, "Lote_sv")
+        
         for lote_sv_row in lote_sv_ids:
             lote_sv_id = lote_sv_row['lote_sv_id']
             
@@ -325,16 +597,6 @@ def actualizar_totales_lote_sv_padre(cursor, conn, logger):
             totales = cursor.fetchone()
             
             if totales:
-                # Verificar qué columnas tiene la tabla Lote_sv
-                cursor.execute("""
-                    SELECT COLUMN_NAME 
-                    FROM INFORMATION_SCHEMA.COLUMNS 
-                    WHERE TABLE_NAME = 'Lote_sv' 
-                    AND TABLE_SCHEMA = DATABASE()
-                """)
-                
-                columnas_lote_sv = [row['COLUMN_NAME'] for row in cursor.fetchall()]
-                
                 # Construir la consulta UPDATE dinámicamente según las columnas disponibles
                 campos_update = []
                 valores_update = []
@@ -420,3 +682,334 @@ def actualizar_totales_lote_sv_padre(cursor, conn, logger):
         logger.error(f"❌ Error actualizando totales del Lote_sv padre: {e}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
+
+
+def _a_fecha_lote(valor):
+    """
+    fecha_lote como date (SQLite devuelve DATE(...) como texto 'YYYY-MM-DD')
+    """
+    if isinstance(valor, str):
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
+
+
+def _centavos(valor):
+    """
+    Monto en centavos (int) convertido de forma exacta con Decimal: los floats pasan por
+    su representación más corta (str), no por la multiplicación en float64
+    """
+    if valor is None or isinstance(valor, bool):
+        return 0
+    try:
+        monto = Decimal(str(valor).strip())
+    except InvalidOperation:
+        return 0
+    if not monto.is_finite():
+        return 0
+    return int((monto * CENTAVOS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def _a_centavos(serie):
+    """
+    Convierte una columna de montos a enteros en centavos (redondeo half-up, como
+    MySQL al guardar en DECIMAL(…,2)). Los nulos y los valores no numéricos cuentan
+    como 0, igual que COALESCE(SUM()).
+    La conversión es exacta y por columna: cada monto pasa por su texto (la
+    representación más corta de los floats) a decimal de Arrow y se redondea allí, sin
+    aritmética de float; si Arrow no acepta algún texto se convierte valor por valor.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    numeros = pd.to_numeric(serie, errors="coerce")
+    if pd.api.types.is_integer_dtype(numeros.dtype):
+        return (numeros.fillna(0).astype("int64") * CENTAVOS).set_axis(serie.index)
+
+    # Montos fuera de DECIMAL(20,2) (o NaN/inf) cuentan como 0
+    validos = (numeros.abs() < LIMITE_MONTO_CENTAVOS).to_numpy(dtype=bool, na_value=False)
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        texto = pc.cast(pa.array(numeros.to_numpy(dtype="float64"), mask=~validos), pa.string())
+    else:
+        texto = pc.utf8_trim_whitespace(pa.array(serie.astype(str).to_numpy(dtype=object), type=pa.string(), mask=~validos))
+
+    try:
+        montos = pc.cast(texto, pa.decimal128(38, 18), safe=False)
+        redondeados = pc.cast(pc.round(montos, ndigits=2, round_mode="half_towards_infinity"), pa.decimal128(20, 2))
+        centavos = pc.cast(pc.multiply(redondeados, pa.scalar(Decimal(CENTAVOS), pa.decimal128(3, 0))), pa.int64())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return pd.Series([_centavos(valor) for valor in serie.tolist()], index=serie.index, dtype="int64")
+    return pd.Series(centavos.fill_null(0).to_numpy(), index=serie.index, dtype="int64")
+
+
+def agregar_lotes_en_memoria(df):
+    """
+    Calcula los totales por (business_id, fecha_lote) de un DataFrame de liquidaciones
+    que ya trae la columna business_id (resultado del emparejamiento).
+    Retorna una lista de grupos con las mismas claves que la consulta SQL de
+    crear_lotes_por_business_id (montos como Decimal exactos) más la lista seq_nums.
+    Las filas sin business_id o con FECHA_HORA_TRAN no interpretable se dejan fuera.
+    """
+    import pandas as pd
+
+    if df is None or df.empty or "business_id" not in df.columns:
+        return []
+
+    if COLUMNA_FECHA_HORA in df.columns:
+        fechas = pd.to_datetime(df[COLUMNA_FECHA_HORA], errors="coerce")
+    else:
+        fechas = interpretar_fechas(df["FECHA_TRAN"])
+    lote = pd.DataFrame({
+        "business_id": df["business_id"],
+        "fecha_lote": fechas.dt.date,
+        "seq_num": df["SEQ_NUM"],
+    })
+    for columna, total in COLUMNAS_TOTALES_LOTE:
+        lote[total] = _a_centavos(df[columna]) if columna in df.columns else 0
+
+    # AVG(IVA_PORC) ignora los nulos: se acumulan suma y cantidad de valores presentes
+    if "IVA_PORC" in df.columns:
+        lote["iva_centavos"] = _a_centavos(df["IVA_PORC"])
+        lote["iva_presente"] = pd.to_numeric(df["IVA_PORC"], errors="coerce").notna().astype("int64")
+    else:
+        lote["iva_centavos"] = 0
+        lote["iva_presente"] = 0
+
+    lote = lote[lote["business_id"].notna() & lote["fecha_lote"].notna()]
+    if lote.empty:
+        return []
+
+    agrupado = lote.groupby(["business_id", "fecha_lote"], sort=True)
+    sumas = agrupado[[total for _, total in COLUMNAS_TOTALES_LOTE] + ["iva_centavos", "iva_presente"]].sum()
+    conteos = agrupado.size()
+    seq_nums = agrupado["seq_num"].agg(list)
+
+    grupos = []
+    for clave, fila in sumas.iterrows():
+        grupo = {
+            "business_id": clave[0],
+            "fecha_lote": clave[1],
+            "total_transacciones": int(conteos[clave]),
+        }
+        for _, total in COLUMNAS_TOTALES_LOTE:
+            grupo[total] = (Decimal(int(fila[total])) / CENTAVOS).quantize(Decimal("0.01"))
+        presentes = int(fila["iva_presente"])
+        grupo["iva_porc"] = (
+            (Decimal(int(fila["iva_centavos"])) / CENTAVOS / presentes).quantize(Decimal("0.0001"))
+            if presentes else None
+        )
+        grupo["seq_nums"] = [seq for seq in seq_nums[clave] if seq is not None]
+        grupos.append(grupo)
+    return grupos
+
+
+def verificar_lotes_en_memoria(cursor, grupos, logger):
+    """
+    Compara los totales calculados en memoria con el agregado de la base de datos sobre
+    los mismos SEQ_NUM. Retorna True si coinciden todos los grupos.
+    """
+    seq_nums = [seq for grupo in grupos for seq in grupo["seq_nums"]]
+    esperados = {(str(g["business_id"]), g["fecha_lote"]): g for g in grupos}
+    obtenidos = {}
+
+    for inicio in range(0, len(seq_nums), 1000):
+        bloque = seq_nums[inicio:inicio + 1000]
+        placeholders = ", ".join(["%s"] * len(bloque))
+        sumas = ",\n".join(
+            f"COALESCE(SUM({columna}), 0) as {total}" for columna, total in COLUMNAS_TOTALES_LOTE
+        )
+        cursor.execute(f"""
+            SELECT
+                business_id,
+                DATE(FECHA_HORA_TRAN) as fecha_lote,
+                COUNT(*) as total_transacciones,
+                {sumas},
+                SUM(IVA_PORC) as suma_iva,
+                COUNT(IVA_PORC) as cuenta_iva
+            FROM LiquidacionesSV
+            WHERE SEQ_NUM IN ({placeholders})
+            AND business_id IS NOT NULL
+            AND lote_id IS NULL
+            GROUP BY business_id, DATE(FECHA_HORA_TRAN)
+        """, tuple(bloque))
+        for fila in cursor.fetchall():
+            clave = (str(fila["business_id"]), _a_fecha_lote(fila["fecha_lote"]))
+            acumulado = obtenidos.setdefault(clave, {"total_transacciones": 0, "suma_iva": Decimal(0), "cuenta_iva": 0})
+            acumulado["total_transacciones"] += int(fila["total_transacciones"])
+            acumulado["suma_iva"] += Decimal(str(fila["suma_iva"] or 0))
+            acumulado["cuenta_iva"] += int(fila["cuenta_iva"] or 0)
+            for _, total in COLUMNAS_TOTALES_LOTE:
+                acumulado[total] = acumulado.get(total, Decimal(0)) + Decimal(str(fila[total] or 0))
+
+    diferencias = []
+    for clave in sorted(set(esperados) | set(obtenidos), key=str):
+        esperado, obtenido = esperados.get(clave), obtenidos.get(clave)
+        if esperado is None or obtenido is None:
+            diferencias.append(f"{clave}: grupo {'solo en BD' if esperado is None else 'solo en memoria'}")
+            continue
+        if esperado["total_transacciones"] != obtenido["total_transacciones"]:
+            diferencias.append(f"{clave}: total_transacciones {esperado['total_transacciones']} != {obtenido['total_transacciones']}")
+        for _, total in COLUMNAS_TOTALES_LOTE:
+            if esperado[total] != obtenido[total]:
+                diferencias.append(f"{clave}: {total} {esperado[total]} != {obtenido[total]}")
+        iva_bd = (obtenido["suma_iva"] / obtenido["cuenta_iva"]) if obtenido["cuenta_iva"] else None
+        iva_memoria = esperado["iva_porc"]
+        if (iva_bd is None) != (iva_memoria is None) or (
+            iva_bd is not None and abs(iva_bd - iva_memoria) > Decimal("0.01")
+        ):
+            diferencias.append(f"{clave}: iva_porc {iva_memoria} != {iva_bd}")
+
+    for diferencia in diferencias[:20]:
+        logger.warning(f"⚠️ Diferencia en verificación de lotes {diferencia}")
+    if diferencias:
+        logger.warning(f"⚠️ La verificación de lotes en memoria encontró {len(diferencias)} diferencias")
+        return False
+    logger.info(f"✅ Verificación de lotes en memoria correcta ({len(grupos)} grupos)")
+    return True
+
+
+def asegurar_clave_unica_lote_business(cursor, logger):
+    """
+    Verifica (y crea si es posible) la clave única (lote_sv_id, business_id, fecha_lote)
+    de Lote_sv_business que necesita el upsert en bloque. Retorna True si existe.
+    """
+    dialecto = obtener_dialecto(cursor)
+    for columnas in dialecto.indices_unicos(cursor, "Lote_sv_business").values():
+        if set(columnas) == {"lote_sv_id", "business_id", "fecha_lote"}:
+            return True
+
+    try:
+        dialecto.agregar_indice(
+            cursor, "Lote_sv_business", "unique_lote_sv_business",
+            ["lote_sv_id", "business_id", "fecha_lote"], unico=True
+        )
+        logger.info("✅ Clave única unique_lote_sv_business agregada a Lote_sv_business")
+        return True
+    except Exception as e:
+        # Puede fallar si ya hay lotes duplicados; se sigue con el proceso por grupo
+        logger.warning(f"⚠️ No se pudo agregar la clave única a Lote_sv_business: {e}")
+        return False
+
+
+def _ids_lote_business(cursor, lote_sv_ids):
+    """
+    {(lote_sv_id, business_id, fecha_lote): id} de los Lote_sv_business de esos lotes padre
+    """
+    placeholders = ", ".join(["%s"] * len(lote_sv_ids))
+    cursor.execute(f"""
+        SELECT id, lote_sv_id, business_id, fecha_lote
+        FROM Lote_sv_business
+        WHERE lote_sv_id IN ({placeholders})
+    """, tuple(lote_sv_ids))
+    return {
+        (fila["lote_sv_id"], str(fila["business_id"]), _a_fecha_lote(fila["fecha_lote"])): fila["id"]
+        for fila in cursor.fetchall()
+    }
+
+
+def crear_lotes_desde_dataframe(cursor, conn, df, logger, verificar=False):
+    """
+    Crea los lotes del lote de liquidaciones recién ingerido a partir de los totales
+    calculados en memoria (agregar_lotes_en_memoria), con un upsert en bloque en
+    Lote_sv_business y un UPDATE ... JOIN para asignar lote_id.
+    Con verificar=True se comparan antes los totales con el agregado de la base de datos
+    y, si no coinciden, no se escribe nada.
+    Retorna (success, lotes_escritos, lotes_creados): lotes_escritos incluye los que ya
+    existían y solo recibieron los totales del archivo. Las filas que queden sin lote (p. ej. FECHA_HORA_TRAN
+    no interpretable) las recoge después crear_lotes_por_business_id.
+    """
+    conn = como_unidad_de_trabajo(conn, logger)
+    bloqueos = []
+    try:
+        if not verificar_y_agregar_columna_lote_id(cursor, conn, logger):
+            return False, 0, 0
+
+        grupos = agregar_lotes_en_memoria(df)
+        if not grupos:
+            logger.info("ℹ️ No hay registros del archivo para agrupar en lotes")
+            return True, 0, 0
+        logger.info(f"📊 {len(grupos)} grupos de business_id calculados en memoria")
+
+        if verificar and not verificar_lotes_en_memoria(cursor, grupos, logger):
+            return False, 0, 0
+
+        tiene_business_id = asegurar_tabla_lote_sv(cursor, conn, logger)
+        if tiene_business_id is None or not asegurar_clave_unica_lote_business(cursor, logger):
+            return False, 0, 0
+
+        # Bloqueos de todos los grupos del archivo hasta el commit (en el orden canónico)
+        bloqueos = adquirir_bloqueos_lote(cursor, [(g["fecha_lote"], g["business_id"]) for g in grupos])
+
+        for grupo in grupos:
+            grupo["lote_sv_id"] = obtener_o_crear_lote_sv_padre(
+                cursor, conn, grupo["fecha_lote"], grupo["business_id"], logger, tiene_business_id
+            )
+            if not grupo["lote_sv_id"]:
+                raise RuntimeError(f"No se pudo obtener/crear Lote_sv padre para fecha {grupo['fecha_lote']} y business_id {grupo['business_id']}")
+
+        # Lotes que ya existían antes del upsert, para contar solo los creados
+        lote_sv_ids = sorted({grupo["lote_sv_id"] for grupo in grupos})
+        existentes = _ids_lote_business(cursor, lote_sv_ids)
+        lotes_creados = sum(
+            1 for grupo in grupos
+            if (grupo["lote_sv_id"], str(grupo["business_id"]), grupo["fecha_lote"]) not in existentes
+        )
+
+        # Upsert en bloque: si el lote ya existía se le suman los totales del archivo
+        dialecto = obtener_dialecto(cursor)
+        columnas = ["total_transacciones"] + [total for _, total in COLUMNAS_TOTALES_LOTE]
+        for inicio in range(0, len(grupos), TAMANO_BLOQUE_LOTES):
+            bloque = grupos[inicio:inicio + TAMANO_BLOQUE_LOTES]
+            sql, params = dialecto.upsert_acumulando(
+                "Lote_sv_business",
+                ["business_id", "lote_sv_id", "fecha_lote"] + columnas + ["iva_porc", "estado"],
+                ["lote_sv_id", "business_id", "fecha_lote"],
+                columnas,
+                ["iva_porc"],
+                [
+                    [grupo["business_id"], grupo["lote_sv_id"], grupo["fecha_lote"]]
+                    + [grupo[columna] for columna in columnas]
+                    + [grupo["iva_porc"], "pendiente"]
+                    for grupo in bloque
+                ],
+            )
+            cursor.execute(sql, params)
+
+        # Ids de los lotes escritos para asignarlos a las liquidaciones
+        ids = _ids_lote_business(cursor, lote_sv_ids)
+
+        asignaciones = []
+        for grupo in grupos:
+            lote_business_id = ids.get((grupo["lote_sv_id"], str(grupo["business_id"]), grupo["fecha_lote"]))
+            asignaciones.extend((seq, lote_business_id) for seq in grupo["seq_nums"])
+
+        actualizados = 0
+        for inicio in range(0, len(asignaciones), 1000):
+            actualizados += dialecto.actualizar_desde_filas(
+                cursor, "LiquidacionesSV", ("SEQ_NUM", "seq_num"), ["seq_num", "lote_id"],
+                asignaciones[inicio:inicio + 1000], {"lote_id": "lote_id"},
+                condicion="t.lote_id IS NULL",
+            )
+
+        logger.info(f"✅ {len(grupos)} lotes escritos en bloque ({lotes_creados} nuevos) y {actualizados} registros de LiquidacionesSV con lote_id")
+
+        # Si otra ejecución ya había asignado parte de las filas, los totales sumados no
+        # corresponden: se rehacen desde las liquidaciones de cada lote
+        if actualizados != len(asignaciones):
+            logger.warning(f"⚠️ {len(asignaciones) - actualizados} registros ya tenían lote_id; se recalculan los totales")
+            recalcular_totales_lote_business(cursor, [lote_id for _, lote_id in asignaciones])
+
+        actualizar_totales_lote_sv_padre(cursor, conn, logger, lote_sv_ids)
+        conn.confirmar()
+        return True, len(grupos), lotes_creados
+
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"❌ Error creando lotes en memoria: {e}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return False, 0, 0
+    finally:
+        liberar_bloqueos_lote(cursor, bloqueos)
@@ -1,200 +1,184 @@
 import pandas as pd
-import numpy as np
 import os
 import time
 from datetime import datetime
-from conector import create_connection
-from ReadFile import buscar_y_leer_excel
-from BuscarTransaccion import buscar_transaction_id
-from CrearLotes import crear_lotes_por_business_id
-from logger_config import setup_logger, log_separator
-from email_sender import EmailSender
+from conector import create_connection, create_read_connection
+from ReadFile import buscar_archivo_pendiente, leer_archivo_encontrado, convertir_aprobac, convertir_seq_num
+from archivo_procesados import archivado_activo, archivar_archivo, rechazar_si_duplicado
+from BuscarTransaccion import (
+    emparejar_transacciones,
+    emparejar_por_codigo_autorizacion,
+    estadisticas_cache_transacciones,
+)
+from CrearLotes import crear_lotes_por_business_id, crear_lotes_desde_dataframe
+from ReintentarEmparejamiento import reintentar_pendientes
+from fecha_hora_transaccion import COLUMNA_FECHA_HORA, asegurar_columna_fecha_hora, interpretar_fechas
+from ValidarLiquidaciones import escribir_rechazos, obtener_definiciones, validar_dataframe
+from registro_liquidacion import LiquidacionRecord
+from unidad_trabajo import UnidadDeTrabajo, como_unidad_de_trabajo, es_error_de_bloqueo
+from logger_config import setup_logger, log_separator, extraer_segmento_ejecucion, obtener_run_id
+from email_sender import EmailSender, enviar_alerta_sin_archivo
+from historial_ejecuciones import MedidorEjecucion, registrar_ejecucion
+from digest_notificaciones import digest_activo, encolar, enviar_digest
+from perfilado import crear_perfilador
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def verificar_seq_num_existe(cursor, seq_num):
+SQL_INSERT_LIQUIDACION = """
+    INSERT INTO LiquidacionesSV (
+        FECHA_TRAN, HORA_TRAN, ID_PAG, SUCURSAL_I, TERMINAL_I, AFILIADO, NOMBRE_COM,
+        EMISOR_ID, PAN, MONTO_TRAN, MONTO_AJUS, MONTO_TEXE, SUBTOTAL, MONTO_IVA,
+        COMISIONAB, COM_PORCEN, COM_MONTO, COM_MTOIVA, RETENCION2, RETENIDO,
+        MONTO_DEBI, DEPOSITO, CCFNO, DCLNO, TIPO_TRANS, MESES_PLZO, PAGADO,
+        BCO_PAGO, NUMCTA, REG_FISCAL, IVA_PORC, APROBAC, TC, TYP, SEQ_NUM,
+        INVOIC_NUM, RESP_CDE, MODO_ENTRA, COMPRADOR, ORDEN_ID, FECHA_HORA_TRAN
+    )
+    VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    )
+"""
+
+
+def _insertar_bloque(cursor, conn, logger, bloque):
     """
-    Verifica si el SEQ_NUM ya existe en la tabla LiquidacionesSV
+    Inserta un bloque de registros válidos con un solo executemany. Si el bloque falla
+    se reintenta fila por fila para insertar las demás y registrar la que falló.
+    Un deadlock o una espera de bloqueo agotada no se reintenta fila por fila (la
+    transacción, con los bloques anteriores aún sin confirmar, ya se deshizo): se
+    descarta la unidad de trabajo y se lanza RuntimeError.
+    Retorna (insertados, errores, seq_nums_insertados)
     """
     try:
-        # Si seq_num es None o NaN, no verificar
-        if seq_num is None or pd.isna(seq_num):
-            return False
-        
-        # Normalizar el valor: convertir a string sin .0 si es float
-        if isinstance(seq_num, float) and seq_num.is_integer():
-            seq_num = str(int(seq_num))
-        elif isinstance(seq_num, (int, float)):
-            seq_num = str(int(seq_num))
-        else:
-            seq_num = str(seq_num)
-        
-        # Buscar en la base de datos (puede estar como string o número)
-        # Intentar comparar como string primero
-        cursor.execute("""
-            SELECT SEQ_NUM FROM LiquidacionesSV 
-            WHERE CAST(SEQ_NUM AS CHAR) = %s 
-            LIMIT 1
-        """, (seq_num,))
-        result = cursor.fetchone()
-        return result is not None
+        # Savepoint: si el bloque falla no queda ninguna de sus filas a medias
+        with conn.savepoint():
+            cursor.executemany(SQL_INSERT_LIQUIDACION, [registro.parametros_insert() for registro in bloque])
+            conn.registrar(len(bloque))
+        insertados = bloque
+        errores = 0
     except Exception as e:
-        # No usar logger aquí para evitar dependencias circulares
-        print(f"Error verificando SEQ_NUM {seq_num}: {e}")
-        return False 
+        if es_error_de_bloqueo(e):
+            conn.rollback()
+            raise RuntimeError(
+                f"Bloqueo en la base de datos al insertar el bloque ({len(bloque)} filas); "
+                f"se deshizo lo pendiente sin confirmar: {e}"
+            ) from e
+        logger.warning(f"⚠️ Falló la inserción en bloque ({len(bloque)} filas): {e}. Reintentando fila por fila...")
+        insertados = []
+        errores = 0
+        for registro in bloque:
+            row_cleaned = registro.parametros_insert()
+            try:
+                # Un INSERT fallido solo deshace su propia sentencia; no hace falta savepoint por fila
+                cursor.execute(SQL_INSERT_LIQUIDACION, row_cleaned)
+                conn.registrar()
+                insertados.append(registro)
+            except Exception as e_fila:
+                errores += 1
+                logger.error(f"❌ Error al insertar fila {registro.fila + 1} (SEQ_NUM: {registro.SEQ_NUM}): {e_fila}")
+                logger.error(f"➡️ Datos problemáticos: {row_cleaned}")
 
-def main():
-    # Registrar tiempo de inicio
-    start_time = time.time()
-    start_datetime = datetime.now()
-    
-    # Configurar logging básico para el caso de error
-    df, excel_file_path, search_path = buscar_y_leer_excel()
-    if df is None:
-        print("No se encontró ningún archivo Excel para procesar.")
-        
-        # Enviar email de alerta
-        notification_email = os.getenv("NOTIFICATION_EMAIL")
-        if notification_email:
-            print("📧 Enviando email de alerta...")
-            
-            email_sender = EmailSender()
-            subject = "Incidencia - No se encontró archivo Excel para procesar"
-            alert_message = "No se encontró ningún archivo Excel para procesar."
-            
-            success, message = email_sender.send_alert_email(
-                notification_email, 
-                subject, 
-                alert_message, 
-                search_path
-            )
-            
-            if success:
-                print("✅ Email de alerta enviado exitosamente")
-            else:
-                print(f"❌ Error enviando email de alerta: {message}")
+    seq_nums = set()
+    for registro in insertados:
+        if registro.SEQ_NUM is not None:
+            seq_nums.add(registro.SEQ_NUM)
+            logger.info(f"✅ Registro insertado: SEQ_NUM {registro.SEQ_NUM}")
         else:
-            print("⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
-        
-        return
-    
-    logger, log_file_path = setup_logger(excel_file_path)
-    
-    log_separator(logger, "=" * 60)
-    logger.info(f"🚀 INICIANDO PROCESAMIENTO DE ARCHIVO: {excel_file_path}")
-    logger.info(f"📝 Archivo de log: {log_file_path}")
-    logger.info(f"⏰ Fecha y hora de inicio: {start_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
-    log_separator(logger)
-    
-    conn = create_connection()
-    if not conn:
-        logger.error("❌ No se pudo conectar a la base de datos.")
-        return
+            logger.info(f"✅ Registro insertado sin SEQ_NUM (fila {registro.fila + 1})")
+    return len(insertados), errores, seq_nums
 
-    cursor = conn.cursor(dictionary=True)
-    logger.info("✅ Conexión a base de datos establecida")
-
-    logger.info(f"📊 Archivo leído correctamente con {len(df)} filas y {len(df.columns)} columnas.")
-    
-    # DEBUG: Mostrar todos los SEQ_NUM antes de procesar
-    if 'SEQ_NUM' in df.columns:
-        logger.info(f"🔍 DEBUG - SEQ_NUMs encontrados en Excel (antes de limpiar):")
-        for idx, seq in enumerate(df['SEQ_NUM']):
-            logger.info(f"   Fila {idx}: SEQ_NUM = {seq} (tipo: {type(seq)})")
 
-    # Limpiar valores NaN, None y vacíos primero
-    def clean_value(x):
-        if pd.isna(x):
-            return None
-        if isinstance(x, str):
-            if x.strip().lower() in ["nan", "none", ""]:
-                return None
-        return x
-    
-    df = df.applymap(clean_value)  # applymap aún funciona, aunque está deprecado
-    logger.info("🧹 Datos limpios aplicados (valores NaN, None y vacíos convertidos a None)")
+def validar_antes_de_insertar(df, cursor, logger, archivo_rechazos=None):
+    """
+    Valida todas las filas contra las columnas de LiquidacionesSV antes de escribir.
+    Las inválidas se escriben en archivo_rechazos (CSV con fila y motivos).
+    Retorna la máscara de filas válidas (todas si no se pudo leer la definición de la tabla).
+    """
+    try:
+        definiciones = obtener_definiciones(cursor)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la definición de LiquidacionesSV; se inserta sin validar: {e}")
+        return pd.Series(True, index=df.index).to_numpy()
 
-    # Convertir SEQ_NUM a string DESPUÉS de la limpieza para evitar que pandas lo convierta a float
-    if 'SEQ_NUM' in df.columns:
-        def convert_seq_num(x):
-            if x is None:
-                return None
-            try:
-                # Si es float con .0, convertir a int y luego a string
-                if isinstance(x, float) and x.is_integer():
-                    return str(int(x))
-                # Si ya es int, convertir a string
-                elif isinstance(x, (int, float)):
-                    return str(int(x))
-                # Si ya es string, devolverlo
-                else:
-                    return str(x)
-            except (ValueError, TypeError):
-                return None
-        
-        df['SEQ_NUM'] = df['SEQ_NUM'].apply(convert_seq_num)
-        logger.info("✅ SEQ_NUM convertido a string (sin .0)")
-        
-        # DEBUG: Mostrar todos los SEQ_NUM después de convertir
-        logger.info(f"🔍 DEBUG - SEQ_NUMs después de convertir:")
-        for idx, seq in enumerate(df['SEQ_NUM']):
-            logger.info(f"   Fila {idx}: SEQ_NUM = {seq} (tipo: {type(seq)})")
+    validas, motivos = validar_dataframe(df, definiciones)
+    rechazadas = int((~validas).sum())
+    if rechazadas:
+        for fila in (~validas).nonzero()[0][:20]:
+            logger.warning(f"🚫 Fila {fila + 1} rechazada (SEQ_NUM: {df['SEQ_NUM'].iloc[fila]}): {motivos.iloc[fila]}")
+        if archivo_rechazos:
+            escribir_rechazos(df, validas, motivos, archivo_rechazos)
+            logger.warning(f"🚫 {rechazadas} filas rechazadas por validación; detalle en {archivo_rechazos}")
+        else:
+            logger.warning(f"🚫 {rechazadas} filas rechazadas por validación")
+    else:
+        logger.info("✅ Validación previa: todas las filas cumplen la definición de LiquidacionesSV")
+    return validas
 
-    logger.info("🔍 Vista previa de los datos limpios:")
-    logger.info(f"Primeras 5 filas: {df.head().to_string()}")
 
-    sql = """
-        INSERT INTO LiquidacionesSV (
-            FECHA_TRAN, HORA_TRAN, ID_PAG, SUCURSAL_I, TERMINAL_I, AFILIADO, NOMBRE_COM,
-            EMISOR_ID, PAN, MONTO_TRAN, MONTO_AJUS, MONTO_TEXE, SUBTOTAL, MONTO_IVA,
-            COMISIONAB, COM_PORCEN, COM_MONTO, COM_MTOIVA, RETENCION2, RETENIDO,
-            MONTO_DEBI, DEPOSITO, CCFNO, DCLNO, TIPO_TRANS, MESES_PLZO, PAGADO,
-            BCO_PAGO, NUMCTA, REG_FISCAL, IVA_PORC, APROBAC, TC, TYP, SEQ_NUM,
-            INVOIC_NUM, RESP_CDE, MODO_ENTRA, COMPRADOR, ORDEN_ID
-        )
-        VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
+def insertar_liquidaciones(df, cursor, conn, logger, cursor_lectura=None, registros=None, archivo_rechazos=None):
     """
-
+    Inserta las filas del archivo en LiquidacionesSV omitiendo los SEQ_NUM ya existentes.
+    Antes de escribir se validan todas las filas (ValidarLiquidaciones); las inválidas
+    van al CSV archivo_rechazos y cuentan como errores. Las válidas se insertan en
+    bloques de SERFINSA_INSERT_TAMANO_BLOQUE filas con executemany.
+    Los SEQ_NUM existentes se consultan en bloque antes de insertar (en la réplica si
+    se indica cursor_lectura); los repetidos dentro del mismo archivo se detectan en memoria.
+    registros son los LiquidacionRecord del DataFrame; si no se indican se construyen por
+    bloques de SERFINSA_INSERT_TAMANO_BLOQUE filas a medida que se insertan.
+    Retorna (insertados, omitidos, errores, seq_nums_insertados)
+    """
+    conn = como_unidad_de_trabajo(conn, logger)
     logger.info("🔄 Iniciando proceso de inserción en base de datos...")
     inserted = 0
     skipped = 0
     errors = 0
+    seq_nums_insertados = set()
     
-    for i, row in df.iterrows():
-        seq_num = row["SEQ_NUM"]
-        
-        # DEBUG: Mostrar qué SEQ_NUM se está procesando
-        logger.info(f"🔍 DEBUG - Procesando fila {i}: SEQ_NUM = {seq_num} (tipo: {type(seq_num)})")
-        
-        # Si SEQ_NUM es None, NaN o vacío, permitir insertar sin verificar duplicados
-        if seq_num is not None and not pd.isna(seq_num):
-            # Verificar si el SEQ_NUM ya existe en la base de datos
-            if verificar_seq_num_existe(cursor, seq_num):
-                logger.warning(f"⚠️ SEQ_NUM {seq_num} ya existe en la base de datos. Omitiendo registro...")
-                skipped += 1
+    validas = validar_antes_de_insertar(df, cursor, logger, archivo_rechazos)
+    asegurar_columna_fecha_hora(cursor)
+    
+    seq_nums_archivo = [seq_num for seq_num in df['SEQ_NUM'].tolist() if seq_num is not None]
+    existentes = obtener_seq_nums_existentes(cursor_lectura or cursor, seq_nums_archivo)
+    
+    # Los registros se construyen por bloques del mismo tamaño que los INSERT: solo un
+    # bloque de LiquidacionRecord vive a la vez junto al DataFrame
+    tamano_bloque = int(os.getenv("SERFINSA_INSERT_TAMANO_BLOQUE", "500"))
+    bloques = [registros] if registros is not None else LiquidacionRecord.en_bloques(df, tamano_bloque)
+    for bloque_registros in bloques:
+        a_insertar = []
+        for registro in bloque_registros:
+            i = registro.fila
+            seq_num = registro.SEQ_NUM
+            
+            # DEBUG: Mostrar qué SEQ_NUM se está procesando
+            logger.info(f"🔍 DEBUG - Procesando fila {i}: SEQ_NUM = {seq_num} (tipo: {type(seq_num)})")
+            
+            if not validas[i]:
+                errors += 1
                 continue
+            
+            # Si SEQ_NUM es None o vacío, permitir insertar sin verificar duplicados
+            if seq_num is not None:
+                # Verificar si el SEQ_NUM ya existe en la base de datos (o ya se insertó en este archivo)
+                if seq_num in existentes:
+                    logger.warning(f"⚠️ SEQ_NUM {seq_num} ya existe en la base de datos. Omitiendo registro...")
+                    skipped += 1
+                    continue
+                existentes.add(seq_num)
+            
+            a_insertar.append(registro)
         
-        # Convertir valores NaN a None antes de insertar
-        row_cleaned = tuple(None if pd.isna(val) else val for val in row)
-        
-        try:
-            cursor.execute(sql, row_cleaned)
-            inserted += 1
-            if seq_num is not None and not pd.isna(seq_num):
-                logger.info(f"✅ Registro insertado: SEQ_NUM {seq_num}")
-            else:
-                logger.info(f"✅ Registro insertado sin SEQ_NUM (fila {i + 1})")
-        except Exception as e:
-            errors += 1
-            logger.error(f"❌ Error al insertar fila {i + 1} (SEQ_NUM: {seq_num}): {e}")
-            logger.error(f"➡️ Datos problemáticos: {row_cleaned}")
+        for inicio in range(0, len(a_insertar), tamano_bloque):
+            insertados_bloque, errores_bloque, seq_nums_bloque = _insertar_bloque(
+                cursor, conn, logger, a_insertar[inicio:inicio + tamano_bloque]
+            )
+            inserted += insertados_bloque
+            errors += errores_bloque
+            seq_nums_insertados.update(seq_nums_bloque)
 
-    conn.commit()
-    logger.info("💾 Cambios confirmados en base de datos")
+    conn.confirmar()
+    logger.info(f"💾 Cambios confirmados en base de datos ({conn.commits_realizados} commits)")
     
     log_separator(logger)
     logger.info("📊 RESUMEN DE LA INSERCIÓN:")
@@ -203,47 +187,392 @@ def main():
     logger.info(f"❌ Se encontraron {errors} errores durante la inserción")
     logger.info(f"📝 Total de registros procesados: {len(df)}")
     log_separator(logger)
+    
+    return inserted, skipped, errors, seq_nums_insertados
+
+
+def obtener_seq_nums_existentes(cursor, seq_nums, tamano_bloque=1000):
+    """
+    Devuelve el subconjunto de SEQ_NUM que ya existen en LiquidacionesSV (una consulta por bloque)
+    """
+    seq_nums = list(dict.fromkeys(seq_nums))
+    existentes = set()
+    for inicio in range(0, len(seq_nums), tamano_bloque):
+        bloque = seq_nums[inicio:inicio + tamano_bloque]
+        placeholders = ", ".join(["%s"] * len(bloque))
+        cursor.execute(f"""
+            SELECT SEQ_NUM FROM LiquidacionesSV 
+            WHERE SEQ_NUM IN ({placeholders})
+        """, tuple(bloque))
+        existentes.update(convertir_seq_num(row["SEQ_NUM"]) for row in cursor.fetchall())
+    return existentes
 
+
+def fechas_transaccion(df):
+    """
+    Serie datetime64 con la fecha y hora de cada fila (FECHA_HORA_TRAN, o FECHA_TRAN en
+    DataFrames sin normalizar), o None si el DataFrame no trae fechas
+    """
+    if COLUMNA_FECHA_HORA in df.columns:
+        return pd.to_datetime(df[COLUMNA_FECHA_HORA], errors='coerce')
+    if 'FECHA_TRAN' in df.columns:
+        return interpretar_fechas(df['FECHA_TRAN'])
+    return None
+
+
+def calcular_ventana_fechas(df):
+    """
+    Rango (desde, hasta) de FECHA_HORA_TRAN del archivo (FECHA_TRAN si no está), o
+    (None, None) si no se puede interpretar
+    """
+    fechas = fechas_transaccion(df)
+    if fechas is None:
+        return None, None
+    fechas = fechas.dropna()
+    if fechas.empty:
+        return None, None
+    return fechas.min().to_pydatetime(), fechas.max().to_pydatetime()
+
+
+def construir_filas_respaldo(df, seq_nums, registros=None):
+    """
+    Datos de APROBAC, MONTO_TRAN y FECHA_HORA_TRAN de los SEQ_NUM indicados, para el
+    emparejamiento por código de autorización
+    """
+    if registros is None:
+        # Solo las filas pendientes: no hace falta un registro por cada fila del archivo
+        df = df[df['SEQ_NUM'].isin(list(seq_nums))]
+        registros = LiquidacionRecord.desde_dataframe(df)
+
+    fechas = fechas_transaccion(df)
+    filas = []
+    for registro in registros:
+        if registro.SEQ_NUM not in seq_nums:
+            continue
+        fecha = fechas.iloc[registro.fila]
+        filas.append({
+            'seq_num': registro.SEQ_NUM,
+            # APROBAC puede venir como número desde el Excel (123456.0) o con ceros a la izquierda
+            'aprobac': convertir_aprobac(registro.APROBAC),
+            'monto': registro.MONTO_TRAN,
+            'fecha': None if pd.isna(fecha) else fecha.to_pydatetime(),
+        })
+    return filas
+
+
+def buscar_transacciones_archivo(df, cursor, conn, logger, cursor_lectura=None, registros=None):
+    """
+    Busca el transaction_id de los registros del archivo que existen en LiquidacionesSV.
+    El emparejamiento SEQ_NUM -> referencs se resuelve en memoria con una carga en bloque
+    de las transacciones candidatas (leídas de la réplica si se indica cursor_lectura).
+    Retorna (procesados, encontrados, business_ids) con business_ids {SEQ_NUM: business_id}
+    de los registros emparejados
+    """
     # Buscar transaction_id solo para los registros que se insertaron correctamente y tienen SEQ_NUM
     logger.info("🔍 Iniciando búsqueda de transaction_id para los registros insertados...")
-    processed_transactions = 0
-    transactions_found = 0
     
-    for i, row in df.iterrows():
-        seq_num = row["SEQ_NUM"]
-        
+    seq_nums = []
+    for i, seq_num in enumerate(df["SEQ_NUM"]):
         # Solo procesar si tiene SEQ_NUM válido
         if seq_num is None or pd.isna(seq_num):
             logger.info(f"ℹ️ Registro sin SEQ_NUM (fila {i + 1}) - no se buscará transaction_id ni business_id")
             continue
-        
-        # Solo procesar si el registro existe en la base de datos (fue insertado)
-        if not verificar_seq_num_existe(cursor, seq_num):
-            continue
-            
-        transaction_id = buscar_transaction_id(cursor, conn, seq_num)
-        if transaction_id:
-            logger.info(f"✅ Transaction_id encontrado para SEQ_NUM={seq_num}: {transaction_id}")
-            transactions_found += 1
-        else:
-            logger.warning(f"❌ No se encontró transaction_id para SEQ_NUM={seq_num} - no se asignará business_id ni lote_id")
-        processed_transactions += 1
+        seq_nums.append(seq_num)
+    
+    # Solo procesar los registros que existen en la base de datos (fueron insertados).
+    # Se consulta el primario: la réplica puede no tener aún las filas recién insertadas.
+    existentes = obtener_seq_nums_existentes(cursor, seq_nums)
+    seq_nums = [seq for seq in dict.fromkeys(seq_nums) if seq in existentes]
+    
+    fecha_desde, fecha_hasta = calcular_ventana_fechas(df)
+    if fecha_desde is not None:
+        logger.info(f"📅 Ventana de fechas del archivo: {fecha_desde:%Y-%m-%d} a {fecha_hasta:%Y-%m-%d}")
+    
+    try:
+        resultado = emparejar_transacciones(
+            cursor, conn, seq_nums, fecha_desde, fecha_hasta, cursor_lectura=cursor_lectura
+        )
+    except Exception as e:
+        logger.error(f"❌ Error emparejando transacciones: {e}")
+        return len(seq_nums), 0, {}
+    
+    for seq_num, trx in resultado["encontrados"].items():
+        logger.info(f"✅ Transaction_id encontrado para SEQ_NUM={seq_num}: {trx['transaction_id']}")
+    for seq_num, candidatos in resultado["ambiguos"].items():
+        ids = ", ".join(str(trx["transaction_id"]) for trx in candidatos)
+        logger.warning(f"⚠️ SEQ_NUM={seq_num} ambiguo: {len(candidatos)} transacciones con la misma referencia ({ids}) - no se asigna")
+    
+    # Segundo paso: código de autorización + monto + fecha para las filas sin match único
+    pendientes = set(resultado["sin_match"]) | set(resultado["ambiguos"])
+    encontrados_autorizacion = {}
+    sin_match = resultado["sin_match"]
+    if pendientes:
+        logger.info(f"🔁 Reintentando {len(pendientes)} SEQ_NUM por código de autorización, monto y fecha...")
+        try:
+            respaldo = emparejar_por_codigo_autorizacion(
+                cursor, conn, construir_filas_respaldo(df, pendientes, registros), cursor_lectura=cursor_lectura
+            )
+            encontrados_autorizacion = respaldo["encontrados"]
+            for seq_num, (trx, confianza) in encontrados_autorizacion.items():
+                logger.info(f"✅ Transaction_id encontrado por autorización para SEQ_NUM={seq_num}: {trx['transaction_id']} (confianza {confianza})")
+            for seq_num, motivo in respaldo["descartados"].items():
+                logger.warning(f"⚠️ SEQ_NUM={seq_num} sin asignar por autorización ({motivo})")
+            sin_match = [seq for seq in sin_match if seq not in encontrados_autorizacion]
+        except Exception as e:
+            logger.error(f"❌ Error en el emparejamiento por código de autorización: {e}")
+    
+    for seq_num in sin_match:
+        logger.warning(f"❌ No se encontró transaction_id para SEQ_NUM={seq_num} - no se asignará business_id ni lote_id")
+    
+    processed_transactions = len(seq_nums)
+    transactions_found = len(resultado["encontrados"]) + len(encontrados_autorizacion)
     
     logger.info(f"📋 Se procesaron {processed_transactions} registros para buscar transaction_id")
     logger.info(f"🎯 Se encontraron {transactions_found} transaction_id válidos")
+    if resultado["ambiguos"]:
+        logger.warning(f"⚠️ {len(resultado['ambiguos'])} SEQ_NUM con referencias ambiguas")
+    
+    stats_cache = estadisticas_cache_transacciones()
+    logger.info(
+        f"🗃️ Caché de transacciones: {stats_cache['hits']} hits "
+        f"({stats_cache['hits_negativos']} negativos), {stats_cache['misses']} misses, "
+        f"{stats_cache['entradas']} entradas"
+    )
     
+    business_ids = {seq: trx.get("business_id") for seq, trx in resultado["encontrados"].items()}
+    business_ids.update(
+        (seq, trx.get("business_id")) for seq, (trx, _) in encontrados_autorizacion.items()
+    )
+    
+    return processed_transactions, transactions_found, business_ids
+
+
+def construir_lote_enriquecido(df, seq_nums_insertados, business_ids):
+    """
+    Filas del archivo insertadas en esta ejecución y emparejadas, con su business_id,
+    para calcular los lotes en memoria
+    """
+    mascara = df["SEQ_NUM"].isin(seq_nums_insertados) & ~df["SEQ_NUM"].duplicated(keep="first")
+    lote = df[mascara].copy()
+    lote["business_id"] = lote["SEQ_NUM"].map(business_ids)
+    return lote[lote["business_id"].notna()]
+
+
+def crear_lotes(cursor, conn, logger, df_lote=None, workers=None):
+    """
+    Crea los lotes agrupados por business_id. Retorna (success, lotes_creados)
+    workers: hilos para crear los lotes por business_id en paralelo (por defecto
+    SERFINSA_LOTES_WORKERS; ver CrearLotes.crear_lotes_por_business_id).
+    Si se indica df_lote y SERFINSA_LOTES_EN_MEMORIA=1, los totales de esas filas se
+    calculan en memoria (verificados contra la base de datos con SERFINSA_LOTES_VERIFICAR=1);
+    el resto de registros pendientes se agrupa con la consulta SQL habitual.
+    """
     log_separator(logger)
     logger.info("📦 Iniciando creación de lotes por business_id...")
     
-    # Crear lotes agrupados por business_id
-    success, lotes_creados = crear_lotes_por_business_id(cursor, conn, logger)
+    lotes_memoria = 0
+    if df_lote is not None and os.getenv("SERFINSA_LOTES_EN_MEMORIA", "0") == "1":
+        verificar = os.getenv("SERFINSA_LOTES_VERIFICAR", "0") == "1"
+        # Solo los lotes nuevos cuentan como creados; los existentes solo suman totales
+        ok, _, lotes_memoria = crear_lotes_desde_dataframe(cursor, conn, df_lote, logger, verificar=verificar)
+        if not ok:
+            logger.warning("⚠️ No se usaron los totales en memoria; se agrupa desde la base de datos")
+    
+    success, lotes_creados = crear_lotes_por_business_id(cursor, conn, logger, workers)
+    lotes_creados += lotes_memoria
     
     if success:
         logger.info(f"✅ Proceso de creación de lotes completado. Lotes creados/actualizados: {lotes_creados}")
     else:
         logger.error("❌ Error en el proceso de creación de lotes")
+    
+    return success, lotes_creados
+
+
+def enviar_notificacion(excel_file_path, log_file_path, summary_stats, processing_time_formatted, logger):
+    """
+    Envía el email de notificación con el resumen del procesamiento.
+    Con SERFINSA_NOTIFICACION_DIGEST=1 el resumen se deja en la cola del digest y solo se
+    envía (agrupado con los de otros archivos) cuando se cumple la ventana.
+    """
+    notification_email = os.getenv("NOTIFICATION_EMAIL")
+    if not notification_email:
+        logger.warning("⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
+        return False
+    
+    # Solo se adjunta lo registrado por esta ejecución, no el log acumulado
+    segmento_log = None
+    try:
+        segmento_log = extraer_segmento_ejecucion(logger)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo extraer el segmento del log de esta ejecución: {e}")
+    
+    if digest_activo():
+        try:
+            encolar(
+                "archivo",
+                os.path.basename(excel_file_path),
+                dict(summary_stats, processing_time=processing_time_formatted),
+                [segmento_log or log_file_path, excel_file_path],
+                run_id=obtener_run_id(logger),
+            )
+            logger.info("📥 Resumen agregado a la cola de notificaciones agrupadas")
+            enviar_digest(logger)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error agregando el resumen a la cola de notificaciones: {e}")
+            return False
+        finally:
+            if segmento_log:
+                os.remove(segmento_log)
+    
+    logger.info("📧 Enviando email de notificación...")
+    
+    email_sender = EmailSender()
+    subject = f"Reporte de Procesamiento Serfinsa - {os.path.basename(excel_file_path)}"
+    body = email_sender.create_email_body(
+        os.path.basename(excel_file_path), 
+        summary_stats, 
+        processing_time_formatted
+    )
+    
+    success, message = email_sender.send_notification_email(
+        notification_email, 
+        subject, 
+        body, 
+        segmento_log or log_file_path,
+        excel_file_path
+    )
+    if segmento_log:
+        os.remove(segmento_log)
+    
+    if success:
+        logger.info("✅ Email de notificación enviado exitosamente")
+    else:
+        logger.error(f"❌ Error enviando email: {message}")
+    return success
+
+
+def main(excel_file_path=None, ejecutar_conciliacion=True, archivar=None):
+    """
+    Procesa un archivo de liquidación completo: inserción, búsqueda de transaction_id,
+    creación de lotes, notificación y (opcionalmente) búsqueda de transacciones faltantes.
+    Si no se indica excel_file_path se procesa el archivo más reciente del directorio de datos.
+    Con archivar (por defecto SERFINSA_ARCHIVAR) una re-subida de un archivo ya archivado
+    se rechaza sin leerla (retorna None) y el archivo se mueve al archivo
+    (archivo_procesados) solo si todas las etapas terminaron sin errores.
+    """
+    if archivar is None:
+        archivar = archivado_activo()
+
+    # Registrar tiempo de inicio
+    start_time = time.time()
+    start_datetime = datetime.now()
+    
+    if excel_file_path is None:
+        excel_file_path, search_path = buscar_archivo_pendiente()
+        if not excel_file_path:
+            print("No se encontró ningún archivo Excel para procesar.")
+            enviar_alerta_sin_archivo(search_path)
+            return
+    
+    if archivar:
+        archivado = rechazar_si_duplicado(excel_file_path)
+        if archivado:
+            print(f"⛔ {excel_file_path} es idéntico a {archivado['nombre']} (procesado el "
+                  f"{archivado['archivado']}, {archivado['ruta_archivo']}); se descarta sin procesar")
+            return None
+    
+    logger, log_file_path = setup_logger(excel_file_path)
+    
+    # Duración por etapa e idas y vueltas a la BD para el historial de ejecuciones;
+    # con SERFINSA_PROFILE=1 cada etapa además se perfila (archivos junto al log)
+    perfilador = crear_perfilador(log_file_path, obtener_run_id(logger))
+    medidor = MedidorEjecucion(excel_file_path, obtener_run_id(logger), perfilador)
+    
+    with medidor.etapa("lectura"):
+        df = leer_archivo_encontrado(excel_file_path)
+    if df is None:
+        print(f"No se pudo leer el archivo {excel_file_path}.")
+        return
+    
+    log_separator(logger, "=" * 60)
+    logger.info(f"🚀 INICIANDO PROCESAMIENTO DE ARCHIVO: {excel_file_path}")
+    logger.info(f"📝 Archivo de log: {log_file_path} (ejecución {obtener_run_id(logger)})")
+    logger.info(f"⏰ Fecha y hora de inicio: {start_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+    log_separator(logger)
+    
+    conn = create_connection()
+    if not conn:
+        logger.error("❌ No se pudo conectar a la base de datos.")
+        registrar_ejecucion(medidor, {'total_processed': len(df)}, time.time() - start_time, logger, exito=False)
+        return
+
+    # Todas las etapas confirman a través de la unidad de trabajo (commits agrupados)
+    conn = UnidadDeTrabajo(conn, logger=logger)
+    cursor = medidor.medir_cursor(conn.cursor(dictionary=True))
+    logger.info("✅ Conexión a base de datos establecida")
+
+    # Lecturas pesadas (existencia de SEQ_NUM, transactions) a la réplica si está disponible
+    conn_lectura = create_read_connection(fallback=False)
+    cursor_lectura = medidor.medir_cursor(conn_lectura.cursor(dictionary=True)) if conn_lectura else None
+    if conn_lectura:
+        logger.info("✅ Conexión de lectura a la réplica establecida")
+
+    logger.info(f"📊 Archivo leído correctamente con {len(df)} filas y {len(df.columns)} columnas.")
+    
+    # La limpieza de valores vacíos y la conversión de SEQ_NUM a string se hacen en
+    # ReadFile.normalizar_dataframe (resultado cacheado entre ejecuciones)
+    logger.info("🧹 Datos normalizados (valores NaN, None y vacíos como nulos, SEQ_NUM como string)")
+
+    # DEBUG: Mostrar todos los SEQ_NUM normalizados
+    if 'SEQ_NUM' in df.columns:
+        logger.info(f"🔍 DEBUG - SEQ_NUMs normalizados:")
+        for idx, seq in enumerate(df['SEQ_NUM']):
+            logger.info(f"   Fila {idx}: SEQ_NUM = {seq} (tipo: {type(seq)})")
+
+    logger.info("🔍 Vista previa de los datos limpios:")
+    logger.info(f"Primeras 5 filas: {df.head().to_string()}")
+
+    # Filas de archivos anteriores que siguen sin transacción (sincronización tardía):
+    # las que se emparejen ahora entran en la creación de lotes de esta ejecución
+    if os.getenv("SERFINSA_REINTENTOS", "1") == "1":
+        with medidor.etapa("reintentos"):
+            try:
+                reintentar_pendientes(cursor, conn, logger)
+            except Exception as e:
+                logger.error(f"❌ Error reintentando el emparejamiento de filas pendientes: {e}")
+                conn.rollback()
+
+    with medidor.etapa("insercion"):
+        try:
+            inserted, skipped, errors, seq_nums_insertados = insertar_liquidaciones(
+                df, cursor, conn, logger, cursor_lectura,
+                archivo_rechazos=os.path.splitext(log_file_path)[0] + "_rechazados.csv",
+            )
+        except RuntimeError as e:
+            # El archivo no se archiva: el siguiente intento omite los SEQ_NUM ya confirmados
+            logger.error(f"❌ Inserción interrumpida: {e}")
+            conn.close()
+            if conn_lectura:
+                conn_lectura.close()
+            registrar_ejecucion(medidor, {'total_processed': len(df)}, time.time() - start_time, logger, exito=False)
+            return
+
+    with medidor.etapa("emparejamiento"):
+        processed_transactions, transactions_found, business_ids = buscar_transacciones_archivo(
+            df, cursor, conn, logger, cursor_lectura
+        )
+        conn.confirmar()
+    
+    with medidor.etapa("lotes"):
+        df_lote = construir_lote_enriquecido(df, seq_nums_insertados, business_ids)
+        success, lotes_creados = crear_lotes(cursor, conn, logger, df_lote)
 
     conn.close()
+    medidor.commits = conn.commits_realizados
+    if conn_lectura:
+        conn_lectura.close()
     logger.info("🔌 Conexión a base de datos cerrada")
     
     # Calcular tiempo total de procesamiento
@@ -264,37 +593,34 @@ def main():
     }
     
     # Enviar email de notificación
-    notification_email = os.getenv("NOTIFICATION_EMAIL")
-    if notification_email:
-        logger.info("📧 Enviando email de notificación...")
-        
-        email_sender = EmailSender()
-        subject = f"Reporte de Procesamiento Serfinsa - {os.path.basename(excel_file_path)}"
-        body = email_sender.create_email_body(
-            os.path.basename(excel_file_path), 
-            summary_stats, 
-            processing_time_formatted
-        )
-        
-        success, message = email_sender.send_notification_email(
-            notification_email, 
-            subject, 
-            body, 
-            log_file_path,
-            excel_file_path
-        )
-        
-        if success:
-            logger.info("✅ Email de notificación enviado exitosamente")
-        else:
-            logger.error(f"❌ Error enviando email: {message}")
-    else:
-        logger.warning("⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
+    with medidor.etapa("notificacion"):
+        enviar_notificacion(excel_file_path, log_file_path, summary_stats, processing_time_formatted, logger)
+    
+    # Historial de ejecuciones y alerta si alguna etapa va mucho más lenta de lo habitual.
+    # Las ejecuciones con errores de inserción o sin lotes no cuentan para la línea base.
+    exito = success and errors == 0
+    registrar_ejecucion(medidor, summary_stats, processing_time, logger, exito=exito)
+    if perfilador:
+        logger.info(f"🔬 Perfil de la ejecución: {perfilador.finalizar()}")
+    
+    # El directorio de datos queda solo con pendientes; el hash evita reprocesar re-subidas.
+    # Con errores o sin lotes el archivo se queda para el siguiente intento.
+    if archivar and not exito:
+        logger.warning(f"⚠️ {excel_file_path} no se archiva: el procesamiento terminó con errores")
+    elif archivar:
+        try:
+            ruta_archivada = archivar_archivo(excel_file_path, obtener_run_id(logger))
+            logger.info(f"📦 Archivo procesado archivado en {ruta_archivada}")
+        except Exception as e:
+            logger.error(f"❌ No se pudo archivar {excel_file_path}: {e}")
     
     log_separator(logger)
     logger.info("🏁 PROCESAMIENTO PRINCIPAL COMPLETADO EXITOSAMENTE")
     log_separator(logger, "=" * 60)
     
+    if not ejecutar_conciliacion:
+        return summary_stats
+    
     # Ejecutar búsqueda de transacciones faltantes
     logger.info("🔍 Iniciando búsqueda de transacciones faltantes...")
     try:
@@ -307,6 +633,8 @@ def main():
     log_separator(logger)
     logger.info("🏁 PROCESAMIENTO COMPLETO FINALIZADO")
     log_separator(logger, "=" * 60)
+    
+    return summary_stats
 
 if __name__ == "__main__":
     main()
@@ -1,42 +1,204 @@
 import os
 import glob
-import pandas as pd
+import re
+from cache_parseo import calcular_clave, cargar_desde_cache, guardar_en_cache
+from fecha_hora_transaccion import COLUMNA_FECHA_HORA, combinar_fecha_hora
+from lectores import leer_archivo, patrones_soportados
 
-def buscar_y_leer_excel():
+# Versión del esquema de normalización. Cambiarla invalida la caché de parseo.
+ESQUEMA_NORMALIZACION = 7
+
+
+def convertir_seq_num(x):
+    """
+    Convierte SEQ_NUM a string sin .0 para evitar que pandas lo trate como float. El
+    texto se conserva tal cual (con sus ceros a la izquierda, como está en la base);
+    solo se quita un .0 final ("000123.0" queda como "000123")
+    """
+    import pandas as pd
+
+    if x is None or pd.isna(x):
+        return None
+    try:
+        # Si es float con .0, convertir a int y luego a string
+        if isinstance(x, float) and x.is_integer():
+            return str(int(x))
+        # Si ya es int, convertir a string
+        elif isinstance(x, (int, float)):
+            return str(int(x))
+        # Si es texto, solo quitar un .0 final
+        texto = str(x)
+        entero = re.fullmatch(r"(\d+)\.0+", texto.strip())
+        return entero.group(1) if entero else texto
+    except (ValueError, TypeError):
+        return None
+
+
+def convertir_aprobac(x):
+    """
+    Convierte el código de autorización (APROBAC) a texto sin espacios: los ceros a la
+    izquierda se conservan ("012345" no es el mismo código que "12345"); si llegó como
+    número entero (celda numérica del Excel) se quita el .0
+    """
+    import pandas as pd
+
+    if x is None or pd.isna(x):
+        return None
+    if isinstance(x, float) and x.is_integer():
+        return str(int(x))
+    texto = str(x).strip()
+    entero = re.fullmatch(r"(\d+)\.0+", texto)
+    return (entero.group(1) if entero else texto) or None
+
+
+def convertir_texto(x):
+    """
+    Convierte un valor de una columna de tipos mezclados a string (los números enteros
+    sin .0, como SEQ_NUM); los nulos quedan como None
+    """
+    import pandas as pd
+
+    if x is None or pd.isna(x):
+        return None
+    if isinstance(x, float) and x.is_integer():
+        return str(int(x))
+    return str(x)
+
+
+def texto_como_object(df):
+    """
+    Deja las columnas de texto con dtype object y nulos None, igual al leer el archivo
+    que al cargarlo de la caché (Arrow y pandas 3 devuelven el texto como dtype string)
+    """
+    import pandas as pd
+
+    texto = [col for col in df.columns if df[col].dtype == object or pd.api.types.is_string_dtype(df[col])]
+    if texto:
+        df[texto] = df[texto].astype(object).where(df[texto].notna(), None)
+    return df
+
+
+def normalizar_dataframe(df):
+    """
+    Normaliza el DataFrame leído del archivo:
+    - strings vacíos, "nan" y "none" se convierten en nulos
+    - SEQ_NUM y APROBAC se convierten a string (sin .0, conservando los ceros del texto)
+    - las columnas de texto quedan como object; las de tipos mezclados (p. ej. APROBAC
+      con números y texto) todas como string, para que la caché de parseo (Arrow) pueda
+      guardarlas
+    - FECHA_TRAN y HORA_TRAN se combinan en FECHA_HORA_TRAN (datetime64)
+    """
+    import pandas as pd
+
+    df = df.copy()
+
+    for col in df.columns:
+        serie = df[col]
+        if serie.dtype == object or pd.api.types.is_string_dtype(serie):
+            es_texto = serie.map(lambda x: isinstance(x, str))
+            vacios = es_texto & serie.astype(str).str.strip().str.lower().isin(["nan", "none", ""])
+            if vacios.any():
+                df[col] = serie.mask(vacios)
+
+    if 'SEQ_NUM' in df.columns:
+        df['SEQ_NUM'] = df['SEQ_NUM'].map(convertir_seq_num).astype(object)
+    if 'APROBAC' in df.columns:
+        df['APROBAC'] = df['APROBAC'].map(convertir_aprobac).astype(object)
 
+    for col in df.columns:
+        serie = df[col]
+        if serie.dtype == object and serie.dropna().map(type).nunique() > 1:
+            df[col] = serie.map(convertir_texto).astype(object)
 
+    if 'FECHA_TRAN' in df.columns:
+        horas = df['HORA_TRAN'] if 'HORA_TRAN' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        df[COLUMNA_FECHA_HORA] = combinar_fecha_hora(df['FECHA_TRAN'], horas).to_numpy()
+
+    return texto_como_object(df)
+
+
+def leer_archivo_normalizado(file_path):
+    """
+    Lee y normaliza el archivo de liquidación (xlsx, csv, tsv o csv.gz) con el lector
+    registrado para su formato. Si ya fue parseado antes (mismo contenido y misma
+    versión de esquema) se carga desde la caché sin volver a parsear.
+    """
+    clave = calcular_clave(file_path, ESQUEMA_NORMALIZACION)
+
+    df = cargar_desde_cache(clave)
+    if df is not None:
+        print(f"⚡ Archivo cargado desde caché de parseo ({clave})")
+        return texto_como_object(df)
+
+    df, lector = leer_archivo(file_path)
+    print(f"📖 Archivo parseado con el lector '{lector}'")
+    df = normalizar_dataframe(df)
+    guardar_en_cache(clave, df, ESQUEMA_NORMALIZACION)
+    return df
+
+
+def obtener_directorio_datos():
+    """
+    Directorio donde el procesador deja los archivos de liquidación
+    """
     if os.path.exists("/var/www/vhosts/serfinsa.qpaypro.com/data"):
-        base_path = "/var/www/vhosts/serfinsa.qpaypro.com/data"
-    else:
-        base_path = os.path.join(os.getcwd(), "data")
+        return "/var/www/vhosts/serfinsa.qpaypro.com/data"
+    return os.path.join(os.getcwd(), "data")
 
-    pattern = os.path.join(base_path, "**", "Serfinsa*.xlsx")
+
+def buscar_archivo_pendiente():
+    """
+    Busca el archivo de liquidación más reciente sin leerlo (no importa pandas).
+    Retorna (ruta_archivo o None, directorio_de_busqueda)
+    """
+    base_path = obtener_directorio_datos()
+    patrones = patrones_soportados()
 
     print(f"Buscando archivos en: {base_path}")
-    files_found = glob.glob(pattern, recursive=True)
+    files_found = []
+    for patron in patrones:
+        files_found.extend(glob.glob(os.path.join(base_path, "**", patron), recursive=True))
 
     if not files_found:
-        print(f"No se encontró ningún archivo Excel con el patrón 'Serfinsa*.xlsx' dentro de {base_path}/")
-        return None, None, base_path
+        print(f"No se encontró ningún archivo con los patrones {', '.join(patrones)} dentro de {base_path}/")
+        return None, base_path
 
     files_found.sort(key=os.path.getmtime, reverse=True)
     excel_file = files_found[0]
 
     print(f"Archivo encontrado: {excel_file}")
+    return excel_file, base_path
 
+
+def leer_archivo_encontrado(excel_file):
+    """
+    Lee y normaliza un archivo concreto. Retorna el DataFrame o None si falla.
+    """
     try:
-        df = pd.read_excel(excel_file, engine="openpyxl")
+        df = leer_archivo_normalizado(excel_file)
         print(f"Archivo leído correctamente ({len(df)} filas, {len(df.columns)} columnas).")
         print(df.head())  # muestra solo primeras filas
-        
-        # DEBUG: Mostrar todos los SEQ_NUM tal como vienen del Excel
+
+        # DEBUG: Mostrar todos los SEQ_NUM tal como quedaron tras la normalización
         if 'SEQ_NUM' in df.columns:
-            print(f"\n🔍 DEBUG ReadFile - SEQ_NUMs encontrados en Excel (raw):")
+            print(f"\n🔍 DEBUG ReadFile - SEQ_NUMs encontrados en el archivo (normalizados):")
             for idx, seq in enumerate(df['SEQ_NUM']):
                 print(f"   Fila {idx}: SEQ_NUM = {seq} (tipo: {type(seq)}, valor raw: {repr(seq)})")
-        
-        return df, excel_file, base_path
+
+        return df
 
     except Exception as e:
-        print(f"Error al leer el archivo Excel: {e}")
+        print(f"Error al leer el archivo: {e}")
+        return None
+
+
+def buscar_y_leer_excel():
+    excel_file, base_path = buscar_archivo_pendiente()
+    if not excel_file:
+        return None, None, base_path
+
+    df = leer_archivo_encontrado(excel_file)
+    if df is None:
         return None, None, base_path
+
+    return df, excel_file, base_path
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Reintento de las liquidaciones que quedaron sin emparejar (qpay_transac_id IS NULL).
+
+Cuando la transacción llega a transactions después de procesar el archivo (sincronización
+tardía), la fila de LiquidacionesSV no se volvía a buscar y quedaba sin business_id ni
+lote_id. Esta etapa recorre esas filas por bloques (paginando por SEQ_NUM) y las empareja
+con las mismas consultas de conjunto del archivo: SEQ_NUM -> referencs y, para las que
+no aparecen, código de autorización + monto + fecha.
+
+Cada fila lleva su número de intentos (match_intentos) y la fecha del próximo intento
+(match_proximo_intento), con espera exponencial: SERFINSA_REINTENTOS_ESPERA_MINUTOS * 2^(n-1)
+hasta SERFINSA_REINTENTOS_ESPERA_MAX_HORAS. Tras SERFINSA_REINTENTOS_MAX_INTENTOS intentos
+la fila deja de buscarse. Las filas emparejadas quedan con business_id y sin lote_id, de
+modo que la creación de lotes siguiente las incluye.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+
+from BuscarTransaccion import (
+    asegurar_columnas_transaccion,
+    emparejar_por_codigo_autorizacion,
+    emparejar_transacciones,
+    limpiar_cache_transacciones,
+)
+from dialectos import obtener_dialecto
+from fecha_hora_transaccion import asegurar_columna_fecha_hora
+from unidad_trabajo import como_unidad_de_trabajo
+
+load_dotenv()
+
+# Columnas de LiquidacionesSV para el seguimiento de los reintentos
+COLUMNAS_REINTENTO = [
+    ("match_intentos", "INT NOT NULL DEFAULT 0"),
+    ("match_proximo_intento", "DATETIME NULL"),
+]
+INDICE_REINTENTO = "idx_liquidaciones_proximo_intento"
+
+
+def _entero_env(nombre, por_defecto):
+    try:
+        return int(os.getenv(nombre, str(por_defecto)))
+    except ValueError:
+        return por_defecto
+
+
+def asegurar_columnas_reintento(cursor):
+    """
+    Agrega a LiquidacionesSV match_intentos y match_proximo_intento (con índice) si no existen
+    """
+    asegurar_columnas_transaccion(cursor)
+    asegurar_columna_fecha_hora(cursor)
+    dialecto = obtener_dialecto(cursor)
+    existentes = set(dialecto.columnas_tabla(cursor, "LiquidacionesSV"))
+    for columna, definicion in COLUMNAS_REINTENTO:
+        if columna not in existentes:
+            dialecto.agregar_columna(
+                cursor, "LiquidacionesSV", columna, definicion,
+                indice=INDICE_REINTENTO if columna == "match_proximo_intento" else None,
+            )
+            print(f"✅ Columna {columna} agregada a la tabla LiquidacionesSV")
+
+
+def calcular_proximo_intento(intentos, ahora, espera_minutos, espera_max_horas):
+    """
+    Fecha del siguiente intento tras el intento número `intentos` (espera exponencial con tope)
+    """
+    espera = min(espera_minutos * 2 ** (intentos - 1), espera_max_horas * 60)
+    return ahora + timedelta(minutes=espera)
+
+
+def obtener_bloque_pendiente(cursor, desde_seq_num, ahora, max_intentos, tamano):
+    """
+    Siguiente bloque de filas sin qpay_transac_id cuyo próximo intento ya venció,
+    ordenadas por SEQ_NUM a partir de desde_seq_num (exclusivo)
+    """
+    cursor.execute("""
+        SELECT SEQ_NUM, APROBAC, MONTO_TRAN, FECHA_TRAN, FECHA_HORA_TRAN, match_intentos
+        FROM LiquidacionesSV
+        WHERE qpay_transac_id IS NULL
+        AND SEQ_NUM IS NOT NULL
+        AND SEQ_NUM > %s
+        AND match_intentos < %s
+        AND (match_proximo_intento IS NULL OR match_proximo_intento <= %s)
+        ORDER BY SEQ_NUM
+        LIMIT %s
+    """, (desde_seq_num, max_intentos, ahora, tamano))
+    return cursor.fetchall()
+
+
+def _a_fecha_hora(valor):
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime.combine(valor, datetime.min.time())
+    return None
+
+
+def _fecha_fila(fila):
+    """
+    FECHA_HORA_TRAN de la fila, o FECHA_TRAN si aún no se completó
+    """
+    return _a_fecha_hora(fila["FECHA_HORA_TRAN"]) or _a_fecha_hora(fila["FECHA_TRAN"])
+
+
+def reintentar_bloque(cursor, conn, filas, logger):
+    """
+    Empareja un bloque de filas pendientes. Retorna el conjunto de SEQ_NUM emparejados.
+    """
+    seq_nums = [str(fila["SEQ_NUM"]) for fila in filas]
+    fechas = [fecha for fecha in (_fecha_fila(fila) for fila in filas) if fecha]
+    fecha_desde, fecha_hasta = (min(fechas), max(fechas)) if fechas else (None, None)
+
+    resultado = emparejar_transacciones(cursor, conn, seq_nums, fecha_desde, fecha_hasta)
+    emparejados = set(resultado["encontrados"])
+
+    pendientes = set(resultado["sin_match"]) | set(resultado["ambiguos"])
+    if pendientes:
+        from ReadFile import convertir_aprobac
+
+        respaldo = emparejar_por_codigo_autorizacion(cursor, conn, [
+            {
+                "seq_num": str(fila["SEQ_NUM"]),
+                "aprobac": convertir_aprobac(fila["APROBAC"]),
+                "monto": fila["MONTO_TRAN"],
+                "fecha": _fecha_fila(fila),
+            }
+            for fila in filas if str(fila["SEQ_NUM"]) in pendientes
+        ])
+        emparejados.update(respaldo["encontrados"])
+        for seq_num, motivo in respaldo["descartados"].items():
+            logger.info(f"ℹ️ SEQ_NUM={seq_num} sigue sin asignar ({motivo})")
+
+    return emparejados
+
+
+def reprogramar_intentos(cursor, filas, ahora, espera_minutos, espera_max_horas):
+    """
+    Suma un intento a las filas que siguieron sin emparejar y fija su próximo intento
+    (un UPDATE en bloque por SEQ_NUM). Retorna las filas actualizadas.
+    """
+    if not filas:
+        return 0
+    asignaciones = []
+    for fila in filas:
+        intentos = (fila["match_intentos"] or 0) + 1
+        asignaciones.append((
+            str(fila["SEQ_NUM"]), intentos,
+            calcular_proximo_intento(intentos, ahora, espera_minutos, espera_max_horas),
+        ))
+    return obtener_dialecto(cursor).actualizar_desde_filas(
+        cursor, "LiquidacionesSV", ("SEQ_NUM", "seq_num"),
+        ["seq_num", "intentos", "proximo"], asignaciones,
+        {"match_intentos": "intentos", "match_proximo_intento": "proximo"},
+        condicion="t.qpay_transac_id IS NULL",
+    )
+
+
+def reintentar_pendientes(cursor, conn, logger, max_filas=None, tamano_bloque=None):
+    """
+    Reintenta el emparejamiento de las liquidaciones sin qpay_transac_id cuyo próximo
+    intento ya venció, hasta max_filas filas (SERFINSA_REINTENTOS_MAX_FILAS).
+    Retorna dict con 'revisados', 'emparejados', 'reprogramados' y 'agotados'
+    (filas que alcanzaron el máximo de intentos en esta pasada).
+    """
+    if max_filas is None:
+        max_filas = _entero_env("SERFINSA_REINTENTOS_MAX_FILAS", 5000)
+    if tamano_bloque is None:
+        tamano_bloque = _entero_env("SERFINSA_REINTENTOS_TAMANO_BLOQUE", 500)
+    max_intentos = _entero_env("SERFINSA_REINTENTOS_MAX_INTENTOS", 10)
+    espera_minutos = _entero_env("SERFINSA_REINTENTOS_ESPERA_MINUTOS", 30)
+    espera_max_horas = _entero_env("SERFINSA_REINTENTOS_ESPERA_MAX_HORAS", 72)
+
+    conn = como_unidad_de_trabajo(conn, logger)
+    resumen = {"revisados": 0, "emparejados": 0, "reprogramados": 0, "agotados": 0}
+
+    asegurar_columnas_reintento(cursor)
+    conn.confirmar()
+    # La caché negativa guarda justo las búsquedas que ahora se reintentan
+    limpiar_cache_transacciones()
+
+    ahora = datetime.now().replace(microsecond=0)
+    ultimo_seq_num = ""
+    while resumen["revisados"] < max_filas:
+        filas = obtener_bloque_pendiente(
+            cursor, ultimo_seq_num, ahora, max_intentos,
+            min(tamano_bloque, max_filas - resumen["revisados"]),
+        )
+        if not filas:
+            break
+        ultimo_seq_num = str(filas[-1]["SEQ_NUM"])
+        resumen["revisados"] += len(filas)
+
+        emparejados = reintentar_bloque(cursor, conn, filas, logger)
+        sin_emparejar = [fila for fila in filas if str(fila["SEQ_NUM"]) not in emparejados]
+        resumen["emparejados"] += len(emparejados)
+        resumen["reprogramados"] += reprogramar_intentos(
+            cursor, sin_emparejar, ahora, espera_minutos, espera_max_horas
+        )
+        resumen["agotados"] += sum(
+            1 for fila in sin_emparejar if (fila["match_intentos"] or 0) + 1 >= max_intentos
+        )
+        conn.confirmar()
+
+    logger.info(
+        f"🔁 Reintentos de emparejamiento: {resumen['revisados']} filas revisadas, "
+        f"{resumen['emparejados']} emparejadas, {resumen['reprogramados']} reprogramadas"
+        + (f", {resumen['agotados']} sin más intentos" if resumen["agotados"] else "")
+    )
+    return resumen
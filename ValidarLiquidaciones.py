@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Validación de las filas del archivo antes de insertarlas en LiquidacionesSV.
+
+Las 40 columnas se revisan por columna (operaciones vectorizadas de pandas, no fila por
+fila) contra la definición real de la tabla: tipo numérico y rango de DECIMAL(p,s) y
+enteros, longitud de VARCHAR/CHAR, fechas de FECHA_TRAN (y de cualquier columna DATE o
+DATETIME), formato de HORA_TRAN y columnas NOT NULL. Las filas inválidas no llegan al
+INSERT: se escriben en un CSV de rechazos con el número de fila y los motivos.
+"""
+
+import os
+
+import pandas as pd
+
+from dialectos import obtener_dialecto
+from fecha_hora_transaccion import interpretar_fechas, partes_hora
+from lectores import COLUMNAS_LIQUIDACION
+
+TIPOS_ENTEROS = {
+    "tinyint": 2 ** 7, "smallint": 2 ** 15, "mediumint": 2 ** 23,
+    "int": 2 ** 31, "integer": 2 ** 31, "bigint": 2 ** 63,
+}
+TIPOS_DECIMALES = ("decimal", "numeric")
+TIPOS_FLOTANTES = ("float", "double", "real")
+TIPOS_TEXTO = ("varchar", "char", "text", "tinytext", "mediumtext")
+TIPOS_FECHA = ("date", "datetime", "timestamp")
+
+# Evita consultar INFORMATION_SCHEMA en cada archivo
+_definiciones_cache = {}
+
+
+def obtener_definiciones(cursor, tabla="LiquidacionesSV"):
+    """
+    Definiciones de columnas de la tabla (cacheadas por proceso)
+    """
+    if tabla not in _definiciones_cache:
+        _definiciones_cache[tabla] = obtener_dialecto(cursor).definiciones_columnas(cursor, tabla)
+    return _definiciones_cache[tabla]
+
+
+def _marcar(motivos, invalidas, texto):
+    """
+    Agrega el motivo a las filas marcadas como inválidas
+    """
+    if invalidas.any():
+        motivos[invalidas] = motivos[invalidas] + texto + "; "
+
+
+def _validar_hora(serie, presentes):
+    """
+    Filas con HORA_TRAN que no se puede interpretar como hora del día
+    """
+    invalidas = pd.Series(False, index=serie.index)
+    invalidas[presentes] = partes_hora(serie[presentes])["hora"].isna()
+    return invalidas
+
+
+def validar_dataframe(df, definiciones):
+    """
+    Valida las columnas de LiquidacionesSV del DataFrame normalizado.
+    Retorna (validas, motivos): máscara booleana de filas válidas y Series con los
+    motivos de rechazo ('' en las filas válidas).
+    """
+    motivos = pd.Series("", index=df.index, dtype=object)
+
+    for columna in COLUMNAS_LIQUIDACION:
+        definicion = definiciones.get(columna)
+        if definicion is None or columna not in df.columns:
+            continue
+        serie = df[columna]
+        presentes = serie.notna()
+        tipo = definicion["tipo"]
+
+        if not definicion["nulo"]:
+            _marcar(motivos, ~presentes, f"{columna} vacío (NOT NULL)")
+
+        if tipo in TIPOS_DECIMALES or tipo in TIPOS_FLOTANTES or tipo in TIPOS_ENTEROS:
+            numeros = pd.to_numeric(serie.where(presentes), errors="coerce")
+            no_numericos = presentes & numeros.isna()
+            _marcar(motivos, no_numericos, f"{columna} no es numérico")
+            if tipo in TIPOS_DECIMALES and definicion["precision"]:
+                escala = definicion["escala"] or 0
+                limite = 10 ** (definicion["precision"] - escala)
+                _marcar(motivos, numeros.abs().round(escala) >= limite,
+                        f"{columna} fuera de rango DECIMAL({definicion['precision']},{escala})")
+            elif tipo in TIPOS_ENTEROS:
+                limite = TIPOS_ENTEROS[tipo]
+                _marcar(motivos, numeros.notna() & (numeros != numeros.round()), f"{columna} no es entero")
+                _marcar(motivos, (numeros >= limite) | (numeros < -limite), f"{columna} fuera de rango {tipo.upper()}")
+
+        elif tipo in TIPOS_FECHA or columna == "FECHA_TRAN":
+            # Mismo criterio que FECHA_HORA_TRAN: AAAAMMDD, serial de Excel, día primero
+            fechas = interpretar_fechas(serie.where(presentes))
+            _marcar(motivos, presentes & fechas.isna(), f"{columna} no es una fecha válida")
+
+        elif columna == "HORA_TRAN" or tipo == "time":
+            _marcar(motivos, _validar_hora(serie, presentes), f"{columna} no es una hora válida")
+
+        if tipo in TIPOS_TEXTO and definicion["longitud"]:
+            longitudes = serie[presentes].astype(str).str.len()
+            excedidas = pd.Series(False, index=serie.index)
+            excedidas[presentes] = longitudes > definicion["longitud"]
+            _marcar(motivos, excedidas, f"{columna} excede {definicion['longitud']} caracteres")
+
+    return motivos.eq("").to_numpy(), motivos.str.rstrip("; ")
+
+
+def escribir_rechazos(df, validas, motivos, ruta):
+    """
+    Escribe las filas inválidas en un CSV con su número de fila (1 = primera fila de
+    datos, como en el log) y los motivos. Retorna la cantidad de filas escritas.
+    """
+    invalidas = ~validas
+    if not invalidas.any():
+        return 0
+    rechazos = df[invalidas].copy()
+    rechazos.insert(0, "motivos", motivos[invalidas].to_numpy())
+    rechazos.insert(0, "fila", invalidas.nonzero()[0] + 1)
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    rechazos.to_csv(ruta, index=False, encoding="utf-8")
+    return len(rechazos)
@@ -0,0 +1,173 @@
+"""
+Archivo de los archivos de liquidación ya procesados.
+
+Los archivos procesados se quedaban en el directorio de datos y buscar_archivo_pendiente
+los volvía a recorrer (glob recursivo + getmtime) en cada ejecución; una re-subida del
+mismo archivo se procesaba como nueva. Al terminar el procesamiento el archivo se mueve
+a SERFINSA_ARCHIVO_DIR (por defecto 'archivo' junto al directorio de datos):
+- particionado por fecha de archivo (AAAA/MM/), con el hash del contenido en el nombre;
+- comprimido con gzip (los .xlsx/.gz/.zip ya vienen comprimidos y se guardan tal cual);
+- registrado en un índice SQLite (SERFINSA_ARCHIVO_DB) por sha256 del contenido.
+
+Solo se archivan los archivos cuyo procesamiento terminó sin errores (inserción sin
+errores y lotes creados); los demás se quedan en el directorio de datos para el
+siguiente intento. Antes de leer un archivo se consulta su hash en el índice: si el
+mismo contenido ya se procesó y su copia archivada existe, la re-subida se rechaza sin
+parsearla y se elimina del directorio de datos, que así solo contiene archivos pendientes. Con SERFINSA_ARCHIVAR=0 no se archiva ni
+se rechaza nada.
+"""
+
+import gzip
+import os
+import shutil
+import sqlite3
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from cache_parseo import calcular_hash_archivo
+
+load_dotenv()
+
+# Extensiones que ya vienen comprimidas: gzip apenas las reduce
+_YA_COMPRIMIDOS = (".xlsx", ".gz", ".zip")
+
+
+def archivado_activo():
+    return os.getenv("SERFINSA_ARCHIVAR", "1") == "1"
+
+
+def obtener_directorio_archivo():
+    """
+    Directorio del archivo de procesados; fuera del directorio de datos para que la
+    búsqueda de pendientes no lo recorra
+    """
+    from ReadFile import obtener_directorio_datos
+
+    datos = os.path.abspath(obtener_directorio_datos())
+    directorio = os.path.abspath(os.getenv("SERFINSA_ARCHIVO_DIR") or os.path.join(os.path.dirname(datos), "archivo"))
+    # Los .xlsx se archivan sin comprimir: dentro de datos volverían a parecer pendientes
+    if directorio == datos or directorio.startswith(datos + os.sep):
+        raise ValueError(f"El directorio de archivo ({directorio}) no puede estar dentro del directorio de datos ({datos})")
+    return directorio
+
+
+def _conectar(ruta=None):
+    ruta = ruta or os.getenv("SERFINSA_ARCHIVO_DB") or os.path.join(obtener_directorio_archivo(), "indice.sqlite3")
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=30)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS serfinsa_archivo (
+            sha256 TEXT PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            ruta_original TEXT,
+            ruta_archivo TEXT NOT NULL,
+            tamano INTEGER,
+            archivado TEXT NOT NULL,
+            run_id TEXT,
+            rechazos INTEGER NOT NULL DEFAULT 0,
+            ultimo_rechazo TEXT
+        )
+    """)
+    return conexion
+
+
+def buscar_archivado(sha256, ruta=None):
+    """
+    Entrada del índice para el hash indicado (dict) o None si ese contenido no se archivó
+    o su copia archivada ya no existe
+    """
+    conexion = _conectar(ruta)
+    try:
+        fila = conexion.execute("SELECT * FROM serfinsa_archivo WHERE sha256 = ?", (sha256,)).fetchone()
+    finally:
+        conexion.close()
+    if fila is None or not os.path.isfile(fila["ruta_archivo"]):
+        return None
+    return dict(fila)
+
+
+def _es_copia_archivada(file_path, entrada):
+    return os.path.abspath(file_path) == os.path.abspath(entrada["ruta_archivo"])
+
+
+def rechazar_si_duplicado(file_path, ruta=None):
+    """
+    Si el contenido del archivo ya está archivado (y la copia archivada existe), registra
+    el rechazo, elimina la re-subida del directorio de datos y retorna la entrada del
+    índice; si no, None.
+    """
+    sha256 = calcular_hash_archivo(file_path)
+    entrada = buscar_archivado(sha256, ruta)
+    if entrada is None:
+        return None
+
+    conexion = _conectar(ruta)
+    try:
+        conexion.execute(
+            "UPDATE serfinsa_archivo SET rechazos = rechazos + 1, ultimo_rechazo = ? WHERE sha256 = ?",
+            (datetime.now().isoformat(timespec="seconds"), sha256),
+        )
+        conexion.commit()
+    finally:
+        conexion.close()
+
+    # La copia archivada tiene el mismo contenido: la re-subida no se conserva
+    if not _es_copia_archivada(file_path, entrada):
+        os.remove(file_path)
+    return entrada
+
+
+def archivar_archivo(file_path, run_id=None, directorio=None, ruta=None):
+    """
+    Mueve el archivo procesado al archivo (AAAA/MM/<hash>-<nombre>[.gz]) y lo registra
+    en el índice. Si el contenido ya estaba archivado (y la copia existe) solo se elimina
+    el original; si la copia registrada se perdió, se vuelve a archivar.
+    Retorna la ruta archivada.
+    """
+    directorio = directorio or obtener_directorio_archivo()
+    sha256 = calcular_hash_archivo(file_path)
+
+    existente = buscar_archivado(sha256, ruta)
+    if existente:
+        if not _es_copia_archivada(file_path, existente):
+            os.remove(file_path)
+        return existente["ruta_archivo"]
+
+    ahora = datetime.now()
+    particion = os.path.join(directorio, ahora.strftime("%Y"), ahora.strftime("%m"))
+    os.makedirs(particion, exist_ok=True)
+
+    nombre = os.path.basename(file_path)
+    comprimir = not nombre.lower().endswith(_YA_COMPRIMIDOS)
+    destino = os.path.join(particion, f"{sha256[:16]}-{nombre}" + (".gz" if comprimir else ""))
+    temporal = f"{destino}.{uuid.uuid4().hex[:6]}.tmp"
+    try:
+        with open(file_path, "rb") as origen:
+            with (gzip.open(temporal, "wb") if comprimir else open(temporal, "wb")) as salida:
+                shutil.copyfileobj(origen, salida)
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    conexion = _conectar(ruta)
+    try:
+        conexion.execute(
+            "INSERT OR REPLACE INTO serfinsa_archivo (sha256, nombre, ruta_original, ruta_archivo, tamano, archivado, run_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (sha256, nombre, os.path.abspath(file_path), destino, os.path.getsize(file_path),
+             ahora.isoformat(timespec="seconds"), run_id),
+        )
+        conexion.commit()
+    finally:
+        conexion.close()
+
+    # El original se elimina solo cuando la copia y su entrada del índice ya existen
+    if not os.path.isfile(destino):
+        raise OSError(f"No se encontró la copia archivada {destino}; se conserva {file_path}")
+    os.remove(file_path)
+    return destino
+
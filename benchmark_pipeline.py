@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del pipeline (inserción, emparejamiento y lotes) sobre SQLite en memoria,
+sin servidor MySQL. Genera una liquidación sintética, siembra transactions con una
+transacción por SEQ_NUM (y algunas sin referencia para el paso por autorización) y
+mide cada etapa. Al final comprueba que los totales de los lotes cuadran con las
+liquidaciones.
+
+Uso:
+    python benchmark_pipeline.py [--filas N] [--businesses N] [--en-memoria]
+"""
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from benchmark_registros import generar_dataframe
+from sqlite_memoria import crear_conexion_sqlite
+
+
+def sembrar_transacciones(cursor, conn, df, businesses):
+    """
+    Una transacción aprobada por fila: 9 de cada 10 con referencs = SEQ_NUM y el resto
+    solo con autorizationCode = APROBAC y el mismo monto y fecha
+    """
+    cursor.execute("INSERT INTO payment_method (payment_method_id, name) VALUES (10, 'Serfinsa')")
+    cursor.execute("INSERT INTO payment_gateway (payment_gateway_id, payment_method_id, name) VALUES (1, 10, 'Serfinsa')")
+    filas = []
+    for n, (seq_num, aprobac, monto, fecha) in enumerate(
+        zip(df["SEQ_NUM"], df["APROBAC"], df["MONTO_TRAN"], df["FECHA_TRAN"])
+    ):
+        creada = fecha.to_pydatetime() if hasattr(fecha, "to_pydatetime") else datetime.now()
+        filas.append((
+            f"trx-{n}",
+            f"ord-{n}",
+            seq_num if n % 10 else f"otra-{n}",
+            monto,
+            aprobac if aprobac is not None else f"AUT{n}",
+            1,
+            1,
+            f"biz-{n % businesses}",
+            creada + timedelta(minutes=1),
+        ))
+    cursor.executemany("""
+        INSERT INTO transactions (
+            transaction_id, orderNumber, referencs, amount, autorizationCode, status,
+            payment_gateway_id, business_id, created_at
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, filas)
+    conn.commit()
+
+
+def verificar_totales(cursor):
+    """
+    Lotes cuyo total_transacciones o total_monto_tran no coincide con sus liquidaciones
+    """
+    cursor.execute("""
+        SELECT b.id, b.total_transacciones, b.total_monto_tran,
+               COUNT(l.id) as filas, COALESCE(SUM(l.MONTO_TRAN), 0) as monto
+        FROM Lote_sv_business b
+        LEFT JOIN LiquidacionesSV l ON l.lote_id = b.id
+        GROUP BY b.id, b.total_transacciones, b.total_monto_tran
+    """)
+    return [
+        fila for fila in cursor.fetchall()
+        if fila["filas"] != fila["total_transacciones"] or abs(float(fila["monto"]) - float(fila["total_monto_tran"])) > 0.005
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=5000)
+    parser.add_argument("--businesses", type=int, default=20)
+    parser.add_argument("--en-memoria", action="store_true", help="Calcular los lotes en memoria (SERFINSA_LOTES_EN_MEMORIA=1)")
+    args = parser.parse_args(argv)
+
+    if args.en_memoria:
+        os.environ["SERFINSA_LOTES_EN_MEMORIA"] = "1"
+
+    from Main import insertar_liquidaciones, buscar_transacciones_archivo, construir_lote_enriquecido, crear_lotes
+
+    logger = logging.getLogger("benchmark_pipeline")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    df = generar_dataframe(args.filas)
+    df["APROBAC"] = [f"AUT{n}" for n in range(len(df))]
+    conn = crear_conexion_sqlite()
+    cursor = conn.cursor(dictionary=True)
+    sembrar_transacciones(cursor, conn, df, args.businesses)
+
+    print(f"{len(df)} filas, {args.businesses} businesses, SQLite en memoria")
+    inicio = time.perf_counter()
+    insertados, _, errores, seq_nums_insertados = insertar_liquidaciones(df, cursor, conn, logger)
+    print(f"insercion       {time.perf_counter() - inicio:8.3f} s  {insertados} insertados, {errores} errores")
+
+    inicio = time.perf_counter()
+    _, encontrados, business_ids = buscar_transacciones_archivo(df, cursor, conn, logger)
+    print(f"emparejamiento  {time.perf_counter() - inicio:8.3f} s  {encontrados} encontrados")
+
+    inicio = time.perf_counter()
+    ok, lotes = crear_lotes(cursor, conn, logger, construir_lote_enriquecido(df, seq_nums_insertados, business_ids))
+    print(f"lotes           {time.perf_counter() - inicio:8.3f} s  {lotes} lotes")
+
+    cursor.execute("SELECT COUNT(*) as sin_lote FROM LiquidacionesSV WHERE business_id IS NOT NULL AND lote_id IS NULL")
+    sin_lote = cursor.fetchone()["sin_lote"]
+    descuadres = verificar_totales(cursor)
+    print(f"Filas emparejadas sin lote: {sin_lote}; lotes con totales descuadrados: {len(descuadres)}")
+    conn.close()
+    return 0 if ok and not sin_lote and not descuadres else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Compara memoria y tiempo de recorrer las filas de una liquidación con el camino anterior
+(df.iterrows() + tupla con pd.isna por celda) y con LiquidacionRecord.
+
+La memoria se informa como pico durante la pasada y como memoria retenida por el
+resultado. El camino de registros construye los registros por bloques (en_bloques,
+como insertar_liquidaciones) y libera cada bloque al pasar al siguiente: solo quedan
+las tuplas, igual que con iterrows.
+
+Uso:
+    python benchmark_registros.py [--filas N] [--archivo RUTA]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from lectores import COLUMNAS_LIQUIDACION
+from registro_liquidacion import LiquidacionRecord
+
+TAMANO_BLOQUE = 1000
+MB = 1024 * 1024
+
+
+def generar_dataframe(filas):
+    """
+    DataFrame sintético con las 40 columnas: montos float, textos y algunos nulos
+    """
+    datos = {}
+    for i, columna in enumerate(COLUMNAS_LIQUIDACION):
+        if columna.startswith(("MONTO", "COM_", "SUBTOTAL", "RETEN", "DEPOSITO", "IVA_PORC", "COMISIONAB")):
+            datos[columna] = [float(n % 1000) + 0.25 if n % 17 else None for n in range(filas)]
+        elif columna == "FECHA_TRAN":
+            datos[columna] = pd.date_range("2024-01-01", periods=filas, freq="min")
+        elif columna == "HORA_TRAN":
+            datos[columna] = [f"{n // 60 % 24:02d}:{n % 60:02d}:00" for n in range(filas)]
+        else:
+            datos[columna] = [f"{columna[:3]}{n}" if (n + i) % 23 else None for n in range(filas)]
+    datos["SEQ_NUM"] = [str(100000 + n) for n in range(filas)]
+    return pd.DataFrame(datos)
+
+
+def camino_iterrows(df):
+    filas = []
+    for _, row in df.iterrows():
+        seq_num = row["SEQ_NUM"]
+        if seq_num is not None and not pd.isna(seq_num):
+            pass
+        filas.append(tuple(None if pd.isna(val) else val for val in row))
+    return filas
+
+
+def camino_registros(df):
+    filas = []
+    for registros in LiquidacionRecord.en_bloques(df, TAMANO_BLOQUE):
+        for registro in registros:
+            if registro.SEQ_NUM is not None:
+                pass
+            filas.append(registro.como_tupla())
+    return filas
+
+
+def medir(nombre, funcion, df):
+    """
+    Retorna (resultado, pico, retenido): memoria en bytes asignada durante la pasada y
+    la que sigue ocupando el resultado al terminar
+    """
+    # Tiempo y memoria en pasadas separadas: tracemalloc ralentiza mucho cada asignación
+    inicio = time.perf_counter()
+    resultado = funcion(df)
+    duracion = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    medido = funcion(df)
+    retenido, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del medido
+    print(
+        f"{nombre:<12} {duracion:8.3f} s  {len(df) / duracion:12,.0f} filas/s  "
+        f"pico {pico / MB:8.1f} MB  retenido {retenido / MB:8.1f} MB"
+    )
+    return resultado, pico, retenido
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=20000)
+    parser.add_argument("--archivo", help="Usar un archivo de liquidación real en lugar de datos sintéticos")
+    args = parser.parse_args(argv)
+
+    if args.archivo:
+        from ReadFile import leer_archivo_normalizado
+        df = leer_archivo_normalizado(args.archivo)
+    else:
+        df = generar_dataframe(args.filas)
+
+    print(f"{len(df)} filas x {len(df.columns)} columnas")
+    anterior, pico_anterior, retenido_anterior = medir("iterrows", camino_iterrows, df)
+    nuevo, pico_nuevo, retenido_nuevo = medir("registros", camino_registros, df)
+    print(
+        f"Memoria de registros frente a iterrows: pico {(pico_nuevo - pico_anterior) / MB:+.1f} MB, "
+        f"retenido {(retenido_nuevo - retenido_anterior) / MB:+.1f} MB"
+    )
+
+    iguales = all(
+        all((a is None and b is None) or a == b for a, b in zip(fila_a, fila_b))
+        for fila_a, fila_b in zip(anterior, nuevo)
+    )
+    print(f"Mismas tuplas de inserción: {'sí' if iguales else 'NO'}")
+    return 0 if iguales else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,167 @@
+"""
+Caché de archivos de liquidación ya parseados y normalizados.
+
+El DataFrame normalizado se guarda en formato Feather (columnar, requiere pyarrow)
+bajo una clave formada por el hash del contenido del archivo y la versión del
+esquema de normalización. Si pyarrow no está instalado la caché queda deshabilitada
+y la lectura sigue funcionando como siempre.
+"""
+
+import glob
+import hashlib
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_DIR = os.getenv("SERFINSA_CACHE_PARSEO_DIR", os.path.join(os.getcwd(), "logs", "cache_parseo"))
+CACHE_HABILITADA = os.getenv("SERFINSA_CACHE_PARSEO", "1") != "0"
+CACHE_MAX_MB = float(os.getenv("SERFINSA_CACHE_PARSEO_MAX_MB", "500"))
+EXTENSION = ".feather"
+
+
+def cache_disponible():
+    """
+    Indica si la caché está habilitada y pyarrow está instalado
+    """
+    if not CACHE_HABILITADA:
+        return False
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def calcular_hash_archivo(file_path, chunk_size=1024 * 1024):
+    """
+    Calcula el SHA-256 del contenido del archivo leyendo por bloques
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for bloque in iter(lambda: f.read(chunk_size), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def calcular_clave(file_path, version_esquema):
+    """
+    Clave de caché: hash del contenido + versión del esquema de normalización
+    """
+    return f"{calcular_hash_archivo(file_path)}.v{version_esquema}"
+
+
+def _ruta_cache(clave):
+    return os.path.join(CACHE_DIR, clave + EXTENSION)
+
+
+def invalidar_versiones_antiguas(version_esquema):
+    """
+    Elimina las entradas generadas con otra versión del esquema de normalización
+    """
+    sufijo = f".v{version_esquema}{EXTENSION}"
+    eliminados = 0
+    for ruta in glob.glob(os.path.join(CACHE_DIR, "*" + EXTENSION)):
+        if not ruta.endswith(sufijo):
+            try:
+                os.remove(ruta)
+                eliminados += 1
+            except OSError:
+                pass
+    return eliminados
+
+
+def cargar_desde_cache(clave):
+    """
+    Devuelve el DataFrame guardado para la clave o None si no existe
+    """
+    if not cache_disponible():
+        return None
+
+    ruta = _ruta_cache(clave)
+    if not os.path.exists(ruta):
+        return None
+
+    try:
+        import pandas as pd
+        df = pd.read_feather(ruta)
+        # Actualizar mtime para que la evicción sea LRU
+        os.utime(ruta, None)
+        return df
+    except Exception as e:
+        print(f"⚠️ Entrada de caché inválida ({os.path.basename(ruta)}), se descarta: {e}")
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        return None
+
+
+def guardar_en_cache(clave, df, version_esquema):
+    """
+    Guarda el DataFrame normalizado en la caché y aplica la evicción por tamaño
+    """
+    if not cache_disponible():
+        return False
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        invalidar_versiones_antiguas(version_esquema)
+
+        ruta = _ruta_cache(clave)
+        ruta_tmp = ruta + ".tmp"
+        df.reset_index(drop=True).to_feather(ruta_tmp)
+        os.replace(ruta_tmp, ruta)
+
+        evictar_por_tamano()
+        return True
+    except Exception as e:
+        # Columnas con tipos mezclados no se pueden representar en Arrow; no es un error fatal
+        print(f"⚠️ No se pudo guardar el archivo en la caché de parseo: {e}")
+        try:
+            os.remove(_ruta_cache(clave) + ".tmp")
+        except OSError:
+            pass
+        return False
+
+
+def evictar_por_tamano(max_mb=None):
+    """
+    Elimina las entradas menos usadas recientemente hasta quedar bajo el límite de tamaño
+    """
+    limite = (CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    entradas = []
+    for ruta in glob.glob(os.path.join(CACHE_DIR, "*" + EXTENSION)):
+        try:
+            stat = os.stat(ruta)
+            entradas.append((stat.st_mtime, stat.st_size, ruta))
+        except OSError:
+            continue
+
+    total = sum(size for _, size, _ in entradas)
+    eliminados = 0
+    for _, size, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            os.remove(ruta)
+            total -= size
+            eliminados += 1
+        except OSError:
+            pass
+    return eliminados
+
+
+def limpiar_cache():
+    """
+    Elimina todas las entradas de la caché de parseo
+    """
+    eliminados = 0
+    for ruta in glob.glob(os.path.join(CACHE_DIR, "*" + EXTENSION)):
+        try:
+            os.remove(ruta)
+            eliminados += 1
+        except OSError:
+            pass
+    return eliminados
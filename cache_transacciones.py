@@ -0,0 +1,109 @@
+"""
+Caché LRU con TTL para las consultas a la tabla transactions.
+
+Guarda resultados positivos durante SERFINSA_CACHE_TRX_TTL segundos y las búsquedas
+sin resultado (caché negativa) durante SERFINSA_CACHE_TRX_TTL_NEGATIVO segundos, con
+un máximo de SERFINSA_CACHE_TRX_MAX entradas. Es segura para uso desde varios hilos.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class CacheTransacciones:
+    def __init__(self, max_entradas=10000, ttl_segundos=300, ttl_negativo_segundos=30, habilitada=True):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.ttl_negativo_segundos = ttl_negativo_segundos
+        self.habilitada = habilitada
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hits_negativos = 0
+
+    def obtener(self, clave, valida=None):
+        """
+        Retorna (True, valor) si la clave está en caché, no expiró y (si se indica)
+        valida(valor) es verdadero; (False, None) en caso contrario.
+        """
+        if not self.habilitada:
+            return False, None
+
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return False, None
+
+            expira, valor, negativo = entrada
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                self.misses += 1
+                return False, None
+
+            if valida is not None and not valida(valor):
+                self.misses += 1
+                return False, None
+
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+            if negativo:
+                self.hits_negativos += 1
+            return True, valor
+
+    def guardar(self, clave, valor, negativo=False):
+        """
+        Guarda un valor. Las búsquedas sin resultado (negativo=True) usan el TTL negativo
+        """
+        if not self.habilitada:
+            return
+
+        ttl = self.ttl_negativo_segundos if negativo else self.ttl_segundos
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + ttl, valor, negativo)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def limpiar(self):
+        """
+        Vacía la caché y reinicia los contadores
+        """
+        with self._lock:
+            self._entradas.clear()
+            self.hits = 0
+            self.misses = 0
+            self.hits_negativos = 0
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "hits": self.hits,
+                "hits_negativos": self.hits_negativos,
+                "misses": self.misses,
+                "ratio_hits": (self.hits / total) if total else 0.0,
+            }
+
+
+cache_transacciones = CacheTransacciones(
+    max_entradas=int(os.getenv("SERFINSA_CACHE_TRX_MAX", "10000")),
+    ttl_segundos=float(os.getenv("SERFINSA_CACHE_TRX_TTL", "300")),
+    ttl_negativo_segundos=float(os.getenv("SERFINSA_CACHE_TRX_TTL_NEGATIVO", "30")),
+    habilitada=os.getenv("SERFINSA_CACHE_TRX", "1") != "0",
+)
@@ -5,17 +5,41 @@ import os
 
 load_dotenv()
 
+# mysql-connector limita el tamaño de un pool a 32 conexiones
+TAMANO_MAXIMO_POOL = 32
+
+def _config_conexion(prefijo="DB"):
+    """
+    Configuración de conexión a partir de las variables <prefijo>_HOST, _USER, ...
+    Para la réplica (prefijo DB_REPLICA) los valores no definidos se toman del primario.
+    """
+    def valor(nombre):
+        return os.getenv(f"{prefijo}_{nombre}") or os.getenv(f"DB_{nombre}")
+
+    config = {
+        "host": valor("HOST"),
+        "user": valor("USER"),
+        "password": valor("PASSWORD"),
+        "database": valor("DATABASE"),
+    }
+    port = os.getenv(f"{prefijo}_PORT")
+    if port:
+        config["port"] = int(port)
+    socket_path = os.getenv(f"{prefijo}_SOCKET")
+    if socket_path:
+        config["unix_socket"] = socket_path
+    return config
+
+def backend_sqlite():
+    return os.getenv("SERFINSA_DB_BACKEND", "mysql").lower() == "sqlite"
+
 def create_connection():
+    if backend_sqlite():
+        # Base local con el esquema de Serfinsa (pruebas y benchmarks sin servidor)
+        from sqlite_memoria import crear_conexion_sqlite
+        return crear_conexion_sqlite(os.getenv("SERFINSA_SQLITE_DB", ":memory:"))
     try:
-        config = {
-            "host": os.getenv("DB_HOST"),
-            "user": os.getenv("DB_USER"),
-            "password": os.getenv("DB_PASSWORD"),
-            "database": os.getenv("DB_DATABASE"),
-        }
-        socket_path = os.getenv("DB_SOCKET")
-        if socket_path:
-            config["unix_socket"] = socket_path
+        config = _config_conexion()
         connection = mysql.connector.connect(**config)
         if connection.is_connected():
             print(f" Conexión exitosa a la base de datos {os.getenv('DB_DATABASE')}")
@@ -23,3 +47,93 @@ def create_connection():
     except Error as e:
         print(f"Error al conectar a la base de datos: {e}")
         return None
+
+def replica_configurada():
+    if backend_sqlite():
+        return False
+    return bool(os.getenv("DB_REPLICA_HOST") or os.getenv("DB_REPLICA_SOCKET"))
+
+def obtener_retraso_replica(connection):
+    """
+    Segundos de retraso de la réplica respecto al primario, o None si no se puede
+    determinar (replicación detenida o sin permisos para consultarla)
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        for query, columna in (
+            ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+            ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+        ):
+            try:
+                cursor.execute(query)
+                estado = cursor.fetchone()
+            except Error:
+                continue
+            if not estado:
+                return None
+            retraso = estado.get(columna)
+            return int(retraso) if retraso is not None else None
+        return None
+    finally:
+        cursor.close()
+
+def create_read_connection(fallback=True):
+    """
+    Conexión para consultas de solo lectura (conciliación, emparejamiento, verificación
+    de existencia). Usa la réplica DB_REPLICA_* si está configurada y su retraso no supera
+    DB_REPLICA_MAX_LAG segundos; en caso contrario cae al primario (si fallback=True)
+    o retorna None para que el llamador use su conexión al primario.
+    """
+    if replica_configurada():
+        max_lag = int(os.getenv("DB_REPLICA_MAX_LAG", "30"))
+        try:
+            connection = mysql.connector.connect(**_config_conexion("DB_REPLICA"))
+            retraso = obtener_retraso_replica(connection)
+            if retraso is not None and retraso <= max_lag:
+                print(f" Conexión de lectura a la réplica (retraso {retraso}s)")
+                return connection
+            connection.close()
+            motivo = "desconocido" if retraso is None else f"{retraso}s"
+            print(f"⚠️ Réplica descartada (retraso {motivo}, máximo {max_lag}s). Se usa el primario para lecturas.")
+        except Error as e:
+            print(f"⚠️ No se pudo conectar a la réplica, se usa el primario para lecturas: {e}")
+
+    if fallback:
+        return create_connection()
+    return None
+
+def crear_pool_lectura(tamano, nombre="serfinsa_lectura"):
+    """
+    Pool de conexiones para lecturas en paralelo. Apunta a la réplica si está configurada
+    y dentro del retraso permitido; si no, al primario.
+    """
+    from mysql.connector import pooling
+
+    config = _config_conexion()
+    if replica_configurada():
+        conexion_prueba = create_read_connection(fallback=False)
+        if conexion_prueba:
+            conexion_prueba.close()
+            config = _config_conexion("DB_REPLICA")
+
+    try:
+        return pooling.MySQLConnectionPool(pool_name=nombre, pool_size=max(1, min(tamano, TAMANO_MAXIMO_POOL)), **config)
+    except Error as e:
+        print(f"Error creando el pool de conexiones: {e}")
+        return None
+
+def crear_pool_escritura(tamano, nombre="serfinsa_escritura"):
+    """
+    Pool de conexiones al primario para escrituras en paralelo (p. ej. lotes por
+    business_id). Con el backend SQLite retorna None: SQLite serializa las escrituras.
+    """
+    if backend_sqlite():
+        return None
+
+    from mysql.connector import pooling
+
+    try:
+        return pooling.MySQLConnectionPool(pool_name=nombre, pool_size=max(1, min(tamano, TAMANO_MAXIMO_POOL)), **_config_conexion())
+    except Error as e:
+        print(f"Error creando el pool de conexiones: {e}")
+        return None
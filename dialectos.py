@@ -0,0 +1,275 @@
+"""
+Dialectos SQL para las consultas que no son portables entre MySQL y SQLite.
+
+CrearLotes, BuscarTransaccion y ConciliacionSV no escriben directamente consultas a
+INFORMATION_SCHEMA, ALTER TABLE ... AFTER, ON DUPLICATE KEY UPDATE, UPDATE ... JOIN
+ni GET_LOCK: piden al dialecto del cursor (obtener_dialecto) la operación equivalente.
+En producción el dialecto es MySQL; sqlite_memoria.py ofrece una conexión SQLite en
+memoria con el mismo esquema para pruebas y micro-benchmarks sin servidor.
+
+Todas las consultas usan %s como marcador de parámetros; la conexión SQLite lo traduce.
+"""
+
+import re
+import threading
+
+
+class DialectoMySQL:
+    nombre = "mysql"
+
+    # Sufijos de lectura con bloqueo de filas
+    para_actualizar = " FOR UPDATE"
+    bloqueo_compartido = " LOCK IN SHARE MODE"
+
+    def existe_tabla(self, cursor, tabla):
+        cursor.execute("""
+            SELECT TABLE_NAME
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME = %s
+        """, (tabla,))
+        return cursor.fetchone() is not None
+
+    def columnas_tabla(self, cursor, tabla):
+        cursor.execute("""
+            SELECT COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME = %s
+        """, (tabla,))
+        return [fila["COLUMN_NAME"] for fila in cursor.fetchall()]
+
+    def definiciones_columnas(self, cursor, tabla):
+        """
+        {columna: {'tipo', 'longitud', 'precision', 'escala', 'nulo'}} con el tipo en
+        minúsculas (varchar, decimal, date...) y las longitudes declaradas o None
+        """
+        cursor.execute("""
+            SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION,
+                   NUMERIC_SCALE, IS_NULLABLE
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME = %s
+        """, (tabla,))
+        return {
+            fila["COLUMN_NAME"]: {
+                "tipo": str(fila["DATA_TYPE"]).lower(),
+                "longitud": fila["CHARACTER_MAXIMUM_LENGTH"],
+                "precision": fila["NUMERIC_PRECISION"],
+                "escala": fila["NUMERIC_SCALE"],
+                "nulo": fila["IS_NULLABLE"] == "YES",
+            }
+            for fila in cursor.fetchall()
+        }
+
+    def agregar_columna(self, cursor, tabla, columna, definicion, despues=None, indice=None):
+        sql = f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"
+        if despues:
+            sql += f" AFTER {despues}"
+        if indice:
+            sql += f", ADD INDEX {indice} ({columna})"
+        cursor.execute(sql)
+
+    def indices_unicos(self, cursor, tabla):
+        """
+        {nombre_indice: [columnas]} de los índices únicos de la tabla (incluida la PK)
+        """
+        cursor.execute("""
+            SELECT INDEX_NAME, COLUMN_NAME
+            FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME = %s
+            AND NON_UNIQUE = 0
+            ORDER BY INDEX_NAME, SEQ_IN_INDEX
+        """, (tabla,))
+        indices = {}
+        for fila in cursor.fetchall():
+            indices.setdefault(fila["INDEX_NAME"], []).append(fila["COLUMN_NAME"])
+        return indices
+
+    def agregar_indice(self, cursor, tabla, nombre, columnas, unico=False):
+        tipo = "UNIQUE KEY" if unico else "INDEX"
+        cursor.execute(f"ALTER TABLE {tabla} ADD {tipo} {nombre} ({', '.join(columnas)})")
+
+    def insertar_u_obtener_id(self, cursor, tabla, valores, clave):
+        """
+        Inserta la fila o, si ya existe una con la misma clave única, obtiene su id de
+        forma atómica. Retorna (id, creado).
+        """
+        columnas = list(valores)
+        cursor.execute(f"""
+            INSERT INTO {tabla} ({', '.join(columnas)})
+            VALUES ({', '.join(['%s'] * len(columnas))})
+            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+        """, tuple(valores.values()))
+        # LAST_INSERT_ID(id) devuelve el id existente; rowcount es 1 solo si se insertó
+        return cursor.lastrowid, cursor.rowcount == 1
+
+    def upsert_acumulando(self, tabla, columnas, clave, acumular, conservar, filas):
+        """
+        INSERT de varias filas que, si la clave ya existe, suma las columnas acumular y
+        completa las columnas conservar solo si estaban en NULL. Retorna (sql, params).
+        """
+        valores = ", ".join(["(" + ", ".join(["%s"] * len(columnas)) + ")"] * len(filas))
+        actualizar = [f"{c} = {c} + VALUES({c})" for c in acumular]
+        actualizar += [f"{c} = COALESCE({c}, VALUES({c}))" for c in conservar]
+        sql = f"""
+            INSERT INTO {tabla} ({', '.join(columnas)})
+            VALUES {valores}
+            ON DUPLICATE KEY UPDATE {', '.join(actualizar)}
+        """
+        return sql, tuple(valor for fila in filas for valor in fila)
+
+    def tabla_valores(self, columnas, filas):
+        """
+        Tabla derivada con las filas indicadas (SELECT %s AS c1, ... UNION ALL ...) y sus
+        parámetros
+        """
+        fila_sql = "SELECT " + ", ".join(f"%s AS {columna}" for columna in columnas)
+        return " UNION ALL ".join([fila_sql] * len(filas)), tuple(valor for fila in filas for valor in fila)
+
+    def actualizar_desde_filas(self, cursor, tabla, clave, columnas, filas, asignar, condicion=None):
+        """
+        UPDATE en bloque de tabla (alias t) a partir de una tabla derivada de valores
+        (alias v) con las columnas indicadas, uniendo t.clave[0] = v.clave[1].
+        asignar: {columna_tabla: columna_valores}. condicion: filtro adicional sobre t.
+        Retorna las filas afectadas.
+        """
+        derivada, params = self.tabla_valores(columnas, filas)
+        sets = ", ".join(f"t.{destino} = v.{origen}" for destino, origen in asignar.items())
+        cursor.execute(f"""
+            UPDATE {tabla} t
+            INNER JOIN ({derivada}) v ON t.{clave[0]} = v.{clave[1]}
+            SET {sets}
+            {'WHERE ' + condicion if condicion else ''}
+        """, params)
+        return cursor.rowcount
+
+    def adquirir_bloqueo(self, cursor, nombre, timeout):
+        cursor.execute("SELECT GET_LOCK(%s, %s) as adquirido", (nombre, timeout))
+        fila = cursor.fetchone()
+        return bool(fila) and fila["adquirido"] == 1
+
+    def liberar_bloqueo(self, cursor, nombre):
+        cursor.execute("SELECT RELEASE_LOCK(%s) as liberado", (nombre,))
+        cursor.fetchone()
+
+
+class DialectoSQLite(DialectoMySQL):
+    nombre = "sqlite"
+
+    # SQLite bloquea la base completa al escribir; no hay bloqueos de fila
+    para_actualizar = ""
+    bloqueo_compartido = ""
+
+    _bloqueos = {}
+    _bloqueos_lock = threading.Lock()
+
+    def existe_tabla(self, cursor, tabla):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", (tabla,))
+        return cursor.fetchone() is not None
+
+    def columnas_tabla(self, cursor, tabla):
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        return [fila["name"] for fila in cursor.fetchall()]
+
+    def definiciones_columnas(self, cursor, tabla):
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        definiciones = {}
+        for fila in cursor.fetchall():
+            coincidencia = re.match(r"\s*(\w+)\s*(?:\((\d+)\s*(?:,\s*(\d+))?\))?", fila["type"] or "")
+            tipo = coincidencia.group(1).lower() if coincidencia else ""
+            numeros = [int(n) if n else None for n in coincidencia.groups()[1:]] if coincidencia else [None, None]
+            es_texto = tipo in ("varchar", "char", "text")
+            definiciones[fila["name"]] = {
+                "tipo": tipo,
+                "longitud": numeros[0] if es_texto else None,
+                "precision": None if es_texto else numeros[0],
+                "escala": None if es_texto else numeros[1],
+                "nulo": not fila["notnull"] and not fila["pk"],
+            }
+        return definiciones
+
+    def agregar_columna(self, cursor, tabla, columna, definicion, despues=None, indice=None):
+        # SQLite no admite AFTER: la columna se agrega al final
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+        if indice:
+            cursor.execute(f"CREATE INDEX {indice} ON {tabla} ({columna})")
+
+    def indices_unicos(self, cursor, tabla):
+        cursor.execute(f"PRAGMA index_list({tabla})")
+        nombres = [fila["name"] for fila in cursor.fetchall() if fila["unique"]]
+        indices = {}
+        for nombre in nombres:
+            cursor.execute(f"PRAGMA index_info({nombre})")
+            indices[nombre] = [fila["name"] for fila in sorted(cursor.fetchall(), key=lambda f: f["seqno"])]
+        return indices
+
+    def agregar_indice(self, cursor, tabla, nombre, columnas, unico=False):
+        cursor.execute(f"CREATE {'UNIQUE ' if unico else ''}INDEX {nombre} ON {tabla} ({', '.join(columnas)})")
+
+    def insertar_u_obtener_id(self, cursor, tabla, valores, clave):
+        columnas = list(valores)
+        cursor.execute(f"""
+            INSERT INTO {tabla} ({', '.join(columnas)})
+            VALUES ({', '.join(['%s'] * len(columnas))})
+            ON CONFLICT ({', '.join(clave)}) DO NOTHING
+        """, tuple(valores.values()))
+        if cursor.rowcount == 1:
+            return cursor.lastrowid, True
+        cursor.execute(
+            f"SELECT id FROM {tabla} WHERE {' AND '.join(f'{c} = %s' for c in clave)}",
+            tuple(valores[c] for c in clave),
+        )
+        return cursor.fetchone()["id"], False
+
+    def upsert_acumulando(self, tabla, columnas, clave, acumular, conservar, filas):
+        valores = ", ".join(["(" + ", ".join(["%s"] * len(columnas)) + ")"] * len(filas))
+        actualizar = [f"{c} = {c} + excluded.{c}" for c in acumular]
+        actualizar += [f"{c} = COALESCE({c}, excluded.{c})" for c in conservar]
+        sql = f"""
+            INSERT INTO {tabla} ({', '.join(columnas)})
+            VALUES {valores}
+            ON CONFLICT ({', '.join(clave)}) DO UPDATE SET {', '.join(actualizar)}
+        """
+        return sql, tuple(valor for fila in filas for valor in fila)
+
+    def tabla_valores(self, columnas, filas):
+        # SQLite limita un SELECT compuesto a 500 términos; VALUES no tiene ese límite
+        seleccion = ", ".join(f"column{n} AS {columna}" for n, columna in enumerate(columnas, 1))
+        valores = ", ".join(["(" + ", ".join(["%s"] * len(columnas)) + ")"] * len(filas))
+        return f"SELECT {seleccion} FROM (VALUES {valores})", tuple(valor for fila in filas for valor in fila)
+
+    def actualizar_desde_filas(self, cursor, tabla, clave, columnas, filas, asignar, condicion=None):
+        derivada, params = self.tabla_valores(columnas, filas)
+        sets = ", ".join(f"{destino} = v.{origen}" for destino, origen in asignar.items())
+        cursor.execute(f"""
+            UPDATE {tabla} AS t
+            SET {sets}
+            FROM ({derivada}) AS v
+            WHERE t.{clave[0]} = v.{clave[1]}
+            {'AND ' + condicion if condicion else ''}
+        """, params)
+        return cursor.rowcount
+
+    def adquirir_bloqueo(self, cursor, nombre, timeout):
+        # Bloqueos con nombre dentro del proceso (equivalente a GET_LOCK entre hilos)
+        with self._bloqueos_lock:
+            bloqueo = self._bloqueos.setdefault(nombre, threading.Lock())
+        return bloqueo.acquire(timeout=timeout if timeout and timeout > 0 else -1)
+
+    def liberar_bloqueo(self, cursor, nombre):
+        bloqueo = self._bloqueos.get(nombre)
+        if bloqueo is not None and bloqueo.locked():
+            bloqueo.release()
+
+
+DIALECTO_MYSQL = DialectoMySQL()
+DIALECTO_SQLITE = DialectoSQLite()
+
+
+def obtener_dialecto(cursor):
+    """
+    Dialecto del cursor: el que declare (atributo dialecto) o MySQL por defecto
+    """
+    return getattr(cursor, "dialecto", None) or DIALECTO_MYSQL
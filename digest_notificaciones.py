@@ -0,0 +1,258 @@
+"""
+Notificaciones agrupadas (digest) para cuando se procesan muchos archivos seguidos.
+
+Con SERFINSA_NOTIFICACION_DIGEST=1, en lugar de un email por archivo y otro por cada
+conciliación, cada ejecución deja su resultado en una cola local (SQLite en
+SERFINSA_DIGEST_DB) y sus adjuntos en SERFINSA_DIGEST_DIR:
+- los adjuntos se guardan una sola vez por contenido (sha256), así un mismo archivo
+  reprocesado o un log repetido no se adjunta dos veces;
+- los logs y CSV se comprimen con gzip; los .xlsx/.gz/.zip ya vienen comprimidos;
+- de la conciliación solo se adjunta el reporte más reciente (cada uno es una foto
+  completa de las faltantes).
+
+Cuando la entrada más antigua de la cola supera SERFINSA_DIGEST_VENTANA_MINUTOS (o al
+forzarlo con serfinsa.py notify digest / al terminar un backfill) se envía un único
+email con una tabla por archivo, el resumen de las conciliaciones y los adjuntos.
+Si el envío falla las entradas quedan en la cola para el siguiente intento; las que
+quedaron reclamadas por una ejecución que no terminó el envío (p. ej. interrumpida
+durante el SMTP) vuelven a la cola pasados SERFINSA_DIGEST_RECLAMO_MINUTOS.
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DIGEST_DB = os.getenv(
+    "SERFINSA_DIGEST_DB", os.path.join(os.getcwd(), "logs", "serfinsa_digest.sqlite3")
+)
+DIGEST_DIR = os.getenv("SERFINSA_DIGEST_DIR", os.path.join(os.getcwd(), "logs", "digest"))
+
+# Extensiones que ya vienen comprimidas: gzip apenas las reduce
+_YA_COMPRIMIDOS = (".xlsx", ".gz", ".zip")
+
+
+def digest_activo():
+    return os.getenv("SERFINSA_NOTIFICACION_DIGEST", "0") == "1"
+
+
+def _conectar(ruta=None):
+    ruta = ruta or DIGEST_DB
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=30)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS serfinsa_digest (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            nombre TEXT,
+            run_id TEXT,
+            creado TEXT NOT NULL,
+            datos TEXT,
+            adjuntos TEXT,
+            envio TEXT,
+            reclamado TEXT
+        )
+    """)
+    # Colas creadas antes de guardar el momento del reclamo
+    columnas = {fila["name"] for fila in conexion.execute("PRAGMA table_info(serfinsa_digest)")}
+    if "reclamado" not in columnas:
+        conexion.execute("ALTER TABLE serfinsa_digest ADD COLUMN reclamado TEXT")
+    conexion.execute("CREATE INDEX IF NOT EXISTS idx_serfinsa_digest_envio ON serfinsa_digest (envio, id)")
+    return conexion
+
+
+def guardar_adjunto(ruta, directorio=None):
+    """
+    Copia el adjunto a la cola del digest, comprimido si hace falta, con el hash de su
+    contenido en el nombre. Retorna la ruta guardada (la misma si el contenido ya estaba).
+    """
+    directorio = directorio or DIGEST_DIR
+    os.makedirs(directorio, exist_ok=True)
+
+    hash_contenido = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1024 * 1024), b""):
+            hash_contenido.update(bloque)
+
+    # El mismo contenido con otro nombre (p. ej. un archivo reprocesado) reutiliza la copia
+    prefijo = hash_contenido.hexdigest()[:16]
+    existentes = sorted(glob.glob(os.path.join(glob.escape(directorio), f"{prefijo}-*")))
+    existentes = [ruta_existente for ruta_existente in existentes if not ruta_existente.endswith(".tmp")]
+    if existentes:
+        return existentes[0]
+
+    nombre = os.path.basename(ruta)
+    comprimir = not nombre.lower().endswith(_YA_COMPRIMIDOS)
+    destino = os.path.join(directorio, f"{prefijo}-{nombre}" + (".gz" if comprimir else ""))
+    if not os.path.exists(destino):
+        temporal = f"{destino}.{uuid.uuid4().hex[:6]}.tmp"
+        with open(ruta, "rb") as origen:
+            with (gzip.open(temporal, "wb") if comprimir else open(temporal, "wb")) as salida:
+                shutil.copyfileobj(origen, salida)
+        os.replace(temporal, destino)
+    return destino
+
+
+def encolar(tipo, nombre, datos, adjuntos=(), run_id=None, ruta=None, directorio=None):
+    """
+    Agrega a la cola del digest el resultado de una ejecución.
+    tipo: 'archivo' (datos = summary_stats + processing_time) o 'conciliacion'
+    (datos = faltantes). Los adjuntos que no existan se ignoran.
+    """
+    guardados = [guardar_adjunto(adjunto, directorio) for adjunto in adjuntos if adjunto and os.path.exists(adjunto)]
+    conexion = _conectar(ruta)
+    try:
+        conexion.execute(
+            "INSERT INTO serfinsa_digest (tipo, nombre, run_id, creado, datos, adjuntos) VALUES (?, ?, ?, ?, ?, ?)",
+            (tipo, nombre, run_id, datetime.now().isoformat(timespec="seconds"),
+             json.dumps(datos, default=str), json.dumps(guardados)),
+        )
+        conexion.commit()
+    finally:
+        conexion.close()
+
+
+def _reclamar_pendientes(conexion, forzar, ventana_minutos, reclamo_minutos):
+    """
+    Marca las entradas pendientes con un identificador de envío y el momento del reclamo
+    (si corresponde enviar) para que otra ejecución concurrente no las envíe también.
+    Las reclamadas hace más de reclamo_minutos (envío que nunca terminó) cuentan como
+    pendientes. Retorna (envio, entradas).
+    """
+    ahora = datetime.now()
+    vencido = (ahora - timedelta(minutes=reclamo_minutos)).isoformat(timespec="seconds")
+    pendiente = "(envio IS NULL OR reclamado IS NULL OR reclamado < ?)"
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        fila = conexion.execute(
+            f"SELECT MIN(creado) as primero FROM serfinsa_digest WHERE {pendiente}", (vencido,)
+        ).fetchone()
+        if fila["primero"] is None or (
+            not forzar and datetime.fromisoformat(fila["primero"]) > ahora - timedelta(minutes=ventana_minutos)
+        ):
+            conexion.rollback()
+            return None, []
+        envio = uuid.uuid4().hex
+        conexion.execute(
+            f"UPDATE serfinsa_digest SET envio = ?, reclamado = ? WHERE {pendiente}",
+            (envio, ahora.isoformat(timespec="seconds"), vencido),
+        )
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    entradas = conexion.execute("SELECT * FROM serfinsa_digest WHERE envio = ? ORDER BY id", (envio,)).fetchall()
+    return envio, entradas
+
+
+def seleccionar_adjuntos(entradas, max_bytes):
+    """
+    Adjuntos únicos del digest en orden de llegada: todos los de los archivos y solo el
+    reporte de conciliación más reciente. Retorna (adjuntos, omitidos) respetando max_bytes.
+    """
+    candidatos = []
+    for entrada in entradas:
+        if entrada["tipo"] != "conciliacion":
+            candidatos.extend(json.loads(entrada["adjuntos"] or "[]"))
+    conciliaciones = [entrada for entrada in entradas if entrada["tipo"] == "conciliacion"]
+    if conciliaciones:
+        candidatos.extend(json.loads(conciliaciones[-1]["adjuntos"] or "[]"))
+
+    adjuntos, omitidos, total = [], [], 0
+    for ruta in dict.fromkeys(candidatos):
+        if not os.path.exists(ruta):
+            continue
+        tamano = os.path.getsize(ruta)
+        if max_bytes and total + tamano > max_bytes:
+            omitidos.append(ruta)
+            continue
+        adjuntos.append(ruta)
+        total += tamano
+    return adjuntos, omitidos
+
+
+def _limpiar_adjuntos(conexion, rutas):
+    """
+    Borra los adjuntos de la cola que ya no referencia ninguna entrada pendiente
+    """
+    en_uso = set()
+    for fila in conexion.execute("SELECT adjuntos FROM serfinsa_digest"):
+        en_uso.update(json.loads(fila["adjuntos"] or "[]"))
+    for ruta in set(rutas) - en_uso:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def enviar_digest(logger=None, forzar=False, ruta=None):
+    """
+    Envía el digest si la entrada pendiente más antigua supera la ventana (o si forzar).
+    Retorna el número de entradas enviadas (0 si no correspondía o si falló el envío).
+    """
+    def log(nivel, mensaje):
+        if logger:
+            getattr(logger, nivel)(mensaje)
+        else:
+            print(mensaje)
+
+    notification_email = os.getenv("NOTIFICATION_EMAIL")
+    if not notification_email:
+        log("warning", "⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
+        return 0
+
+    ventana = float(os.getenv("SERFINSA_DIGEST_VENTANA_MINUTOS", "60"))
+    max_bytes = int(float(os.getenv("SERFINSA_DIGEST_MAX_ADJUNTOS_MB", "20")) * 1024 * 1024)
+    reclamo = float(os.getenv("SERFINSA_DIGEST_RECLAMO_MINUTOS", "30"))
+
+    conexion = _conectar(ruta)
+    try:
+        envio, entradas = _reclamar_pendientes(conexion, forzar, ventana, reclamo)
+        if not entradas:
+            return 0
+
+        from email_sender import EmailSender
+
+        try:
+            adjuntos, omitidos = seleccionar_adjuntos(entradas, max_bytes)
+            email_sender = EmailSender()
+            archivos = [entrada for entrada in entradas if entrada["tipo"] == "archivo"]
+            body = email_sender.create_digest_body(
+                [dict(entrada, datos=json.loads(entrada["datos"] or "{}")) for entrada in entradas],
+                [os.path.basename(adjunto) for adjunto in adjuntos],
+                [os.path.basename(omitido) for omitido in omitidos],
+            )
+            success, message = email_sender.send_notification_email(
+                notification_email,
+                f"Resumen de Procesamiento Serfinsa - {len(archivos)} archivos",
+                body,
+                adjuntos=adjuntos,
+            )
+        except Exception as e:
+            success, message = False, str(e)
+
+        if not success:
+            # Se devuelven a la cola para el siguiente intento
+            conexion.execute("UPDATE serfinsa_digest SET envio = NULL, reclamado = NULL WHERE envio = ?", (envio,))
+            conexion.commit()
+            log("error", f"❌ Error enviando el resumen de notificaciones: {message}")
+            return 0
+
+        rutas = [ruta_adjunto for entrada in entradas for ruta_adjunto in json.loads(entrada["adjuntos"] or "[]")]
+        conexion.execute("DELETE FROM serfinsa_digest WHERE envio = ?", (envio,))
+        conexion.commit()
+        _limpiar_adjuntos(conexion, rutas)
+        log("info", f"✅ Resumen de notificaciones enviado: {len(entradas)} entradas, {len(adjuntos)} adjuntos")
+        return len(entradas)
+    finally:
+        conexion.close()
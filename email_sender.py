@@ -20,9 +20,10 @@ class EmailSender:
         self.from_address = os.getenv("MAIL_FROM_ADDRESS", "no-reply@qpaypro.com")
         self.from_name = os.getenv("MAIL_FROM_NAME", "Serfinsa System")
         
-    def send_notification_email(self, to_email, subject, body, log_file_path=None, excel_file_path=None):
+    def send_notification_email(self, to_email, subject, body, log_file_path=None, excel_file_path=None, adjuntos=None):
         """
-        Envía un email de notificación con el resumen del procesamiento
+        Envía un email de notificación con el resumen del procesamiento.
+        adjuntos: rutas de archivos adicionales (por ejemplo, los del digest)
         """
         try:
             # Crear mensaje
@@ -49,10 +50,10 @@ class EmailSender:
                     )
                     msg.attach(part)
             
-            # Agregar archivo Excel como adjunto si existe
+            # Agregar archivo de datos (Excel, CSV o CSV comprimido) como adjunto si existe
             if excel_file_path and os.path.exists(excel_file_path):
                 with open(excel_file_path, "rb") as attachment:
-                    part = MIMEBase('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                    part = MIMEBase('application', self._mime_subtype(excel_file_path))
                     part.set_payload(attachment.read())
                     encoders.encode_base64(part)
                     part.add_header(
@@ -61,6 +62,19 @@ class EmailSender:
                     )
                     msg.attach(part)
             
+            for adjunto in adjuntos or []:
+                if not os.path.exists(adjunto):
+                    continue
+                with open(adjunto, "rb") as attachment:
+                    part = MIMEBase('application', self._mime_subtype(adjunto))
+                    part.set_payload(attachment.read())
+                    encoders.encode_base64(part)
+                    part.add_header(
+                        'Content-Disposition',
+                        f'attachment; filename= {os.path.basename(adjunto)}'
+                    )
+                    msg.attach(part)
+            
             # Conectar al servidor SMTP
             server = smtplib.SMTP(self.smtp_host, self.smtp_port)
             server.starttls()  # Habilitar encriptación TLS
@@ -76,6 +90,18 @@ class EmailSender:
         except Exception as e:
             return False, f"Error enviando email: {str(e)}"
     
+    @staticmethod
+    def _mime_subtype(file_path):
+        """
+        Subtipo MIME del adjunto según la extensión del archivo
+        """
+        nombre = file_path.lower()
+        if nombre.endswith(".gz"):
+            return 'gzip'
+        if nombre.endswith((".csv", ".tsv")):
+            return 'octet-stream'
+        return 'vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    
     def send_alert_email(self, to_email, subject, alert_message, search_path=None):
         """
         Envía un email de alerta cuando no se encuentra el archivo Excel
@@ -221,3 +247,137 @@ class EmailSender:
         </html>
         """
         return html_body
+
+    
+    def create_digest_body(self, entradas, adjuntos, omitidos=None):
+        """
+        Crea el cuerpo HTML del resumen (digest) de varias ejecuciones: una fila por
+        archivo procesado y una por conciliación
+        """
+        archivos = [e for e in entradas if e['tipo'] == 'archivo']
+        conciliaciones = [e for e in entradas if e['tipo'] == 'conciliacion']
+        
+        filas_archivos = "".join(f"""
+                    <tr>
+                        <td>{e['nombre']}</td>
+                        <td>{e['creado']}</td>
+                        <td>{e['datos'].get('inserted', 0)}</td>
+                        <td>{e['datos'].get('skipped', 0)}</td>
+                        <td class="{'error' if e['datos'].get('errors') else ''}">{e['datos'].get('errors', 0)}</td>
+                        <td>{e['datos'].get('transactions_found', 0)}</td>
+                        <td>{e['datos'].get('lotes_creados', 0)}</td>
+                        <td>{e['datos'].get('total_processed', 0)}</td>
+                        <td>{e['datos'].get('processing_time', '-')}</td>
+                    </tr>""" for e in archivos)
+        totales = {
+            clave: sum(int(e['datos'].get(clave) or 0) for e in archivos)
+            for clave in ('inserted', 'skipped', 'errors', 'transactions_found', 'lotes_creados', 'total_processed')
+        }
+        filas_conciliacion = "".join(
+            f"<tr><td>{e['creado']}</td><td>{e['datos'].get('faltantes', 0)}</td></tr>" for e in conciliaciones
+        )
+        seccion_conciliacion = f"""
+            <div class="stats">
+                <h3>🔍 Conciliaciones</h3>
+                <table>
+                    <tr><th>Fecha</th><th>Transacciones faltantes</th></tr>
+                    {filas_conciliacion}
+                </table>
+                <p>Se adjunta solo el reporte más reciente (contiene todas las faltantes a esa hora).</p>
+            </div>""" if conciliaciones else ""
+        lista_adjuntos = "".join(f"<li>{nombre}</li>" for nombre in adjuntos) or "<li>Sin adjuntos</li>"
+        aviso_omitidos = (
+            f"<p class=\"warning\">⚠️ No se adjuntaron por tamaño: {', '.join(omitidos)}</p>" if omitidos else ""
+        )
+        
+        html_body = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; }}
+                .header {{ background-color: #f4f4f4; padding: 15px; border-radius: 5px; }}
+                .warning {{ color: #ffc107; }}
+                .error {{ color: #dc3545; }}
+                .stats {{ background-color: #e9ecef; padding: 10px; border-radius: 5px; margin: 10px 0; }}
+                table {{ border-collapse: collapse; width: 100%; }}
+                th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+                th {{ background-color: #f2f2f2; }}
+            </style>
+        </head>
+        <body>
+            <div class="header">
+                <h2>🚀 Resumen de Procesamiento - Serfinsa</h2>
+                <p><strong>Archivos procesados:</strong> {len(archivos)}</p>
+                <p><strong>Generado:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+            </div>
+            
+            <div class="stats">
+                <h3>📊 Resultado por archivo</h3>
+                <table>
+                    <tr>
+                        <th>Archivo</th>
+                        <th>Fecha</th>
+                        <th>Insertados</th>
+                        <th>Omitidos</th>
+                        <th>Errores</th>
+                        <th>Transaction IDs</th>
+                        <th>Lotes</th>
+                        <th>Total</th>
+                        <th>Tiempo</th>
+                    </tr>{filas_archivos}
+                    <tr>
+                        <th>Total</th>
+                        <th></th>
+                        <th>{totales['inserted']}</th>
+                        <th>{totales['skipped']}</th>
+                        <th>{totales['errors']}</th>
+                        <th>{totales['transactions_found']}</th>
+                        <th>{totales['lotes_creados']}</th>
+                        <th>{totales['total_processed']}</th>
+                        <th></th>
+                    </tr>
+                </table>
+            </div>
+            {seccion_conciliacion}
+            <div>
+                <h4>📎 Archivos adjuntos (sin duplicados, comprimidos):</h4>
+                <ul>{lista_adjuntos}</ul>
+                {aviso_omitidos}
+            </div>
+            
+            <div style="margin-top: 20px; padding: 10px; background-color: #f8f9fa; border-radius: 5px;">
+                <p><strong>Nota:</strong> Este es un mensaje automático generado por el sistema de procesamiento de Serfinsa.</p>
+            </div>
+        </body>
+        </html>
+        """
+        return html_body
+
+def enviar_alerta_sin_archivo(search_path=None):
+    """
+    Envía el email de alerta cuando no se encontró archivo para procesar
+    """
+    notification_email = os.getenv("NOTIFICATION_EMAIL")
+    if not notification_email:
+        print("⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
+        return False
+
+    print("📧 Enviando email de alerta...")
+
+    email_sender = EmailSender()
+    subject = "Incidencia - No se encontró archivo Excel para procesar"
+    alert_message = "No se encontró ningún archivo Excel para procesar."
+
+    success, message = email_sender.send_alert_email(
+        notification_email,
+        subject,
+        alert_message,
+        search_path
+    )
+
+    if success:
+        print("✅ Email de alerta enviado exitosamente")
+    else:
+        print(f"❌ Error enviando email de alerta: {message}")
+    return success
@@ -0,0 +1,222 @@
+"""
+Fecha y hora de la transacción en una sola columna DATETIME (FECHA_HORA_TRAN).
+
+FECHA_TRAN y HORA_TRAN llegan por separado y en la forma que traiga el archivo (fecha
+de Excel o serial numérico, AAAAMMDD, texto día/mes/año, HH:MM:SS, HHMMSS, con AM/PM,
+objeto time, fracción de día...). Al normalizar el archivo ambas se
+combinan con operaciones vectorizadas en FECHA_HORA_TRAN, que se inserta junto con la
+fila y tiene índice propio: la asignación de lotes y las ventanas de emparejamiento
+filtran por rango (FECHA_HORA_TRAN >= desde AND < hasta) en lugar de DATE(FECHA_TRAN).
+
+Las filas ya existentes se completan por bloques con rellenar_fecha_hora
+(serfinsa.py backfill-fecha-hora); la creación de lotes completa antes las que le faltan.
+"""
+
+import os
+from datetime import datetime, time, timedelta
+
+COLUMNA_FECHA_HORA = "FECHA_HORA_TRAN"
+INDICE_FECHA_HORA = "idx_liquidaciones_fecha_hora_tran"
+SEGUNDOS_DIA = 86400
+
+# Fechas de transacción aceptadas: años fuera de este rango son errores de lectura
+# (p. ej. un número interpretado como nanosegundos desde 1970)
+ANIO_MINIMO = 2000
+# Origen de los seriales de fecha de Excel (sistema 1900)
+ORIGEN_EXCEL = "1899-12-30"
+# Fechas ISO (año primero); el resto del texto se interpreta con el día primero
+PATRON_FECHA_ISO = r"^\d{4}[-/.]\d{1,2}[-/.]\d{1,2}"
+
+# HH:MM[:SS] o HHMM[SS], con fracción y AM/PM opcionales (también como texto de un
+# número) y opcionalmente precedida de la fecha (horas leídas del Excel como fecha y hora)
+PATRON_HORA = (
+    r"^(?:\d{4}-\d{2}-\d{2}[ T])?(\d{1,2}):?(\d{2})(?::?(\d{2}))?(?:\.\d+)?"
+    r"(?:\s*([AaPp])\.?\s*[Mm]\.?)?$"
+)
+
+# Evita consultar INFORMATION_SCHEMA antes de cada inserción
+_columna_verificada = {"existe": False}
+
+
+def _segundos_objeto(valor):
+    """
+    Segundos desde medianoche de una hora que llega como objeto (datetime.time,
+    datetime/Timestamp o timedelta de menos de un día); NaN para cualquier otro valor
+    """
+    if isinstance(valor, timedelta):
+        segundos = valor.total_seconds()
+        return float(int(segundos)) if 0 <= segundos < SEGUNDOS_DIA else float("nan")
+    if isinstance(valor, (time, datetime)):
+        return float(valor.hour * 3600 + valor.minute * 60 + valor.second)
+    return float("nan")
+
+
+def partes_hora(horas):
+    """
+    DataFrame con hora, minuto y segundo (float, NaN si no se pudo interpretar) de cada
+    valor de la serie, en 24 horas. Además del texto acepta objetos time/datetime/timedelta
+    y fracciones de día de Excel (números en [0, 1), p. ej. 0.604 = 14:29:46).
+    """
+    import pandas as pd
+
+    horas = pd.Series(horas, dtype=object)
+    partes = horas.astype(str).str.strip().str.extract(PATRON_HORA)
+    hora = pd.to_numeric(partes[0], errors="coerce")
+    minuto = pd.to_numeric(partes[1], errors="coerce")
+    segundo = pd.to_numeric(partes[2], errors="coerce").fillna(0)
+
+    meridiano = partes[3].str.upper()
+    hora = hora.mask(meridiano.notna() & ((hora > 12) | (hora == 0)))
+    hora = hora.mask((meridiano == "P") & (hora < 12), hora + 12)
+    hora = hora.mask((meridiano == "A") & (hora == 12), 0)
+
+    # Horas que no llegan como texto: fracción de día o objeto de hora
+    numeros = pd.to_numeric(horas, errors="coerce")
+    fracciones = numeros.where((numeros >= 0) & (numeros < 1))
+    directos = (fracciones * SEGUNDOS_DIA).round().clip(upper=SEGUNDOS_DIA - 1)
+    directos = directos.fillna(horas.map(_segundos_objeto).astype("float64"))
+    con_directo = directos.notna()
+    hora = hora.mask(con_directo, directos // 3600)
+    minuto = minuto.mask(con_directo, directos % 3600 // 60)
+    segundo = segundo.mask(con_directo, directos % 60)
+
+    validas = (hora < 24) & (minuto < 60) & (segundo < 60)
+    return pd.DataFrame({
+        "hora": hora.where(validas),
+        "minuto": minuto.where(validas),
+        "segundo": segundo.where(validas),
+    }, index=horas.index)
+
+
+def interpretar_fechas(fechas):
+    """
+    Serie datetime64 con la fecha de cada valor (NaT si no se puede interpretar):
+    - números de 8 dígitos como AAAAMMDD (20240105) y el resto de números como serial
+      de Excel (45296 = 2024-01-05), también si llegan como texto;
+    - texto ISO (2024-01-05) con el año primero y cualquier otro texto con el día
+      primero (05/01/2024 = 5 de enero);
+    - objetos date/datetime tal cual.
+    Los años anteriores a ANIO_MINIMO o posteriores al siguiente se descartan (NaT).
+    """
+    import pandas as pd
+
+    valores = pd.Series(fechas, dtype=object)
+    resultado = pd.Series(pd.NaT, index=valores.index, dtype="datetime64[ns]")
+
+    numeros = pd.to_numeric(valores, errors="coerce")
+    aaaammdd = numeros.between(10000101, 99991231) & (numeros % 1 == 0)
+    if aaaammdd.any():
+        resultado[aaaammdd] = pd.to_datetime(
+            numeros[aaaammdd].astype("int64").astype(str), format="%Y%m%d", errors="coerce"
+        )
+    seriales = numeros.notna() & ~aaaammdd & numeros.between(1, 2958465)
+    if seriales.any():
+        resultado[seriales] = pd.Timestamp(ORIGEN_EXCEL) + pd.to_timedelta(numeros[seriales], unit="D")
+
+    otros = numeros.isna() & valores.notna()
+    if otros.any():
+        iso = otros & valores.astype(str).str.strip().str.match(PATRON_FECHA_ISO)
+        dia_primero = otros & ~iso
+        if iso.any():
+            resultado[iso] = pd.to_datetime(valores[iso], errors="coerce", format="mixed")
+        if dia_primero.any():
+            resultado[dia_primero] = pd.to_datetime(valores[dia_primero], errors="coerce", format="mixed", dayfirst=True)
+
+    anios = resultado.dt.year
+    return resultado.where((anios >= ANIO_MINIMO) & (anios <= datetime.now().year + 1))
+
+
+def combinar_fecha_hora(fechas, horas):
+    """
+    Serie datetime64 con la fecha de FECHA_TRAN (interpretar_fechas) y la hora de
+    HORA_TRAN. Si la hora falta o no se puede interpretar queda la de FECHA_TRAN; si la
+    fecha no se puede interpretar el resultado es NaT.
+    """
+    import pandas as pd
+
+    fechas = interpretar_fechas(fechas)
+    horas = pd.Series(horas, dtype=object, index=fechas.index)
+    presentes = horas.notna()
+
+    partes = partes_hora(horas[presentes])
+    segundos = partes["hora"] * 3600 + partes["minuto"] * 60 + partes["segundo"]
+    con_hora = segundos.notna().reindex(fechas.index, fill_value=False)
+    desplazamiento = pd.to_timedelta(segundos.reindex(fechas.index), unit="s")
+
+    return fechas.where(~con_hora, fechas.dt.normalize() + desplazamiento)
+
+
+def asegurar_columna_fecha_hora(cursor):
+    """
+    Agrega FECHA_HORA_TRAN (DATETIME, con índice) a LiquidacionesSV si no existe
+    """
+    if _columna_verificada["existe"]:
+        return
+
+    from dialectos import obtener_dialecto
+
+    dialecto = obtener_dialecto(cursor)
+    if COLUMNA_FECHA_HORA not in dialecto.columnas_tabla(cursor, "LiquidacionesSV"):
+        dialecto.agregar_columna(
+            cursor, "LiquidacionesSV", COLUMNA_FECHA_HORA, "DATETIME NULL",
+            despues="HORA_TRAN", indice=INDICE_FECHA_HORA,
+        )
+        print(f"✅ Columna {COLUMNA_FECHA_HORA} agregada a la tabla LiquidacionesSV")
+    _columna_verificada["existe"] = True
+
+
+def rellenar_fecha_hora(cursor, conn, logger=None, tamano_bloque=None, solo_pendientes_lote=False):
+    """
+    Completa FECHA_HORA_TRAN de las filas que no la tienen, por bloques de SEQ_NUM
+    (SERFINSA_FECHA_HORA_TAMANO_BLOQUE) con un UPDATE en bloque y un commit por bloque.
+    Con solo_pendientes_lote se limita a las filas con business_id y sin lote_id.
+    Las filas sin SEQ_NUM o con FECHA_TRAN no interpretable se dejan como están.
+    Retorna las filas actualizadas.
+    """
+    import pandas as pd
+
+    from dialectos import obtener_dialecto
+
+    if tamano_bloque is None:
+        tamano_bloque = int(os.getenv("SERFINSA_FECHA_HORA_TAMANO_BLOQUE", "1000"))
+
+    asegurar_columna_fecha_hora(cursor)
+    dialecto = obtener_dialecto(cursor)
+    filtro = "AND business_id IS NOT NULL AND lote_id IS NULL" if solo_pendientes_lote else ""
+
+    actualizadas = 0
+    ultimo_seq_num = ""
+    while True:
+        cursor.execute(f"""
+            SELECT SEQ_NUM, FECHA_TRAN, HORA_TRAN
+            FROM LiquidacionesSV
+            WHERE {COLUMNA_FECHA_HORA} IS NULL
+            AND FECHA_TRAN IS NOT NULL
+            AND SEQ_NUM IS NOT NULL
+            AND SEQ_NUM > %s
+            {filtro}
+            ORDER BY SEQ_NUM
+            LIMIT %s
+        """, (ultimo_seq_num, tamano_bloque))
+        filas = cursor.fetchall()
+        if not filas:
+            break
+        ultimo_seq_num = str(filas[-1]["SEQ_NUM"])
+
+        fechas_hora = combinar_fecha_hora(
+            [fila["FECHA_TRAN"] for fila in filas], [fila["HORA_TRAN"] for fila in filas]
+        )
+        asignaciones = [
+            (str(fila["SEQ_NUM"]), fecha_hora.to_pydatetime())
+            for fila, fecha_hora in zip(filas, fechas_hora) if not pd.isna(fecha_hora)
+        ]
+        if asignaciones:
+            actualizadas += dialecto.actualizar_desde_filas(
+                cursor, "LiquidacionesSV", ("SEQ_NUM", "seq_num"), ["seq_num", "fecha_hora"], asignaciones,
+                {COLUMNA_FECHA_HORA: "fecha_hora"}, condicion=f"t.{COLUMNA_FECHA_HORA} IS NULL",
+            )
+        conn.commit()
+
+    if logger and actualizadas:
+        logger.info(f"🕒 {COLUMNA_FECHA_HORA} completada en {actualizadas} filas")
+    return actualizadas
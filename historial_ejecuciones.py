@@ -0,0 +1,270 @@
+"""
+Historial de ejecuciones del procesador (tabla serfinsa_runs en SQLite local).
+
+Por cada ejecución se guarda el archivo, los contadores del resumen, la duración de
+cada etapa, las idas y vueltas a la base de datos (execute + commits) y el pico de
+memoria residente. Al terminar se compara con la mediana de las últimas
+SERFINSA_HISTORIAL_VENTANA ejecuciones correctas y se envía una alerta por email si
+una etapa tardó SERFINSA_ALERTA_FACTOR veces más de lo habitual o si el rendimiento
+(filas por segundo) cayó por debajo del umbral.
+"""
+
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from perfilado import etapa_perfilada
+
+load_dotenv()
+
+HISTORIAL_DB = os.getenv(
+    "SERFINSA_HISTORIAL_DB", os.path.join(os.getcwd(), "logs", "serfinsa_runs.sqlite3")
+)
+
+
+class CursorMedido:
+    """
+    Envuelve un cursor y cuenta cada execute/executemany como una ida y vuelta
+    """
+
+    def __init__(self, cursor, medidor):
+        self._cursor = cursor
+        self._medidor = medidor
+
+    def execute(self, *args, **kwargs):
+        self._medidor.round_trips += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._medidor.round_trips += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+class MedidorEjecucion:
+    def __init__(self, archivo, run_id=None, perfilador=None):
+        self.archivo = archivo
+        self.run_id = run_id
+        self.perfilador = perfilador
+        self.inicio = datetime.now()
+        self.etapas = {}
+        self.round_trips = 0
+        self.commits = 0
+
+    @contextmanager
+    def etapa(self, nombre):
+        """
+        Mide la duración de una etapa (se acumula si la etapa se repite) y, si hay
+        perfilador, la perfila con cProfile y tracemalloc
+        """
+        # La duración se mide dentro del perfilado para no incluir sus instantáneas
+        with etapa_perfilada(self.perfilador, nombre):
+            inicio = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.etapas[nombre] = self.etapas.get(nombre, 0.0) + time.perf_counter() - inicio
+
+    def medir_cursor(self, cursor):
+        return CursorMedido(cursor, self)
+
+    @staticmethod
+    def rss_pico_mb():
+        """
+        Pico de memoria residente del proceso en MB, o None si no se puede obtener
+        """
+        try:
+            import resource
+        except ImportError:
+            return None
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa KB; macOS, bytes
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def _conectar(ruta=None):
+    ruta = ruta or HISTORIAL_DB
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    conexion = sqlite3.connect(ruta)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS serfinsa_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT,
+            archivo TEXT,
+            inicio TEXT NOT NULL,
+            exito INTEGER NOT NULL,
+            filas INTEGER,
+            insertados INTEGER,
+            omitidos INTEGER,
+            errores INTEGER,
+            encontrados INTEGER,
+            lotes INTEGER,
+            duracion_total REAL,
+            filas_por_segundo REAL,
+            round_trips INTEGER,
+            commits INTEGER,
+            rss_pico_mb REAL,
+            etapas TEXT
+        )
+    """)
+    conexion.execute("CREATE INDEX IF NOT EXISTS idx_serfinsa_runs_exito_id ON serfinsa_runs (exito, id)")
+    return conexion
+
+
+def guardar_ejecucion(conexion, medidor, summary_stats, duracion_total, exito=True):
+    """
+    Inserta la ejecución en serfinsa_runs y retorna su id
+    """
+    summary_stats = summary_stats or {}
+    filas = summary_stats.get("total_processed")
+    filas_por_segundo = (filas / duracion_total) if filas and duracion_total else None
+    cursor = conexion.execute("""
+        INSERT INTO serfinsa_runs (
+            run_id, archivo, inicio, exito, filas, insertados, omitidos, errores,
+            encontrados, lotes, duracion_total, filas_por_segundo, round_trips, commits,
+            rss_pico_mb, etapas
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        medidor.run_id,
+        os.path.basename(medidor.archivo) if medidor.archivo else None,
+        medidor.inicio.isoformat(timespec="seconds"),
+        1 if exito else 0,
+        filas,
+        summary_stats.get("inserted"),
+        summary_stats.get("skipped"),
+        summary_stats.get("errors"),
+        summary_stats.get("transactions_found"),
+        summary_stats.get("lotes_creados"),
+        duracion_total,
+        filas_por_segundo,
+        medidor.round_trips + medidor.commits,
+        medidor.commits,
+        medidor.rss_pico_mb(),
+        json.dumps(medidor.etapas),
+    ))
+    conexion.commit()
+    return cursor.lastrowid
+
+
+def evaluar_regresion(conexion, run_pk):
+    """
+    Compara la ejecución run_pk con la mediana de las ejecuciones correctas anteriores.
+    Retorna una lista de mensajes (vacía si no hay regresión o no hay historial suficiente).
+    """
+    ventana = int(os.getenv("SERFINSA_HISTORIAL_VENTANA", "20"))
+    min_muestras = int(os.getenv("SERFINSA_HISTORIAL_MIN_MUESTRAS", "5"))
+    factor = float(os.getenv("SERFINSA_ALERTA_FACTOR", "3"))
+    min_segundos = float(os.getenv("SERFINSA_ALERTA_MIN_SEGUNDOS", "5"))
+    min_filas = int(os.getenv("SERFINSA_ALERTA_MIN_FILAS", "100"))
+    umbral_filas_segundo = float(os.getenv("SERFINSA_ALERTA_FILAS_POR_SEGUNDO", "0"))
+
+    actual = conexion.execute("SELECT * FROM serfinsa_runs WHERE id = ?", (run_pk,)).fetchone()
+    if actual is None:
+        return []
+
+    anteriores = conexion.execute("""
+        SELECT etapas, filas_por_segundo FROM serfinsa_runs
+        WHERE exito = 1 AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    """, (run_pk, ventana)).fetchall()
+
+    alertas = []
+    filas_segundo = actual["filas_por_segundo"]
+    if (
+        umbral_filas_segundo and filas_segundo is not None
+        and (actual["filas"] or 0) >= min_filas and filas_segundo < umbral_filas_segundo
+    ):
+        alertas.append(f"Rendimiento de {filas_segundo:.1f} filas/s, por debajo del umbral de {umbral_filas_segundo:.1f} filas/s")
+
+    if len(anteriores) < min_muestras:
+        return alertas
+
+    etapas_actuales = json.loads(actual["etapas"] or "{}")
+    etapas_anteriores = [json.loads(fila["etapas"] or "{}") for fila in anteriores]
+    for etapa, duracion in etapas_actuales.items():
+        muestras = [etapas[etapa] for etapas in etapas_anteriores if etapa in etapas]
+        if len(muestras) < min_muestras:
+            continue
+        mediana = statistics.median(muestras)
+        if duracion > factor * mediana and duracion - mediana >= min_segundos:
+            alertas.append(f"La etapa '{etapa}' tardó {duracion:.1f}s (mediana {mediana:.1f}s, {duracion / mediana if mediana else float('inf'):.1f}x)")
+
+    muestras_fps = [fila["filas_por_segundo"] for fila in anteriores if fila["filas_por_segundo"]]
+    if filas_segundo is not None and (actual["filas"] or 0) >= min_filas and len(muestras_fps) >= min_muestras:
+        mediana_fps = statistics.median(muestras_fps)
+        if filas_segundo < mediana_fps / factor:
+            alertas.append(f"Rendimiento de {filas_segundo:.1f} filas/s (mediana {mediana_fps:.1f} filas/s)")
+
+    return alertas
+
+
+def enviar_alerta_regresion(medidor, alertas):
+    """
+    Envía por email las alertas de rendimiento de la ejecución
+    """
+    notification_email = os.getenv("NOTIFICATION_EMAIL")
+    if not notification_email:
+        print("⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
+        return False
+
+    from email_sender import EmailSender
+
+    nombre = os.path.basename(medidor.archivo) if medidor.archivo else "sin archivo"
+    filas_etapas = "".join(
+        f"<tr><td>{etapa}</td><td>{duracion:.2f} s</td></tr>" for etapa, duracion in medidor.etapas.items()
+    )
+    body = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; margin: 20px;">
+            <h2>⚠️ Regresión de rendimiento en el procesamiento de Serfinsa</h2>
+            <p><strong>Archivo:</strong> {nombre}</p>
+            <p><strong>Ejecución:</strong> {medidor.run_id or '-'}</p>
+            <ul>{"".join(f"<li>{alerta}</li>" for alerta in alertas)}</ul>
+            <table border="1" cellpadding="6" style="border-collapse: collapse;">
+                <tr><th>Etapa</th><th>Duración</th></tr>
+                {filas_etapas}
+            </table>
+        </body>
+        </html>
+    """
+    success, message = EmailSender().send_notification_email(
+        notification_email, f"Alerta de rendimiento Serfinsa - {nombre}", body
+    )
+    print(("✅ " if success else "❌ ") + message)
+    return success
+
+
+def registrar_ejecucion(medidor, summary_stats, duracion_total, logger, exito=True, ruta=None):
+    """
+    Guarda la ejecución en el historial y alerta si hay regresión de rendimiento.
+    Nunca interrumpe el proceso: los errores solo se registran en el log.
+    """
+    try:
+        conexion = _conectar(ruta)
+        try:
+            run_pk = guardar_ejecucion(conexion, medidor, summary_stats, duracion_total, exito)
+            alertas = evaluar_regresion(conexion, run_pk) if exito else []
+        finally:
+            conexion.close()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo registrar la ejecución en el historial: {e}")
+        return []
+
+    etapas = ", ".join(f"{etapa} {duracion:.2f}s" for etapa, duracion in medidor.etapas.items())
+    logger.info(f"📈 Ejecución registrada en el historial: {etapas}; {medidor.round_trips + medidor.commits} idas y vueltas a la BD")
+    for alerta in alertas:
+        logger.warning(f"⚠️ Regresión de rendimiento: {alerta}")
+    if alertas:
+        enviar_alerta_regresion(medidor, alertas)
+    return alertas
@@ -0,0 +1,651 @@
+"""
+Registro de lectores de archivos de liquidación.
+
+Cada lector se registra con los patrones de archivo que acepta. Al leer se elige el
+primer lector disponible (por prioridad) cuyo patrón coincide con el nombre del
+archivo. Todos los lectores entregan el mismo DataFrame de 40 columnas en el orden
+de COLUMNAS_LIQUIDACION, de modo que el resto del proceso no depende del formato.
+
+Con SERFINSA_XLSX_WORKERS=N (N > 1, requiere pyarrow) los .xlsx grandes se parsean por
+rangos de SERFINSA_XLSX_FILAS_POR_RANGO filas en N procesos (lector xlsx-paralelo).
+"""
+
+import fnmatch
+import functools
+import gzip
+import importlib.util
+import os
+import re
+import unicodedata
+
+# Columnas de LiquidacionesSV en el orden en que se insertan
+COLUMNAS_LIQUIDACION = [
+    "FECHA_TRAN", "HORA_TRAN", "ID_PAG", "SUCURSAL_I", "TERMINAL_I", "AFILIADO", "NOMBRE_COM",
+    "EMISOR_ID", "PAN", "MONTO_TRAN", "MONTO_AJUS", "MONTO_TEXE", "SUBTOTAL", "MONTO_IVA",
+    "COMISIONAB", "COM_PORCEN", "COM_MONTO", "COM_MTOIVA", "RETENCION2", "RETENIDO",
+    "MONTO_DEBI", "DEPOSITO", "CCFNO", "DCLNO", "TIPO_TRANS", "MESES_PLZO", "PAGADO",
+    "BCO_PAGO", "NUMCTA", "REG_FISCAL", "IVA_PORC", "APROBAC", "TC", "TYP", "SEQ_NUM",
+    "INVOIC_NUM", "RESP_CDE", "MODO_ENTRA", "COMPRADOR", "ORDEN_ID",
+]
+
+# Otros nombres con los que llegan las columnas (se comparan sin acentos, en
+# mayúsculas y con cualquier separador como guion bajo)
+ALIAS_COLUMNAS = {
+    "FECHA_TRAN": ("FECHA", "FECHA_TRANSACCION"),
+    "HORA_TRAN": ("HORA", "HORA_TRANSACCION"),
+    "MONTO_TRAN": ("MONTO", "MONTO_TRANSACCION"),
+    "NOMBRE_COM": ("NOMBRE_COMERCIO",),
+    "APROBAC": ("APROBACION", "AUTORIZACION", "COD_AUTORIZACION"),
+    "SEQ_NUM": ("SEQNUM", "SECUENCIA", "NUM_SECUENCIA"),
+    "INVOIC_NUM": ("INVOICE_NUM", "FACTURA"),
+    "ORDEN_ID": ("ORDEN", "ORDER_ID"),
+}
+
+# Prefijo de los archivos que envía el procesador
+PREFIJO_ARCHIVO = "Serfinsa"
+
+_LECTORES = []
+
+
+def registrar_lector(nombre, patrones, prioridad=100, disponible=None, encabezados=None):
+    """
+    Decorador para registrar una función lectora. La función recibe la ruta del
+    archivo y el MapeoColumnas (o None) y devuelve un DataFrame crudo con solo las
+    columnas del mapeo. encabezados(ruta) lee únicamente la fila de encabezados; si el
+    lector no la indica se parsean todas las columnas y se mapean después.
+    Menor prioridad = se prueba antes.
+    """
+    def decorador(funcion):
+        _LECTORES.append({
+            "nombre": nombre,
+            "patrones": tuple(patrones),
+            "prioridad": prioridad,
+            "disponible": disponible or (lambda: True),
+            "leer": funcion,
+            "encabezados": encabezados,
+        })
+        _LECTORES.sort(key=lambda lector: lector["prioridad"])
+        return funcion
+    return decorador
+
+
+def _modulo_instalado(nombre_modulo):
+    return importlib.util.find_spec(nombre_modulo) is not None
+
+
+def patrones_soportados():
+    """
+    Patrones glob (con el prefijo del procesador) de todos los lectores disponibles
+    """
+    patrones = []
+    for lector in _LECTORES:
+        if not lector["disponible"]():
+            continue
+        for patron in lector["patrones"]:
+            patron_completo = PREFIJO_ARCHIVO + patron
+            if patron_completo not in patrones:
+                patrones.append(patron_completo)
+    return patrones
+
+
+def obtener_lector(file_path):
+    """
+    Devuelve el primer lector disponible cuyo patrón coincide con el archivo
+    """
+    nombre_archivo = os.path.basename(file_path).lower()
+    for lector in _LECTORES:
+        if not lector["disponible"]():
+            continue
+        if any(fnmatch.fnmatch(nombre_archivo, patron.lower()) for patron in lector["patrones"]):
+            return lector
+    return None
+
+
+def normalizar_encabezado(texto):
+    """
+    Forma comparable de un encabezado: sin acentos, en mayúsculas y con cualquier
+    separador (espacio, guion, punto) como guion bajo
+    """
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Z0-9]+", "_", texto.upper()).strip("_")
+
+
+def _indice_alias(alias_configurados):
+    """
+    Encabezado normalizado -> columna de LiquidacionesSV, con los alias conocidos y los
+    configurados en SERFINSA_ALIAS_COLUMNAS ("ALIAS=COLUMNA,OTRO ALIAS=COLUMNA")
+    """
+    indice = {normalizar_encabezado(columna): columna for columna in COLUMNAS_LIQUIDACION}
+    for columna, alias in ALIAS_COLUMNAS.items():
+        for nombre in alias:
+            indice[normalizar_encabezado(nombre)] = columna
+    for par in alias_configurados.split(","):
+        alias, _, columna = par.partition("=")
+        if alias.strip() and columna.strip() in COLUMNAS_LIQUIDACION:
+            indice[normalizar_encabezado(alias)] = columna.strip()
+    return indice
+
+
+class MapeoColumnas:
+    """
+    Mapeo compilado de los encabezados de un archivo a las columnas de LiquidacionesSV.
+    usecols: posiciones (0-based, en orden) de las columnas del archivo que se leen.
+    nombres: columna de LiquidacionesSV de cada posición de usecols.
+    origen: {columna: encabezado del archivo}. extras: encabezados que no se leen.
+    """
+
+    def __init__(self, usecols, nombres, origen, extras, posicional=False):
+        self.usecols = usecols
+        self.nombres = nombres
+        self.origen = origen
+        self.extras = extras
+        self.posicional = posicional
+
+    def aplicar(self, df):
+        """
+        Renombra y ordena las columnas leídas (las de usecols, en orden del archivo)
+        """
+        if len(df.columns) != len(self.nombres):
+            raise ValueError(
+                f"Se esperaban {len(self.nombres)} columnas mapeadas y se leyeron {len(df.columns)}"
+            )
+        df.columns = self.nombres
+        return df[COLUMNAS_LIQUIDACION]
+
+
+def compilar_mapeo(encabezados):
+    """
+    Compila (una vez por disposición de encabezados y valor de SERFINSA_ALIAS_COLUMNAS)
+    el mapeo encabezado -> columna.
+    Si el archivo trae exactamente 40 columnas y los encabezados reconocidos (si hay
+    alguno) están en su posición de la tabla, se asume el orden posicional
+    (comportamiento histórico del Excel). En otro caso, columnas faltantes o
+    duplicadas lanzan ValueError en lugar de desalinear en silencio.
+    """
+    return _compilar_mapeo(tuple(encabezados), os.getenv("SERFINSA_ALIAS_COLUMNAS", ""))
+
+
+@functools.lru_cache(maxsize=64)
+def _compilar_mapeo(encabezados, alias_configurados):
+    encabezados = tuple("" if encabezado is None else str(encabezado).strip() for encabezado in encabezados)
+    indice = _indice_alias(alias_configurados)
+
+    posiciones = {}
+    extras = []
+    for posicion, encabezado in enumerate(encabezados):
+        columna = indice.get(normalizar_encabezado(encabezado))
+        if columna is None:
+            extras.append(encabezado)
+        elif columna in posiciones:
+            raise ValueError(
+                f"Las columnas '{encabezados[posiciones[columna]]}' y '{encabezado}' corresponden ambas a {columna}"
+            )
+        else:
+            posiciones[columna] = posicion
+
+    faltantes = [columna for columna in COLUMNAS_LIQUIDACION if columna not in posiciones]
+    if faltantes and len(encabezados) == len(COLUMNAS_LIQUIDACION) and all(
+        COLUMNAS_LIQUIDACION[posicion] == columna for columna, posicion in posiciones.items()
+    ):
+        return MapeoColumnas(
+            list(range(len(encabezados))), list(COLUMNAS_LIQUIDACION),
+            dict(zip(COLUMNAS_LIQUIDACION, encabezados)), [], posicional=True,
+        )
+
+    if faltantes:
+        raise ValueError(
+            f"El archivo tiene {len(encabezados)} columnas y le faltan: {', '.join(faltantes)}"
+            + (f" (columnas no reconocidas: {', '.join(extras)})" if extras else "")
+        )
+
+    ordenadas = sorted(posiciones.items(), key=lambda item: item[1])
+    return MapeoColumnas(
+        [posicion for _, posicion in ordenadas],
+        [columna for columna, _ in ordenadas],
+        {columna: encabezados[posicion] for columna, posicion in ordenadas},
+        extras,
+    )
+
+
+def ajustar_columnas(df):
+    """
+    Deja el DataFrame con las 40 columnas de LiquidacionesSV en el orden esperado,
+    mapeando sus encabezados (para lectores que no leen los encabezados por separado)
+    """
+    mapeo = compilar_mapeo(tuple(df.columns))
+    return mapeo.aplicar(df.iloc[:, mapeo.usecols].copy())
+
+
+def leer_archivo(file_path):
+    """
+    Lee el archivo con el lector que corresponda y devuelve (df, nombre_lector).
+    Si el lector sabe leer solo los encabezados, el mapeo se compila antes de parsear
+    y se leen únicamente las columnas mapeadas (usecols).
+    """
+    lector = obtener_lector(file_path)
+    if lector is None:
+        raise ValueError(f"No hay un lector registrado para el archivo {os.path.basename(file_path)}")
+
+    if lector["encabezados"] is None:
+        return ajustar_columnas(lector["leer"](file_path, None)), lector["nombre"]
+
+    mapeo = compilar_mapeo(tuple(lector["encabezados"](file_path)))
+    if mapeo.extras:
+        print(f"ℹ️ Columnas ignoradas del archivo: {', '.join(mapeo.extras)}")
+    if mapeo.posicional:
+        print("⚠️ Encabezados no reconocidos: se asume el orden de columnas de LiquidacionesSV")
+    return mapeo.aplicar(lector["leer"](file_path, mapeo)), lector["nombre"]
+
+
+def _detectar_separador(linea, por_defecto):
+    candidatos = [por_defecto, ",", ";", "\t", "|"]
+    return max(candidatos, key=lambda sep: linea.count(sep)) if linea else por_defecto
+
+
+def _primera_linea(file_path, compression=None):
+    abrir = gzip.open if compression == "gzip" else open
+    with abrir(file_path, "rt", encoding="utf-8-sig", errors="replace") as f:
+        return f.readline()
+
+
+def _encabezados_delimitado(file_path, separador, compression=None):
+    import csv
+
+    linea = _primera_linea(file_path, compression)
+    return next(csv.reader([linea.rstrip("\r\n")], delimiter=_detectar_separador(linea, separador)), [])
+
+
+def _leer_delimitado(file_path, separador, compression=None, mapeo=None):
+    import pandas as pd
+
+    encabezado = _primera_linea(file_path, compression)
+    seq_num = mapeo.origen["SEQ_NUM"] if mapeo else "SEQ_NUM"
+    aprobac = mapeo.origen["APROBAC"] if mapeo else "APROBAC"
+
+    return pd.read_csv(
+        file_path,
+        sep=_detectar_separador(encabezado, separador),
+        compression=compression,
+        encoding="utf-8-sig",
+        usecols=mapeo.usecols if mapeo else None,
+        # SEQ_NUM y APROBAC como texto para no perder ceros ni convertirlos a float
+        dtype={seq_num: str, aprobac: str},
+    )
+
+
+def _encabezados_xlsx(file_path):
+    """
+    Fila de encabezados de la primera hoja, la que lee pd.read_excel (modo de solo
+    lectura: no parsea el resto)
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        return next(wb.worksheets[0].iter_rows(min_row=1, max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+
+
+@registrar_lector("xlsx-calamine", ("*.xlsx",), prioridad=10,
+                  disponible=lambda: _modulo_instalado("python_calamine"), encabezados=_encabezados_xlsx)
+def leer_xlsx_calamine(file_path, mapeo=None):
+    import pandas as pd
+    return pd.read_excel(file_path, engine="calamine", usecols=mapeo.usecols if mapeo else None)
+
+
+@registrar_lector("xlsx-openpyxl", ("*.xlsx",), prioridad=20, encabezados=_encabezados_xlsx)
+def leer_xlsx_openpyxl(file_path, mapeo=None):
+    import pandas as pd
+    return pd.read_excel(file_path, engine="openpyxl", usecols=mapeo.usecols if mapeo else None)
+
+
+def _workers_xlsx():
+    try:
+        return int(os.getenv("SERFINSA_XLSX_WORKERS", "0"))
+    except ValueError:
+        return 0
+
+
+def _nombre_local(etiqueta):
+    return etiqueta.rsplit("}", 1)[-1]
+
+
+def _libro_xlsx(zf):
+    """
+    Lo que hace falta para convertir las celdas de la primera hoja, leído directamente
+    del zip (sin API privada de openpyxl): ruta de la hoja, textos compartidos, tipo de
+    formato de cada estilo ('fecha', 'duracion' o None) y época del libro.
+    """
+    import posixpath
+    import xml.etree.ElementTree as ET
+
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+    from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+
+    nombres = set(zf.namelist())
+    libro = ET.fromstring(zf.read("xl/workbook.xml"))
+    epoch = CALENDAR_WINDOWS_1900
+    hoja_id = None
+    for elemento in libro.iter():
+        nombre = _nombre_local(elemento.tag)
+        if nombre == "workbookPr" and elemento.get("date1904") in ("1", "true"):
+            epoch = CALENDAR_MAC_1904
+        elif nombre == "sheet" and hoja_id is None:
+            # Primera hoja del libro, como pd.read_excel (no la hoja activa)
+            hoja_id = next(valor for clave, valor in elemento.attrib.items() if _nombre_local(clave) == "id")
+
+    relaciones = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    destino = next(rel.get("Target") for rel in relaciones if rel.get("Id") == hoja_id)
+    ruta_hoja = destino.lstrip("/") if destino.startswith("/") else posixpath.normpath(posixpath.join("xl", destino))
+
+    compartidos = []
+    if "xl/sharedStrings.xml" in nombres:
+        with zf.open("xl/sharedStrings.xml") as src:
+            for _, elemento in ET.iterparse(src):
+                if _nombre_local(elemento.tag) != "si":
+                    continue
+                # Texto plano (<t>) o enriquecido (<r><t>); sin la fonética (<rPh>)
+                partes = []
+                for hijo in elemento:
+                    if _nombre_local(hijo.tag) == "t":
+                        partes.append(hijo.text or "")
+                    elif _nombre_local(hijo.tag) == "r":
+                        partes.extend(t.text or "" for t in hijo if _nombre_local(t.tag) == "t")
+                compartidos.append("".join(partes))
+                elemento.clear()
+
+    formatos = []
+    if "xl/styles.xml" in nombres:
+        estilos = ET.fromstring(zf.read("xl/styles.xml"))
+        codigos = dict(BUILTIN_FORMATS)
+        for elemento in estilos.iter():
+            if _nombre_local(elemento.tag) == "numFmt":
+                codigos[int(elemento.get("numFmtId"))] = elemento.get("formatCode")
+        for elemento in estilos:
+            if _nombre_local(elemento.tag) == "cellXfs":
+                for xf in elemento:
+                    codigo = codigos.get(int(xf.get("numFmtId", 0)))
+                    if codigo and is_timedelta_format(codigo):
+                        formatos.append("duracion")
+                    elif codigo and is_date_format(codigo):
+                        formatos.append("fecha")
+                    else:
+                        formatos.append(None)
+    return ruta_hoja, compartidos, formatos, epoch
+
+
+def _bloques_hoja(zf, ruta_hoja, inicio, tamano_bloque=1 << 18):
+    """
+    Bytes del XML de la hoja por bloques, a partir de la fila `inicio`: primero la
+    etiqueta de apertura de <worksheet> (con sus namespaces) y <sheetData>, luego el
+    stream desde <row r="inicio">, sin acumular las filas anteriores en memoria.
+    No entrega nada si la hoja no usa esa forma (prefijos, filas sin número): entonces
+    se recorre entera y el parser salta las filas de fuera del rango.
+    """
+    marca = b'<row r="%d"' % inicio
+    with zf.open(ruta_hoja) as src:
+        buffer = b""
+        while b"<sheetData>" not in buffer:
+            bloque = src.read(tamano_bloque)
+            if not bloque:
+                return
+            buffer += bloque
+        fin_cabecera = buffer.index(b"<sheetData>") + len(b"<sheetData>")
+        apertura = re.search(rb"<worksheet\b[^>]*>", buffer[:fin_cabecera])
+        if apertura is None:
+            return
+        cabecera = apertura.group(0) + b"<sheetData>"
+        buffer = buffer[fin_cabecera:]
+
+        while True:
+            posicion = buffer.find(marca)
+            if posicion >= 0:
+                break
+            bloque = src.read(tamano_bloque)
+            if not bloque:
+                return
+            # Se conserva el final por si la marca quedó partida entre dos bloques
+            buffer = buffer[-len(marca):] + bloque
+
+        yield cabecera
+        yield buffer[posicion:]
+        while True:
+            bloque = src.read(tamano_bloque)
+            if not bloque:
+                return
+            yield bloque
+
+
+def _filas_hoja(bloques, inicio, fin):
+    """
+    Recorre las filas [inicio, fin] del XML de la hoja con un parser incremental;
+    entrega (numero, [(columna, tipo, estilo, valor, texto_en_linea)]) y deja de leer
+    al pasar de fin. Cada fila se vacía al procesarla.
+    """
+    import xml.etree.ElementTree as ET
+
+    from openpyxl.utils.cell import column_index_from_string
+
+    parser = ET.XMLPullParser(events=("end",))
+    etiquetas = None
+    numero = 0
+    for bloque in bloques:
+        # </sheetData> cierra la sección; lo que sigue no hace falta
+        cierre = bloque.find(b"</sheetData>")
+        parser.feed(bloque if cierre < 0 else bloque[:cierre])
+        for _, elemento in parser.read_events():
+            etiqueta = elemento.tag
+            if not etiqueta.endswith("row") or _nombre_local(etiqueta) != "row":
+                continue
+            if etiquetas is None:
+                # Mismo namespace que <row> para <c>, <v> e <is>
+                prefijo = etiqueta[:-3]
+                etiquetas = (prefijo + "c", prefijo + "v", prefijo + "is", prefijo + "t")
+            etiqueta_c, etiqueta_v, etiqueta_is, etiqueta_t = etiquetas
+
+            r = elemento.get("r")
+            numero = int(r) if r else numero + 1
+            if numero > fin:
+                return
+            if numero >= inicio:
+                celdas = []
+                columna = 0
+                for celda in elemento:
+                    if celda.tag != etiqueta_c:
+                        continue
+                    referencia = celda.get("r")
+                    columna = column_index_from_string(referencia.rstrip("0123456789")) if referencia else columna + 1
+                    valor = texto = None
+                    for hijo in celda:
+                        if hijo.tag == etiqueta_v:
+                            valor = hijo.text
+                        elif hijo.tag == etiqueta_is:
+                            texto = "".join(t.text or "" for t in hijo.iter(etiqueta_t))
+                    celdas.append((columna, celda.get("t", "n"), int(celda.get("s", 0)), valor, texto))
+                yield numero, celdas
+            elemento.clear()
+        if cierre >= 0:
+            return
+
+
+def _valor_celda(tipo, estilo, valor, texto, compartidos, formatos, epoch):
+    """
+    Valor de la celda como lo entrega pd.read_excel con openpyxl (números enteros como
+    int, fechas según el formato de la celda, errores como nulo)
+    """
+    from datetime import datetime
+
+    from openpyxl.utils.datetime import from_excel
+
+    if tipo == "inlineStr":
+        return texto
+    if valor is None:
+        return None
+    if tipo == "s":
+        return compartidos[int(valor)]
+    if tipo == "str":
+        return valor
+    if tipo == "b":
+        return bool(int(valor))
+    if tipo == "e":
+        return None
+    if tipo == "d":
+        return datetime.fromisoformat(valor)
+    numero = float(valor) if any(caracter in valor for caracter in ".eE") else int(valor)
+    formato = formatos[estilo] if estilo < len(formatos) else None
+    if formato:
+        return from_excel(numero, epoch, timedelta=formato == "duracion")
+    if isinstance(numero, float) and numero.is_integer():
+        return int(numero)
+    return numero
+
+
+def _leer_rango_xlsx(file_path, inicio, fin, posiciones):
+    """
+    Lee las filas [inicio, fin] de la primera hoja (proceso hijo), solo las columnas en
+    posiciones (0-based), y las devuelve como un stream IPC de Arrow, más las columnas
+    que Arrow no puede tipar (mezclan texto y números) como listas.
+    La hoja se lee en streaming desde el zip: la memoria de cada proceso es la de su
+    rango (más los textos compartidos), no la de la hoja completa.
+    """
+    import zipfile
+
+    import pyarrow as pa
+
+    destino = {posicion + 1: j for j, posicion in enumerate(posiciones)}
+    columnas = [[None] * (fin - inicio + 1) for _ in posiciones]
+
+    with zipfile.ZipFile(file_path) as zf:
+        ruta_hoja, compartidos, formatos, epoch = _libro_xlsx(zf)
+        bloques = _bloques_hoja(zf, ruta_hoja, inicio)
+        primero = next(bloques, None)
+        if primero is None:
+            # Sin la forma <row r="N">: se recorre la hoja entera saltando las demás filas
+            def bloques_completos():
+                with zf.open(ruta_hoja) as src:
+                    yield from iter(lambda: src.read(1 << 18), b"")
+            bloques = bloques_completos()
+        else:
+            bloques = (bloque for lista in ([primero], bloques) for bloque in lista)
+
+        for numero, celdas in _filas_hoja(bloques, inicio, fin):
+            for columna, tipo, estilo, valor, texto in celdas:
+                j = destino.get(columna)
+                if j is not None:
+                    columnas[j][numero - inicio] = _valor_celda(
+                        tipo, estilo, valor, texto, compartidos, formatos, epoch
+                    )
+
+    arrays, nombres, mixtas = [], [], {}
+    for i, valores in enumerate(columnas):
+        try:
+            arrays.append(pa.array(valores))
+            nombres.append(str(i))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixtas[i] = valores
+
+    tabla = pa.Table.from_arrays(arrays, names=nombres)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return sink.getvalue().to_pybytes(), mixtas
+
+
+def leer_xlsx_por_rangos(file_path, workers, filas_por_rango=None, mapeo=None):
+    """
+    Parsea la hoja en rangos de filas en un pool de procesos. Cada proceso devuelve su
+    rango como buffer de Arrow (no se serializa celda por celda) y los rangos se unen
+    en orden, así los números de fila coinciden con los de la lectura secuencial.
+    Con mapeo solo se extraen sus columnas (usecols). Si la hoja es chica o no declara
+    sus dimensiones se lee en un solo proceso.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    import openpyxl
+    import pandas as pd
+    import pyarrow as pa
+
+    filas_por_rango = filas_por_rango or int(os.getenv("SERFINSA_XLSX_FILAS_POR_RANGO", "20000"))
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        max_fila = ws.max_row
+        encabezados = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+
+    filas = (max_fila or 0) - 1
+    rangos = min(workers, -(-filas // filas_por_rango)) if filas > 0 else 0
+    if not max_fila or rangos <= 1:
+        if _modulo_instalado("python_calamine"):
+            return leer_xlsx_calamine(file_path, mapeo)
+        return leer_xlsx_openpyxl(file_path, mapeo)
+
+    posiciones = mapeo.usecols if mapeo else list(range(len(encabezados)))
+    columnas = [
+        f"Unnamed: {i}" if encabezados[i] is None else encabezados[i]
+        for i in posiciones
+    ]
+    tamano = -(-filas // rangos)
+    limites = [(inicio, min(inicio + tamano - 1, max_fila)) for inicio in range(2, max_fila + 1, tamano)]
+
+    partes = []
+    with ProcessPoolExecutor(max_workers=rangos) as executor:
+        futuros = [
+            executor.submit(_leer_rango_xlsx, file_path, inicio, fin, posiciones)
+            for inicio, fin in limites
+        ]
+        # Se recogen en el orden de los rangos, no en el de terminación
+        for futuro in futuros:
+            buffer, mixtas = futuro.result()
+            parte = pa.ipc.open_stream(buffer).read_all().to_pandas()
+            for i, valores in mixtas.items():
+                parte[str(i)] = pd.Series(valores, dtype=object)
+            partes.append(parte[[str(i) for i in range(len(columnas))]])
+
+    df = pd.concat(partes, ignore_index=True).infer_objects()
+    df.columns = columnas
+
+    # read_excel convierte a número las columnas de texto que solo traen números
+    for i in range(len(columnas)):
+        serie = df.iloc[:, i]
+        if serie.dtype == object or pd.api.types.is_string_dtype(serie):
+            try:
+                df.isetitem(i, pd.to_numeric(serie))
+            except (ValueError, TypeError):
+                pass
+
+    # Como read_excel, sin las filas vacías del final
+    con_datos = df.notna().any(axis=1).to_numpy().nonzero()[0]
+    return df.iloc[: con_datos[-1] + 1 if len(con_datos) else 0]
+
+
+@registrar_lector("xlsx-paralelo", ("*.xlsx",), prioridad=5,
+                  disponible=lambda: _workers_xlsx() > 1 and _modulo_instalado("pyarrow"),
+                  encabezados=_encabezados_xlsx)
+def leer_xlsx_paralelo(file_path, mapeo=None):
+    return leer_xlsx_por_rangos(file_path, _workers_xlsx(), mapeo=mapeo)
+
+
+def _separador_gzip(file_path):
+    return "\t" if file_path.lower().endswith(".tsv.gz") else ","
+
+
+@registrar_lector("csv-gzip", ("*.csv.gz", "*.tsv.gz"), prioridad=30,
+                  encabezados=lambda ruta: _encabezados_delimitado(ruta, _separador_gzip(ruta), "gzip"))
+def leer_csv_gzip(file_path, mapeo=None):
+    return _leer_delimitado(file_path, _separador_gzip(file_path), compression="gzip", mapeo=mapeo)
+
+
+@registrar_lector("csv", ("*.csv",), prioridad=40,
+                  encabezados=lambda ruta: _encabezados_delimitado(ruta, ","))
+def leer_csv(file_path, mapeo=None):
+    return _leer_delimitado(file_path, ",", mapeo=mapeo)
+
+
+@registrar_lector("tsv", ("*.tsv",), prioridad=50,
+                  encabezados=lambda ruta: _encabezados_delimitado(ruta, "\t"))
+def leer_tsv(file_path, mapeo=None):
+    return _leer_delimitado(file_path, "\t", mapeo=mapeo)
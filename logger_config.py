@@ -1,52 +1,235 @@
+import glob
+import gzip
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ArchivoLogRotativo(logging.handlers.RotatingFileHandler):
+    """
+    Archivo de log que rota por tamaño (max_bytes) y por tiempo (cada dias_rotacion días,
+    a medianoche) y comprime con gzip los archivos rotados (<log>.<fecha-hora>.gz),
+    conservando como máximo backup_count.
+
+    También recuerda en qué byte empezó la ejecución actual (marcar_inicio_ejecucion)
+    para poder extraer solo ese segmento sin releer el log completo.
+    """
+
+    def __init__(self, filename, max_bytes=0, dias_rotacion=1, backup_count=30, encoding="utf-8"):
+        super().__init__(filename, mode="a", maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.dias_rotacion = dias_rotacion
+        inicio = os.path.getmtime(self.baseFilename) if os.path.getsize(self.baseFilename) else time.time()
+        self.proxima_rotacion = self._calcular_proxima_rotacion(inicio)
+        self.offset_inicio = None
+        self.partes_anteriores = []
+
+    def _calcular_proxima_rotacion(self, desde):
+        if not self.dias_rotacion:
+            return None
+        medianoche = datetime.fromtimestamp(desde).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (medianoche + timedelta(days=self.dias_rotacion)).timestamp()
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.proxima_rotacion is not None and time.time() >= self.proxima_rotacion:
+            return True
+        if self.maxBytes > 0:
+            msg = f"{self.format(record)}\n"
+            if self.stream.tell() + len(msg.encode(self.encoding or "utf-8")) >= self.maxBytes:
+                return True
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            marca = datetime.now().strftime("%Y%m%d-%H%M%S")
+            destino = f"{self.baseFilename}.{marca}"
+            n = 1
+            while os.path.exists(destino) or os.path.exists(destino + ".gz"):
+                destino = f"{self.baseFilename}.{marca}-{n}"
+                n += 1
+            os.rename(self.baseFilename, destino)
+            with open(destino, "rb") as origen, gzip.open(destino + ".gz", "wb") as comprimido:
+                shutil.copyfileobj(origen, comprimido)
+            os.remove(destino)
+
+            # Si la ejecución actual ya había escrito en el archivo rotado, su inicio queda ahí
+            if self.offset_inicio is not None:
+                self.partes_anteriores.append((destino + ".gz", self.offset_inicio))
+                self.offset_inicio = 0
+
+            self._purgar_respaldos()
+
+        self.proxima_rotacion = self._calcular_proxima_rotacion(time.time())
+        self.stream = self._open()
+
+    def _purgar_respaldos(self):
+        if self.backupCount <= 0:
+            return
+        respaldos = sorted(glob.glob(glob.escape(self.baseFilename) + ".*.gz"))
+        for ruta in respaldos[:-self.backupCount]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def marcar_inicio_ejecucion(self):
+        """
+        Recuerda el byte en que empieza la ejecución actual (rotando antes si ya tocaba)
+        """
+        self.acquire()
+        try:
+            if self.proxima_rotacion is not None and time.time() >= self.proxima_rotacion:
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.seek(0, os.SEEK_END)
+            self.offset_inicio = self.stream.tell()
+            self.partes_anteriores = []
+        finally:
+            self.release()
+
+    def partes_ejecucion(self):
+        """
+        Lista de (ruta, offset) con el contenido de la ejecución actual, en orden
+        """
+        if self.offset_inicio is None:
+            return []
+        return self.partes_anteriores + [(self.baseFilename, self.offset_inicio)]
+
+
+class FiltroRunId(logging.Filter):
+    """
+    Agrega el identificador de la ejecución (run_id) a cada registro
+    """
+
+    def __init__(self, run_id):
+        super().__init__()
+        self.run_id = run_id
+
+    def filter(self, record):
+        record.run_id = self.run_id
+        return True
+
+
+def generar_run_id():
+    return f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+
 
 def setup_logger(excel_file_path):
     """
-    Configura el sistema de logging basado en el archivo Excel procesado
+    Configura el sistema de logging basado en el archivo Excel procesado.
+    El archivo rota por tamaño (SERFINSA_LOG_MAX_MB) y por tiempo
+    (SERFINSA_LOG_ROTACION_DIAS) y los rotados se comprimen con gzip (se conservan
+    SERFINSA_LOG_RESPALDOS). Cada registro lleva el run_id de la ejecución.
     """
     # Obtener el nombre base del archivo Excel (sin extensión)
     excel_filename = os.path.basename(excel_file_path)
     log_filename = os.path.splitext(excel_filename)[0] + ".log"
-    
+
     # Crear directorio de logs si no existe
     log_dir = os.path.join(os.getcwd(), "logs")
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
-    
+
     log_file_path = os.path.join(log_dir, log_filename)
-    
+
     # Configurar el logger
     logger = logging.getLogger('serfinsa_processor')
     logger.setLevel(logging.INFO)
-    
-    # Evitar duplicar handlers si ya existen
+
+    # Evitar duplicar handlers si ya existen (cerrando los archivos de la ejecución anterior)
     if logger.handlers:
+        for handler in logger.handlers:
+            handler.close()
         logger.handlers.clear()
-    
+    for filtro in [f for f in logger.filters if isinstance(f, FiltroRunId)]:
+        logger.removeFilter(filtro)
+
+    run_id = generar_run_id()
+    logger.addFilter(FiltroRunId(run_id))
+
     # Crear formatter
     formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s',
+        '%(asctime)s - %(levelname)s - [%(run_id)s] %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    
-    # Handler para archivo
-    file_handler = logging.FileHandler(log_file_path, mode='a', encoding='utf-8')
+
+    # Handler para archivo (rotativo y comprimido)
+    file_handler = ArchivoLogRotativo(
+        log_file_path,
+        max_bytes=int(float(os.getenv("SERFINSA_LOG_MAX_MB", "10")) * 1024 * 1024),
+        dias_rotacion=int(os.getenv("SERFINSA_LOG_ROTACION_DIAS", "1")),
+        backup_count=int(os.getenv("SERFINSA_LOG_RESPALDOS", "30")),
+    )
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(formatter)
-    
+    file_handler.marcar_inicio_ejecucion()
+
     # Handler para consola
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    
+
     # Agregar handlers al logger
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
-    
+
     return logger, log_file_path
 
+def obtener_run_id(logger):
+    """
+    run_id de la ejecución actual del logger, o None si no se configuró con setup_logger
+    """
+    for filtro in logger.filters:
+        if isinstance(filtro, FiltroRunId):
+            return filtro.run_id
+    return None
+
+def extraer_segmento_ejecucion(logger, destino_dir=None):
+    """
+    Escribe en <log>.<run_id>.log solo lo registrado por la ejecución actual, copiando
+    desde el byte en que empezó (incluye la parte que haya quedado en un archivo rotado).
+    Retorna la ruta del segmento, o None si el logger no escribe en un ArchivoLogRotativo.
+    """
+    handler = next((h for h in logger.handlers if isinstance(h, ArchivoLogRotativo)), None)
+    if handler is None:
+        return None
+
+    handler.acquire()
+    try:
+        handler.flush()
+        partes = handler.partes_ejecucion()
+    finally:
+        handler.release()
+    if not partes:
+        return None
+
+    base = os.path.splitext(os.path.basename(handler.baseFilename))[0]
+    ruta_segmento = os.path.join(
+        destino_dir or os.path.dirname(handler.baseFilename),
+        f"{base}.{obtener_run_id(logger) or 'ejecucion'}.log"
+    )
+    with open(ruta_segmento, "wb") as salida:
+        for ruta, offset in partes:
+            abrir = gzip.open if ruta.endswith(".gz") else open
+            with abrir(ruta, "rb") as entrada:
+                entrada.seek(offset)
+                shutil.copyfileobj(entrada, salida)
+    return ruta_segmento
+
 def log_separator(logger, message="=" * 50):
     """
     Agrega una línea separadora en el log
@@ -0,0 +1,116 @@
+"""
+Perfilado bajo demanda de las etapas del proceso (SERFINSA_PROFILE=1 o serfinsa.py --profile).
+
+Cada etapa se ejecuta con cProfile y tracemalloc. Junto al log de la ejecución se crea
+el directorio <log>.<run_id>.perfil/ con:
+- <etapa>.prof: volcado de cProfile (abrir con pstats o snakeviz)
+- resumen.txt: por etapa, duración, pico de memoria, las SERFINSA_PROFILE_TOP funciones
+  con más tiempo acumulado y las líneas que más memoria asignaron
+
+tracemalloc guarda SERFINSA_PROFILE_FRAMES marcos por asignación (1 por defecto), lo
+que mantiene el costo bajo para dejarlo activo en una ejecución de producción.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def perfilado_activo():
+    return os.getenv("SERFINSA_PROFILE", "0") == "1"
+
+
+class PerfiladorEtapas:
+    def __init__(self, directorio, top_n=None, frames=None):
+        self.directorio = directorio
+        self.top_n = int(top_n if top_n is not None else os.getenv("SERFINSA_PROFILE_TOP", "25"))
+        self.frames = int(frames if frames is not None else os.getenv("SERFINSA_PROFILE_FRAMES", "1"))
+        self.secciones = []
+        self._inicio_tracemalloc = False
+        os.makedirs(directorio, exist_ok=True)
+
+    @contextmanager
+    def etapa(self, nombre):
+        """
+        Perfila el bloque con cProfile y mide su memoria con tracemalloc
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._inicio_tracemalloc = True
+        tracemalloc.reset_peak()
+        antes = tracemalloc.take_snapshot()
+        memoria_inicial, _ = tracemalloc.get_traced_memory()
+
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            duracion = time.perf_counter() - inicio
+            _, pico = tracemalloc.get_traced_memory()
+            despues = tracemalloc.take_snapshot()
+
+            ruta_prof = os.path.join(self.directorio, f"{nombre}.prof")
+            perfil.dump_stats(ruta_prof)
+            self.secciones.append(
+                self._resumen_etapa(nombre, duracion, pico - memoria_inicial, perfil, antes, despues)
+            )
+
+    def _resumen_etapa(self, nombre, duracion, pico, perfil, antes, despues):
+        salida = io.StringIO()
+        salida.write(f"=== Etapa {nombre} ===\n")
+        salida.write(f"Duración: {duracion:.3f} s\n")
+        salida.write(f"Pico de memoria sobre el inicio de la etapa: {pico / 1024 / 1024:.2f} MB\n\n")
+
+        salida.write(f"--- Top {self.top_n} funciones por tiempo acumulado ---\n")
+        estadisticas = pstats.Stats(perfil, stream=salida)
+        estadisticas.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+
+        salida.write(f"--- Top {self.top_n} líneas por memoria asignada en la etapa ---\n")
+        filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+        diferencias = despues.filter_traces(filtros).compare_to(antes.filter_traces(filtros), "lineno")
+        for diferencia in diferencias[:self.top_n]:
+            salida.write(f"{diferencia}\n")
+        salida.write("\n")
+        return salida.getvalue()
+
+    def finalizar(self):
+        """
+        Escribe resumen.txt, detiene tracemalloc si lo inició este perfilador y
+        retorna la ruta del resumen
+        """
+        if self._inicio_tracemalloc:
+            tracemalloc.stop()
+            self._inicio_tracemalloc = False
+        ruta = os.path.join(self.directorio, "resumen.txt")
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            archivo.write("".join(self.secciones))
+        return ruta
+
+
+def crear_perfilador(log_file_path, run_id=None):
+    """
+    Perfilador con sus archivos junto al log de la ejecución, o None si el perfilado
+    no está activo
+    """
+    if not perfilado_activo():
+        return None
+    base = os.path.splitext(log_file_path)[0]
+    return PerfiladorEtapas(f"{base}.{run_id or time.strftime('%Y%m%d%H%M%S')}.perfil")
+
+
+def etapa_perfilada(perfilador, nombre):
+    """
+    perfilador.etapa(nombre), o un contexto vacío si no hay perfilador
+    """
+    return perfilador.etapa(nombre) if perfilador else nullcontext()
@@ -0,0 +1,87 @@
+"""
+Representación compacta de una fila de liquidación (las 40 columnas de LiquidacionesSV
+más FECHA_HORA_TRAN, la fecha y hora combinadas al normalizar el archivo).
+
+LiquidacionRecord usa __slots__: sin __dict__ por instancia, con atributos de acceso
+directo y valores ya convertidos a tipos de Python (nulos como None). Se construyen a
+partir del DataFrame normalizado por bloques de filas (en_bloques), de modo que la
+inserción no mantiene a la vez el DataFrame y un registro por cada fila del archivo.
+"""
+
+from operator import attrgetter
+
+from fecha_hora_transaccion import COLUMNA_FECHA_HORA
+from lectores import COLUMNAS_LIQUIDACION
+
+_valores_insert = attrgetter(*COLUMNAS_LIQUIDACION)
+_N_COLUMNAS = len(COLUMNAS_LIQUIDACION)
+
+
+def _lista_columna(serie):
+    """
+    Valores de la columna como lista de tipos de Python, con None en los nulos
+    """
+    valores = serie.tolist()
+    nulos = serie.isna().to_numpy()
+    if nulos.any():
+        for posicion in nulos.nonzero()[0]:
+            valores[posicion] = None
+    return valores
+
+
+class LiquidacionRecord:
+    __slots__ = tuple(COLUMNAS_LIQUIDACION) + (COLUMNA_FECHA_HORA, "fila")
+
+    def __init__(self, valores, fila=None, fecha_hora=None):
+        for nombre, valor in zip(COLUMNAS_LIQUIDACION, valores):
+            setattr(self, nombre, valor)
+        setattr(self, COLUMNA_FECHA_HORA, fecha_hora)
+        self.fila = fila
+
+    def como_tupla(self):
+        """
+        Valores en el orden de las columnas del INSERT en LiquidacionesSV
+        """
+        return _valores_insert(self)
+
+    def parametros_insert(self):
+        """
+        Parámetros de SQL_INSERT_LIQUIDACION: las 40 columnas y FECHA_HORA_TRAN
+        """
+        return _valores_insert(self) + (getattr(self, COLUMNA_FECHA_HORA),)
+
+    def __repr__(self):
+        return f"LiquidacionRecord(fila={self.fila}, SEQ_NUM={self.SEQ_NUM!r})"
+
+    @classmethod
+    def desde_dataframe(cls, df, desplazamiento=0):
+        """
+        Convierte el DataFrame normalizado en una lista de LiquidacionRecord (fila =
+        desplazamiento + posición en df).
+        La conversión de nulos (NaN, NaT, pd.NA) a None y de escalares de NumPy a tipos
+        de Python se hace una vez por columna (tolist), no por celda, y sin copiar el
+        DataFrame completo a object.
+        """
+        faltantes = [col for col in COLUMNAS_LIQUIDACION if col not in df.columns]
+        if faltantes:
+            raise ValueError(f"Faltan columnas para construir los registros: {', '.join(faltantes)}")
+
+        columnas = list(COLUMNAS_LIQUIDACION)
+        if COLUMNA_FECHA_HORA in df.columns:
+            columnas.append(COLUMNA_FECHA_HORA)
+
+        return [
+            cls(fila_valores, fila, fila_valores[_N_COLUMNAS] if len(fila_valores) > _N_COLUMNAS else None)
+            for fila, fila_valores in enumerate(
+                zip(*(_lista_columna(df[columna]) for columna in columnas)), desplazamiento
+            )
+        ]
+
+    @classmethod
+    def en_bloques(cls, df, tamano_bloque):
+        """
+        Genera listas de hasta tamano_bloque LiquidacionRecord, en orden de filas; cada
+        bloque se puede liberar antes de construir el siguiente
+        """
+        for inicio in range(0, len(df), tamano_bloque):
+            yield cls.desde_dataframe(df.iloc[inicio:inicio + tamano_bloque], inicio)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Punto de entrada único del procesador de liquidaciones Serfinsa.
+
+Los módulos pesados (pandas, openpyxl, mysql-connector, email) se importan dentro de
+cada subcomando, solo cuando hacen falta, para que un arranque sin archivo pendiente
+o el reenvío de una alerta terminen en una fracción de segundo.
+
+Uso:
+    python serfinsa.py ingest [--archivo RUTA] [--sin-conciliacion]
+    python serfinsa.py enrich [--archivo RUTA]
+    python serfinsa.py build-lots [--workers N]
+    python serfinsa.py retry-unmatched [--max-filas N]
+    python serfinsa.py backfill-fecha-hora [--tamano-bloque N]
+    python serfinsa.py reconcile [--materializada] [--dias N]
+    python serfinsa.py notify {alerta,reporte,digest} [--archivo RUTA] [--log RUTA]
+    python serfinsa.py backfill RUTA [RUTA ...] [--dry-run]
+    python serfinsa.py archive RUTA [RUTA ...]
+
+Con --profile (antes del subcomando) cada etapa se perfila con cProfile y tracemalloc
+y los resultados quedan junto al log de la ejecución (equivale a SERFINSA_PROFILE=1).
+
+Con SERFINSA_NOTIFICACION_DIGEST=1 los reportes se agrupan en un solo email por ventana
+(notify digest lo envía sin esperar; backfill lo envía al terminar).
+"""
+
+import argparse
+import os
+import sys
+
+
+def _resolver_archivo(archivo):
+    """
+    Devuelve el archivo indicado o el más reciente pendiente; envía alerta si no hay ninguno
+    """
+    if archivo:
+        if not os.path.exists(archivo):
+            print(f"❌ El archivo {archivo} no existe")
+            return None
+        return archivo
+
+    from ReadFile import buscar_archivo_pendiente
+
+    archivo, search_path = buscar_archivo_pendiente()
+    if not archivo:
+        print("No se encontró ningún archivo Excel para procesar.")
+        from email_sender import enviar_alerta_sin_archivo
+        enviar_alerta_sin_archivo(search_path)
+    return archivo
+
+
+def _abrir_conexion(logger):
+    from conector import create_connection
+    from unidad_trabajo import UnidadDeTrabajo
+
+    conn = create_connection()
+    if not conn:
+        logger.error("❌ No se pudo conectar a la base de datos.")
+        return None, None
+    conn = UnidadDeTrabajo(conn, logger=logger)
+    return conn, conn.cursor(dictionary=True)
+
+
+def cmd_ingest(args):
+    archivo = _resolver_archivo(args.archivo)
+    if not archivo:
+        return 1
+
+    import Main
+
+    resultado = Main.main(archivo, ejecutar_conciliacion=not args.sin_conciliacion)
+    return 0 if resultado else 1
+
+
+def cmd_enrich(args):
+    archivo = _resolver_archivo(args.archivo)
+    if not archivo:
+        return 1
+
+    import Main
+    from ReadFile import leer_archivo_encontrado
+    from logger_config import setup_logger
+
+    df = leer_archivo_encontrado(archivo)
+    if df is None:
+        return 1
+
+    logger, _ = setup_logger(archivo)
+    conn, cursor = _abrir_conexion(logger)
+    if not conn:
+        return 1
+    try:
+        Main.buscar_transacciones_archivo(df, cursor, conn, logger)
+    finally:
+        conn.close()
+    return 0
+
+
+def cmd_build_lots(args):
+    import Main
+    from logger_config import setup_logger
+
+    logger, _ = setup_logger("lotes")
+    conn, cursor = _abrir_conexion(logger)
+    if not conn:
+        return 1
+    try:
+        success, _ = Main.crear_lotes(cursor, conn, logger, workers=args.workers)
+    finally:
+        conn.close()
+    return 0 if success else 1
+
+
+def cmd_retry_unmatched(args):
+    import Main
+    from ReintentarEmparejamiento import reintentar_pendientes
+    from logger_config import setup_logger
+
+    logger, _ = setup_logger("reintentos")
+    conn, cursor = _abrir_conexion(logger)
+    if not conn:
+        return 1
+    try:
+        resumen = reintentar_pendientes(cursor, conn, logger, max_filas=args.max_filas)
+        success = True
+        if resumen["emparejados"]:
+            success, _ = Main.crear_lotes(cursor, conn, logger)
+    finally:
+        conn.close()
+    return 0 if success else 1
+
+
+def cmd_backfill_fecha_hora(args):
+    from fecha_hora_transaccion import rellenar_fecha_hora
+    from logger_config import setup_logger
+
+    logger, _ = setup_logger("fecha_hora")
+    conn, cursor = _abrir_conexion(logger)
+    if not conn:
+        return 1
+    try:
+        actualizadas = rellenar_fecha_hora(cursor, conn, logger, tamano_bloque=args.tamano_bloque)
+    finally:
+        conn.close()
+    print(f"✅ FECHA_HORA_TRAN completada en {actualizadas} filas")
+    return 0
+
+
+def cmd_reconcile(args):
+    from BuscarTransaccionesFaltantes import main as buscar_faltantes
+
+    buscar_faltantes(materializada=args.materializada or None, dias_minimos=args.dias)
+    return 0
+
+
+def cmd_notify(args):
+    if args.tipo == "alerta":
+        from email_sender import enviar_alerta_sin_archivo
+        from ReadFile import obtener_directorio_datos
+
+        return 0 if enviar_alerta_sin_archivo(obtener_directorio_datos()) else 1
+
+    if args.tipo == "digest":
+        from digest_notificaciones import enviar_digest
+
+        enviar_digest(forzar=True)
+        return 0
+
+    notification_email = os.getenv("NOTIFICATION_EMAIL")
+    if not notification_email:
+        print("⚠️ No se configuró NOTIFICATION_EMAIL en variables de entorno")
+        return 1
+
+    from email_sender import EmailSender
+
+    nombre = os.path.basename(args.archivo) if args.archivo else "sin archivo"
+    email_sender = EmailSender()
+    body = (
+        "<p>Reenvío del reporte de procesamiento de Serfinsa.</p>"
+        f"<p><strong>Archivo procesado:</strong> {nombre}</p>"
+    )
+    success, message = email_sender.send_notification_email(
+        notification_email,
+        f"Reporte de Procesamiento Serfinsa - {nombre}",
+        body,
+        args.log,
+        args.archivo,
+    )
+    print(("✅ " if success else "❌ ") + message)
+    return 0 if success else 1
+
+
+def cmd_backfill(args):
+    if args.dry_run:
+        from ReadFile import leer_archivo_encontrado
+
+        fallidos = [archivo for archivo in args.archivos if leer_archivo_encontrado(archivo) is None]
+        return 1 if fallidos else 0
+
+    import Main
+
+    codigo = 0
+    for archivo in args.archivos:
+        if not os.path.exists(archivo):
+            print(f"❌ El archivo {archivo} no existe")
+            codigo = 1
+            continue
+        # Reprocesar a propósito: sin rechazo por hash ni archivado
+        if not Main.main(archivo, ejecutar_conciliacion=False, archivar=False):
+            codigo = 1
+
+    from digest_notificaciones import digest_activo, enviar_digest
+
+    if digest_activo():
+        # Un solo email con todos los archivos del backfill
+        enviar_digest(forzar=True)
+    return codigo
+
+
+def cmd_archive(args):
+    from archivo_procesados import archivar_archivo
+
+    codigo = 0
+    for archivo in args.archivos:
+        if not os.path.exists(archivo):
+            print(f"❌ El archivo {archivo} no existe")
+            codigo = 1
+            continue
+        print(f"📦 {archivo} -> {archivar_archivo(archivo)}")
+    return codigo
+
+
+def construir_parser():
+    parser = argparse.ArgumentParser(prog="serfinsa", description="Procesador de liquidaciones Serfinsa")
+    parser.add_argument("--profile", action="store_true", help="Perfilar cada etapa (cProfile + tracemalloc) junto al log")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("ingest", help="Procesa el archivo pendiente más reciente (flujo completo)")
+    p.add_argument("--archivo", help="Procesar este archivo en lugar del más reciente")
+    p.add_argument("--sin-conciliacion", action="store_true", help="No ejecutar la búsqueda de transacciones faltantes")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("enrich", help="Busca transaction_id/business_id para los registros de un archivo")
+    p.add_argument("--archivo", help="Archivo a enriquecer (por defecto el más reciente)")
+    p.set_defaults(func=cmd_enrich)
+
+    p = sub.add_parser("build-lots", help="Crea los lotes por business_id pendientes")
+    p.add_argument("--workers", type=int, help="Procesar los business_id en paralelo con N conexiones (SERFINSA_LOTES_WORKERS)")
+    p.set_defaults(func=cmd_build_lots)
+
+    p = sub.add_parser("retry-unmatched", help="Reintenta el emparejamiento de las liquidaciones sin transaction_id y crea sus lotes")
+    p.add_argument("--max-filas", type=int, help="Máximo de filas a revisar (SERFINSA_REINTENTOS_MAX_FILAS)")
+    p.set_defaults(func=cmd_retry_unmatched)
+
+    p = sub.add_parser("backfill-fecha-hora", help="Completa FECHA_HORA_TRAN de las liquidaciones existentes por bloques")
+    p.add_argument("--tamano-bloque", type=int, help="Filas por bloque (SERFINSA_FECHA_HORA_TAMANO_BLOQUE)")
+    p.set_defaults(func=cmd_backfill_fecha_hora)
+
+    p = sub.add_parser("reconcile", help="Busca transacciones exitosas que faltan en LiquidacionesSV")
+    p.add_argument("--materializada", action="store_true", help="Usar la tabla de conciliación Conciliacion_sv")
+    p.add_argument("--dias", type=int, help="Solo faltantes con más de N días (modo materializado)")
+    p.set_defaults(func=cmd_reconcile)
+
+    p = sub.add_parser("notify", help="Reenvía una alerta o un reporte por email, o envía el digest pendiente")
+    p.add_argument("tipo", choices=["alerta", "reporte", "digest"])
+    p.add_argument("--archivo", help="Archivo de datos a adjuntar (reporte)")
+    p.add_argument("--log", help="Archivo de log a adjuntar (reporte)")
+    p.set_defaults(func=cmd_notify)
+
+    p = sub.add_parser("backfill", help="Reprocesa archivos concretos (usa la caché de parseo)")
+    p.add_argument("archivos", nargs="+")
+    p.add_argument("--dry-run", action="store_true", help="Solo leer y normalizar, sin tocar la base de datos")
+    p.set_defaults(func=cmd_backfill)
+
+    p = sub.add_parser("archive", help="Mueve al archivo archivos ya procesados (sin procesarlos) y registra su hash")
+    p.add_argument("archivos", nargs="+")
+    p.set_defaults(func=cmd_archive)
+
+    return parser
+
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    if args.profile:
+        os.environ["SERFINSA_PROFILE"] = "1"
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Base de datos SQLite con el esquema de Serfinsa para pruebas y micro-benchmarks.
+
+crear_conexion_sqlite() devuelve una conexión con la misma interfaz que la de
+mysql-connector que usa el proceso (cursor(dictionary=True), marcadores %s, rowcount,
+lastrowid, commit/rollback) y con las tablas LiquidacionesSV, transactions,
+payment_gateway, payment_method, Lote_sv y Lote_sv_business ya creadas. Los cursores
+declaran el dialecto SQLite, de modo que CrearLotes, BuscarTransaccion y Main corren
+en el proceso sin servidor MySQL:
+
+    conn = crear_conexion_sqlite()
+    cursor = conn.cursor(dictionary=True)
+    insertar_liquidaciones(df, cursor, conn, logger)
+
+Con SERFINSA_DB_BACKEND=sqlite, conector.create_connection usa esta conexión
+(SERFINSA_SQLITE_DB indica el archivo; por defecto, en memoria).
+
+Limitaciones: las consultas de ConciliacionSV y BuscarTransaccionesFaltantes con
+INTERVAL/DATEDIFF siguen siendo solo de MySQL.
+"""
+
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+from dialectos import DIALECTO_SQLITE
+from lectores import COLUMNAS_LIQUIDACION
+
+# Tipos de las columnas de LiquidacionesSV que no son texto
+TIPOS_LIQUIDACION = {
+    "FECHA_TRAN": "DATE",
+    "MONTO_TRAN": "DECIMAL(15,2)",
+    "MONTO_AJUS": "DECIMAL(15,2)",
+    "MONTO_TEXE": "DECIMAL(15,2)",
+    "SUBTOTAL": "DECIMAL(15,2)",
+    "MONTO_IVA": "DECIMAL(15,2)",
+    "COMISIONAB": "DECIMAL(15,2)",
+    "COM_PORCEN": "DECIMAL(9,4)",
+    "COM_MONTO": "DECIMAL(15,2)",
+    "COM_MTOIVA": "DECIMAL(15,2)",
+    "RETENCION2": "DECIMAL(15,2)",
+    "RETENIDO": "DECIMAL(15,2)",
+    "MONTO_DEBI": "DECIMAL(15,2)",
+    "DEPOSITO": "DECIMAL(15,2)",
+    "IVA_PORC": "DECIMAL(9,4)",
+}
+
+_TOTALES_LOTE = ",\n".join(
+    f"    {columna} DECIMAL(15,2) DEFAULT 0" for columna in (
+        "total_monto_tran", "total_monto_ajus", "total_monto_texe", "total_subtotal",
+        "total_monto_iva", "total_comisionab", "total_com_monto", "total_com_mtoiva",
+        "total_retencion2", "total_retenido", "total_monto_debi", "total_deposito",
+    )
+)
+
+ESQUEMA_SQLITE = [
+    "CREATE TABLE IF NOT EXISTS LiquidacionesSV (\n"
+    "    id INTEGER PRIMARY KEY AUTOINCREMENT,\n"
+    + "".join(f"    {columna} {TIPOS_LIQUIDACION.get(columna, 'VARCHAR(255)')},\n" for columna in COLUMNAS_LIQUIDACION)
+    + "    FECHA_HORA_TRAN DATETIME,\n"
+    "    qpay_transac_id VARCHAR(255),\n"
+    "    business_id VARCHAR(100),\n"
+    "    lote_id BIGINT,\n"
+    "    match_metodo VARCHAR(20),\n"
+    "    match_confianza VARCHAR(10)\n"
+    ")",
+    "CREATE INDEX IF NOT EXISTS idx_liquidaciones_seq_num ON LiquidacionesSV (SEQ_NUM)",
+    "CREATE INDEX IF NOT EXISTS idx_liquidaciones_lote_id ON LiquidacionesSV (lote_id)",
+    "CREATE INDEX IF NOT EXISTS idx_liquidaciones_qpay_transac_id ON LiquidacionesSV (qpay_transac_id)",
+    "CREATE INDEX IF NOT EXISTS idx_liquidaciones_fecha_hora_tran ON LiquidacionesSV (FECHA_HORA_TRAN)",
+    """CREATE TABLE IF NOT EXISTS payment_method (
+    payment_method_id INTEGER PRIMARY KEY,
+    name VARCHAR(100)
+)""",
+    """CREATE TABLE IF NOT EXISTS payment_gateway (
+    payment_gateway_id INTEGER PRIMARY KEY,
+    payment_method_id INTEGER,
+    name VARCHAR(100)
+)""",
+    """CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id VARCHAR(255) PRIMARY KEY,
+    orderNumber VARCHAR(255),
+    referencs VARCHAR(255),
+    amount DECIMAL(15,2),
+    autorizationCode VARCHAR(50),
+    currency VARCHAR(10),
+    status INTEGER,
+    payment_gateway_id INTEGER,
+    business_id VARCHAR(100),
+    email VARCHAR(255),
+    bill_to_name VARCHAR(255),
+    created_at DATETIME,
+    updated_at DATETIME
+)""",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_referencs ON transactions (referencs)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_autorization ON transactions (autorizationCode)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions (created_at)",
+    """CREATE TABLE IF NOT EXISTS Lote_sv (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha_lote DATE NOT NULL,
+    business_id VARCHAR(100) NOT NULL,
+    total_comercios INTEGER NOT NULL DEFAULT 0,
+    total_transacciones INTEGER NOT NULL DEFAULT 0,
+    total_monto_deposito DECIMAL(15,2) DEFAULT 0,
+    estado VARCHAR(20) DEFAULT 'pendiente' CHECK (estado IN ('pendiente', 'procesado')),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS unique_fecha_lote_business ON Lote_sv (fecha_lote, business_id)",
+    "CREATE TABLE IF NOT EXISTS Lote_sv_business (\n"
+    "    id INTEGER PRIMARY KEY AUTOINCREMENT,\n"
+    "    business_id VARCHAR(100) NOT NULL,\n"
+    "    lote_sv_id BIGINT NOT NULL,\n"
+    "    fecha_lote DATE NOT NULL,\n"
+    "    total_transacciones INTEGER NOT NULL DEFAULT 0,\n"
+    f"{_TOTALES_LOTE},\n"
+    "    iva_porc DECIMAL(9,4),\n"
+    "    estado VARCHAR(20) DEFAULT 'pendiente' CHECK (estado IN ('pendiente', 'procesado')),\n"
+    "    created_at DATETIME DEFAULT CURRENT_TIMESTAMP\n"
+    ")",
+    "CREATE UNIQUE INDEX IF NOT EXISTS unique_lote_sv_business ON Lote_sv_business (lote_sv_id, business_id, fecha_lote)",
+]
+
+
+def _a_parametro(valor):
+    """
+    Convierte un parámetro a un tipo que SQLite guarda igual que MySQL lo compararía
+    """
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=" ")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if hasattr(valor, "item") and not isinstance(valor, (str, bytes)):
+        # Escalares de NumPy
+        return valor.item()
+    return valor
+
+
+def _fila_diccionario(cursor, fila):
+    return {descripcion[0]: valor for descripcion, valor in zip(cursor.description, fila)}
+
+
+class CursorSQLite:
+    dialecto = DIALECTO_SQLITE
+
+    def __init__(self, cursor, diccionario=False):
+        self._cursor = cursor
+        if diccionario:
+            self._cursor.row_factory = _fila_diccionario
+
+    def execute(self, sql, params=None):
+        self._cursor.execute(sql.replace("%s", "?"), tuple(_a_parametro(v) for v in params or ()))
+        return self
+
+    def executemany(self, sql, filas):
+        self._cursor.executemany(
+            sql.replace("%s", "?"), [tuple(_a_parametro(v) for v in fila) for fila in filas]
+        )
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSQLite:
+    dialecto = DIALECTO_SQLITE
+
+    def __init__(self, ruta=":memory:"):
+        self._conexion = sqlite3.connect(
+            ruta, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+        )
+        self._conexion.create_function(
+            "NOW", 0, lambda: datetime.now().isoformat(sep=" ", timespec="seconds")
+        )
+
+    def cursor(self, dictionary=False, **kwargs):
+        return CursorSQLite(self._conexion.cursor(), dictionary)
+
+    def commit(self):
+        self._conexion.commit()
+
+    def rollback(self):
+        self._conexion.rollback()
+
+    def close(self):
+        self._conexion.close()
+
+    def is_connected(self):
+        try:
+            self._conexion.execute("SELECT 1")
+            return True
+        except sqlite3.ProgrammingError:
+            return False
+
+
+def _convertir_fecha(valor):
+    return date.fromisoformat(valor.decode()[:10])
+
+
+def _convertir_fecha_hora(valor):
+    return datetime.fromisoformat(valor.decode())
+
+
+def _convertir_decimal(valor):
+    return Decimal(valor.decode())
+
+
+sqlite3.register_converter("DATE", _convertir_fecha)
+sqlite3.register_converter("DATETIME", _convertir_fecha_hora)
+sqlite3.register_converter("DECIMAL", _convertir_decimal)
+
+
+def sembrar_esquema(conexion):
+    """
+    Crea (si no existen) las tablas e índices de ESQUEMA_SQLITE
+    """
+    cursor = conexion.cursor()
+    try:
+        for sentencia in ESQUEMA_SQLITE:
+            cursor.execute(sentencia)
+        conexion.commit()
+    finally:
+        cursor.close()
+
+
+def crear_conexion_sqlite(ruta=":memory:", sembrar=True):
+    """
+    Conexión SQLite compatible con el proceso, con el esquema ya creado si sembrar=True
+    """
+    conexion = ConexionSQLite(ruta)
+    if sembrar:
+        sembrar_esquema(conexion)
+    return conexion
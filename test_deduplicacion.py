@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Pruebas de deduplicación: re-subidas del mismo archivo (archivo_procesados), caché de
+parseo por contenido (cache_parseo) y SEQ_NUM ya existentes al insertar.
+
+    python -m pytest -q test_deduplicacion.py
+"""
+
+import logging
+import os
+
+import pandas as pd
+import pytest
+
+import cache_parseo
+from Main import insertar_liquidaciones
+from ReadFile import leer_archivo_normalizado
+from archivo_procesados import archivar_archivo, rechazar_si_duplicado
+from lectores import COLUMNAS_LIQUIDACION
+from sqlite_memoria import crear_conexion_sqlite
+
+logger = logging.getLogger("test_deduplicacion")
+logger.addHandler(logging.NullHandler())
+
+
+def _escribir_csv(ruta, seq_nums):
+    filas = [",".join(COLUMNAS_LIQUIDACION)]
+    for n, seq_num in enumerate(seq_nums):
+        valores = {columna: "" for columna in COLUMNAS_LIQUIDACION}
+        valores.update({
+            "FECHA_TRAN": "05/01/2024", "HORA_TRAN": "10:00:00", "MONTO_TRAN": f"{n + 1}.50",
+            "APROBAC": "012345", "SEQ_NUM": seq_num,
+        })
+        filas.append(",".join(valores[columna] for columna in COLUMNAS_LIQUIDACION))
+    ruta.write_text("\n".join(filas) + "\n")
+    return str(ruta)
+
+
+@pytest.fixture
+def indice(tmp_path):
+    return str(tmp_path / "archivo" / "indice.sqlite3")
+
+
+def test_resubida_del_mismo_contenido_se_rechaza(tmp_path, indice):
+    datos = tmp_path / "data"
+    datos.mkdir()
+    original = _escribir_csv(datos / "liquidacion.csv", ["000001", "000002"])
+    archivada = archivar_archivo(original, "run-1", directorio=str(tmp_path / "archivo"), ruta=indice)
+
+    assert os.path.isfile(archivada) and not os.path.exists(original)
+
+    resubida = _escribir_csv(datos / "liquidacion (1).csv", ["000001", "000002"])
+    entrada = rechazar_si_duplicado(resubida, ruta=indice)
+    assert entrada["ruta_archivo"] == archivada
+    assert not os.path.exists(resubida)
+
+
+def test_contenido_distinto_no_se_rechaza(tmp_path, indice):
+    datos = tmp_path / "data"
+    datos.mkdir()
+    archivar_archivo(
+        _escribir_csv(datos / "liquidacion.csv", ["000001"]), directorio=str(tmp_path / "archivo"), ruta=indice
+    )
+
+    otro = _escribir_csv(datos / "liquidacion.csv", ["000002"])
+    assert rechazar_si_duplicado(otro, ruta=indice) is None
+    assert os.path.exists(otro)
+
+
+def test_cache_de_parseo_por_contenido(tmp_path, monkeypatch):
+    if not cache_parseo.cache_disponible():
+        pytest.skip("caché de parseo deshabilitada o sin pyarrow")
+    monkeypatch.setattr(cache_parseo, "CACHE_DIR", str(tmp_path / "cache"))
+
+    primero = leer_archivo_normalizado(_escribir_csv(tmp_path / "a.csv", ["000777", "000778"]))
+    assert len(os.listdir(tmp_path / "cache")) == 1
+
+    # Mismo contenido con otro nombre: se carga de la caché con los mismos valores
+    segundo = leer_archivo_normalizado(_escribir_csv(tmp_path / "b.csv", ["000777", "000778"]))
+    assert len(os.listdir(tmp_path / "cache")) == 1
+    assert segundo["SEQ_NUM"].tolist() == ["000777", "000778"]
+    assert segundo["APROBAC"].tolist() == ["012345", "012345"]
+    pd.testing.assert_frame_equal(primero, segundo)
+
+    leer_archivo_normalizado(_escribir_csv(tmp_path / "c.csv", ["000779"]))
+    assert len(os.listdir(tmp_path / "cache")) == 2
+
+
+def test_insertar_omite_seq_num_existentes(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_parseo, "CACHE_HABILITADA", False)
+    df = leer_archivo_normalizado(_escribir_csv(tmp_path / "a.csv", ["000777", "777", "000777", "000900"]))
+    conn = crear_conexion_sqlite()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("INSERT INTO LiquidacionesSV (SEQ_NUM) VALUES (%s)", ("000777",))
+    conn.commit()
+
+    insertados, omitidos, errores, seq_nums = insertar_liquidaciones(df, cursor, conn, logger)
+
+    # "777" no es el mismo SEQ_NUM que "000777"; el repetido dentro del archivo también se omite
+    assert (insertados, omitidos, errores) == (2, 2, 0)
+    assert seq_nums == {"777", "000900"}
+    cursor.execute("SELECT SEQ_NUM FROM LiquidacionesSV ORDER BY id")
+    assert [fila["SEQ_NUM"] for fila in cursor.fetchall()] == ["000777", "777", "000900"]
+    conn.close()
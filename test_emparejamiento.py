@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Pruebas del emparejamiento por código de autorización sobre SQLite en memoria
+(sqlite_memoria): ventana de fechas, ceros a la izquierda del código y transacciones
+ya asignadas.
+
+    python -m pytest -q test_emparejamiento.py
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from BuscarTransaccion import emparejar_por_codigo_autorizacion
+from cache_transacciones import cache_transacciones
+from sqlite_memoria import crear_conexion_sqlite
+
+
+@pytest.fixture
+def conexion():
+    # La caché de transacciones es del proceso: cada prueba usa su propia base
+    cache_transacciones.limpiar()
+    conn = crear_conexion_sqlite()
+    yield conn
+    conn.close()
+    cache_transacciones.limpiar()
+
+
+def _liquidacion(cursor, seq_num, aprobac, qpay_transac_id=None):
+    cursor.execute(
+        "INSERT INTO LiquidacionesSV (SEQ_NUM, APROBAC, qpay_transac_id) VALUES (%s, %s, %s)",
+        (seq_num, aprobac, qpay_transac_id),
+    )
+
+
+def _transaccion(cursor, transaction_id, codigo, monto, creada):
+    cursor.execute(
+        "INSERT INTO transactions (transaction_id, autorizationCode, amount, business_id, status, created_at) "
+        "VALUES (%s, %s, %s, %s, 1, %s)",
+        (transaction_id, codigo, Decimal(monto), "B1", creada),
+    )
+
+
+def _fila(seq_num, aprobac, monto, fecha):
+    return {"seq_num": seq_num, "aprobac": aprobac, "monto": Decimal(monto), "fecha": fecha}
+
+
+def _emparejar(conexion, filas):
+    return emparejar_por_codigo_autorizacion(
+        conexion.cursor(dictionary=True), conexion, filas,
+        confianza_minima="baja", tolerancia_monto=Decimal("0.01"), tolerancia_dias=1,
+    )
+
+
+def test_empareja_dentro_de_la_ventana(conexion):
+    cursor = conexion.cursor(dictionary=True)
+    _liquidacion(cursor, "000001", "012345")
+    _transaccion(cursor, "T1", "012345", "10.00", datetime(2024, 1, 5, 10, 0))
+    # Mismo código y monto un año antes: fuera de la ventana, no vuelve ambigua la fila
+    _transaccion(cursor, "T_ANTIGUA", "012345", "10.00", datetime(2023, 1, 5, 10, 0))
+
+    resultado = _emparejar(conexion, [_fila("000001", "012345", "10.00", date(2024, 1, 5))])
+
+    trx, confianza = resultado["encontrados"]["000001"]
+    assert (trx["transaction_id"], confianza) == ("T1", "alta")
+    cursor.execute("SELECT qpay_transac_id, match_metodo FROM LiquidacionesSV WHERE SEQ_NUM = %s", ("000001",))
+    assert cursor.fetchone() == {"qpay_transac_id": "T1", "match_metodo": "autorizacion"}
+
+
+def test_transaccion_fuera_de_la_ventana_no_empareja(conexion):
+    cursor = conexion.cursor(dictionary=True)
+    _liquidacion(cursor, "000002", "777")
+    _transaccion(cursor, "T_ANTIGUA", "777", "20.00", datetime(2023, 3, 1, 9, 0))
+
+    resultado = _emparejar(conexion, [_fila("000002", "777", "20.00", date(2024, 1, 5))])
+
+    assert resultado["sin_match"] == ["000002"]
+    assert not resultado["encontrados"]
+
+
+def test_fila_sin_fecha_busca_sin_ventana(conexion):
+    cursor = conexion.cursor(dictionary=True)
+    _liquidacion(cursor, "000003", "888")
+    _transaccion(cursor, "T3", "888", "30.00", datetime(2023, 3, 1, 9, 0))
+
+    resultado = _emparejar(conexion, [_fila("000003", "888", "30.00", None)])
+
+    trx, confianza = resultado["encontrados"]["000003"]
+    assert (trx["transaction_id"], confianza) == ("T3", "media")
+
+
+def test_ceros_a_la_izquierda_distinguen_el_codigo(conexion):
+    cursor = conexion.cursor(dictionary=True)
+    _liquidacion(cursor, "000004", "012345")
+    _transaccion(cursor, "T4", "12345", "10.00", datetime(2024, 1, 5, 10, 0))
+
+    resultado = _emparejar(conexion, [_fila("000004", "012345", "10.00", date(2024, 1, 5))])
+
+    assert resultado["sin_match"] == ["000004"]
+
+
+def test_transaccion_ya_asignada_se_descarta(conexion):
+    cursor = conexion.cursor(dictionary=True)
+    _liquidacion(cursor, "000005", "555")
+    _liquidacion(cursor, "OTRA", "555", qpay_transac_id="T5")
+    _transaccion(cursor, "T5", "555", "50.00", datetime(2024, 1, 5, 10, 0))
+
+    resultado = _emparejar(conexion, [_fila("000005", "555", "50.00", date(2024, 1, 5))])
+
+    assert resultado["sin_match"] == ["000005"]
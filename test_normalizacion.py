@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la normalización del archivo: SEQ_NUM y APROBAC como texto (sin perder
+ceros a la izquierda) y la interpretación de FECHA_TRAN / HORA_TRAN.
+
+    python -m pytest -q test_normalizacion.py
+"""
+
+from datetime import time
+
+import pandas as pd
+
+from ReadFile import convertir_aprobac, convertir_seq_num, normalizar_dataframe
+from fecha_hora_transaccion import combinar_fecha_hora, interpretar_fechas
+
+
+def test_convertir_seq_num_conserva_ceros():
+    assert convertir_seq_num("000123") == "000123"
+    assert convertir_seq_num("000123.0") == "000123"
+    assert convertir_seq_num(" 000123.00 ") == "000123"
+    assert convertir_seq_num("ABC-1") == "ABC-1"
+
+
+def test_convertir_seq_num_numeros_y_nulos():
+    assert convertir_seq_num(123.0) == "123"
+    assert convertir_seq_num(123) == "123"
+    assert convertir_seq_num(None) is None
+    assert convertir_seq_num(float("nan")) is None
+
+
+def test_convertir_aprobac():
+    assert convertir_aprobac("012345") == "012345"
+    assert convertir_aprobac(" 012345 ") == "012345"
+    assert convertir_aprobac("12345.0") == "12345"
+    assert convertir_aprobac(12345.0) == "12345"
+    assert convertir_aprobac("A1B2") == "A1B2"
+    assert convertir_aprobac("  ") is None
+    assert convertir_aprobac(None) is None
+
+
+def test_normalizar_dataframe_seq_num_y_aprobac():
+    df = normalizar_dataframe(pd.DataFrame({
+        "SEQ_NUM": ["000777", 123.0, " "],
+        "APROBAC": [12345.0, "012345", "nan"],
+        "FECHA_TRAN": ["2024-01-05"] * 3,
+        "HORA_TRAN": ["10:00:00"] * 3,
+    }))
+    assert df["SEQ_NUM"].tolist() == ["000777", "123", None]
+    assert df["APROBAC"].tolist() == ["12345", "012345", None]
+    assert df["FECHA_HORA_TRAN"].tolist() == [pd.Timestamp("2024-01-05 10:00:00")] * 3
+
+
+def test_interpretar_fechas_formatos():
+    fechas = interpretar_fechas(pd.Series(
+        [20240105, 45296, "05/01/2024", "2024-01-05", "13/01/2024"], dtype=object
+    ))
+    assert fechas.tolist() == [
+        pd.Timestamp("2024-01-05"),  # AAAAMMDD numérico
+        pd.Timestamp("2024-01-05"),  # serial de Excel
+        pd.Timestamp("2024-01-05"),  # día primero
+        pd.Timestamp("2024-01-05"),  # ISO
+        pd.Timestamp("2024-01-13"),
+    ]
+
+
+def test_interpretar_fechas_invalidas():
+    fechas = interpretar_fechas(pd.Series(["1970-01-01", None, "basura", 20240230], dtype=object))
+    assert fechas.isna().all()
+
+
+def test_combinar_fecha_hora():
+    combinadas = combinar_fecha_hora(
+        pd.Series(["2024-01-05", "05/01/2024", 45296, None], dtype=object),
+        pd.Series(["14:30:15", 0.5, time(8, 1, 2), "10:00:00"], dtype=object),
+    )
+    assert combinadas.iloc[0] == pd.Timestamp("2024-01-05 14:30:15")
+    assert combinadas.iloc[1] == pd.Timestamp("2024-01-05 12:00:00")
+    assert combinadas.iloc[2] == pd.Timestamp("2024-01-05 08:01:02")
+    assert pd.isna(combinadas.iloc[3])
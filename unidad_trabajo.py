@@ -0,0 +1,155 @@
+"""
+Unidad de trabajo sobre una conexión MySQL con commits agrupados.
+
+Las etapas del proceso llaman a commit() al terminar cada fila o grupo, como antes,
+pero la unidad de trabajo solo confirma realmente en la base de datos cada
+SERFINSA_COMMIT_CADA_FILAS unidades o cada SERFINSA_COMMIT_CADA_SEGUNDOS segundos
+(lo que ocurra primero). Así se reduce el número de flush del redo log.
+
+savepoint() permite deshacer una fila o un grupo sin perder el resto del trabajo
+pendiente. Mientras haya un savepoint abierto no se confirma nada. Un deadlock o una
+espera de bloqueo agotada (es_error_de_bloqueo) no se puede deshacer con el savepoint:
+MySQL ya deshizo la transacción entera, incluido lo pendiente de la unidad.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Deadlock (1213) y espera de bloqueo agotada (1205). Con el deadlock MySQL deshace la
+# transacción completa; con la espera agotada puede hacerlo (innodb_rollback_on_timeout)
+# y repetir las sentencias una a una volvería a esperar el mismo bloqueo
+ERRORES_BLOQUEO = (1213, 1205)
+
+
+def es_error_de_bloqueo(error):
+    return getattr(error, "errno", None) in ERRORES_BLOQUEO
+
+
+class UnidadDeTrabajo:
+    def __init__(self, conn, commit_cada_filas=None, commit_cada_segundos=None, logger=None):
+        self.conn = conn
+        self.commit_cada_filas = int(
+            commit_cada_filas if commit_cada_filas is not None
+            else os.getenv("SERFINSA_COMMIT_CADA_FILAS", "500")
+        )
+        self.commit_cada_segundos = float(
+            commit_cada_segundos if commit_cada_segundos is not None
+            else os.getenv("SERFINSA_COMMIT_CADA_SEGUNDOS", "5")
+        )
+        self.logger = logger
+        self.pendientes = 0
+        self.commits_realizados = 0
+        self._ultimo_commit = time.monotonic()
+        self._profundidad = 0
+        self._contador_savepoints = 0
+
+    def __getattr__(self, nombre):
+        # Delegar el resto (cursor, is_connected, ...) en la conexión real
+        return getattr(self.conn, nombre)
+
+    def registrar(self, unidades=1):
+        """
+        Marca unidades de trabajo terminadas y confirma si se alcanzó el intervalo
+        """
+        self.pendientes += unidades
+        if self._profundidad == 0 and self._debe_confirmar():
+            self.confirmar()
+
+    def commit(self):
+        """
+        Compatibilidad con el código que llamaba a conn.commit(): cuenta una unidad
+        """
+        self.registrar(1)
+
+    def _debe_confirmar(self):
+        if self.pendientes <= 0:
+            return False
+        if self.commit_cada_filas and self.pendientes >= self.commit_cada_filas:
+            return True
+        return (time.monotonic() - self._ultimo_commit) >= self.commit_cada_segundos
+
+    def confirmar(self):
+        """
+        Confirma ya todo lo pendiente
+        """
+        if self._profundidad > 0:
+            raise RuntimeError("No se puede confirmar con un savepoint abierto")
+        self.conn.commit()
+        self.commits_realizados += 1
+        self.pendientes = 0
+        self._ultimo_commit = time.monotonic()
+
+    def rollback(self):
+        """
+        Descarta todo lo pendiente desde el último commit real
+        """
+        self.conn.rollback()
+        self.pendientes = 0
+        self._profundidad = 0
+
+    @contextmanager
+    def savepoint(self, nombre=None):
+        """
+        Ejecuta el bloque dentro de un SAVEPOINT. Si el bloque lanza una excepción se
+        deshace solo ese bloque (ROLLBACK TO SAVEPOINT) y la excepción se propaga.
+        """
+        self._contador_savepoints += 1
+        nombre = nombre or f"sp_{self._contador_savepoints}"
+        cursor = self.conn.cursor()
+        cursor.execute(f"SAVEPOINT {nombre}")
+        self._profundidad += 1
+        try:
+            yield self
+        except Exception as error:
+            if es_error_de_bloqueo(error):
+                # La transacción ya se deshizo y el savepoint con ella
+                raise
+            try:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {nombre}")
+                cursor.execute(f"RELEASE SAVEPOINT {nombre}")
+            except Exception as e:
+                # Un DDL dentro del bloque hace commit implícito y elimina el savepoint
+                self._log_warning(f"⚠️ No se pudo deshacer el savepoint {nombre}: {e}")
+            raise
+        else:
+            try:
+                cursor.execute(f"RELEASE SAVEPOINT {nombre}")
+            except Exception as e:
+                self._log_warning(f"⚠️ No se pudo liberar el savepoint {nombre}: {e}")
+        finally:
+            self._profundidad -= 1
+            cursor.close()
+
+        if self._profundidad == 0 and self._debe_confirmar():
+            self.confirmar()
+
+    def cerrar(self):
+        """
+        Confirma lo pendiente y cierra la conexión
+        """
+        if self.pendientes:
+            self.confirmar()
+        self.conn.close()
+
+    def close(self):
+        self.cerrar()
+
+    def _log_warning(self, mensaje):
+        if self.logger:
+            self.logger.warning(mensaje)
+        else:
+            print(mensaje)
+
+
+def como_unidad_de_trabajo(conn, logger=None):
+    """
+    Devuelve conn si ya es una unidad de trabajo, o una nueva que la envuelve
+    """
+    if isinstance(conn, UnidadDeTrabajo):
+        return conn
+    return UnidadDeTrabajo(conn, logger=logger)